@@ -1,5 +1,6 @@
 """Module containing management command for building machine learning models in DRP."""
-from DRP.models import PerformedReaction, ModelContainer, Descriptor, rxnDescriptorValues, DataSet
+from django.core.management.base import BaseCommand
+from DRP.models import PerformedReaction, ModelContainer, Descriptor, rxnDescriptorValues, DataSet, ModelBuildJob
 import operator
 import argparse
 from django.db.utils import OperationalError
@@ -28,7 +29,7 @@ class Command(BaseCommand):
         parser.add_argument('-r', '--response-headers', nargs='+', default=["boolean_crystallisation_outcome"],
                             help='The headings of one or more descriptors to predict. '
                             'Note that most models can only handle one response variable (default: %(default)s)')
-        parser.add_argument('-ml', '--model-library', default="weka",
+        parser.add_argument('-ml', '--model-library', default="weka", choices=settings.STATS_MODEL_LIBS,
                             help='Model visitor library to use. (default: %(default)s)')
         parser.add_argument('-mt', '--model-tool', default="SVM_PUK",
                             help='Model visitor tool from library to use. (default: %(default)s)')
@@ -48,6 +49,10 @@ class Command(BaseCommand):
                             help='A dictionary of the options to give to the splitter in JSON format')
         parser.add_argument('-vo', '--visitor-options', default=None,
                             help='A dictionary of the options to give to the visitor in JSON format')
+        parser.add_argument('-w', '--workers', default=None, type=int,
+                            help='The number of processes in which to train component models in parallel. (default: settings.MODEL_BUILD_WORKERS, or 1)')
+        parser.add_argument('-q', '--enqueue', action='store_true',
+                            help='Queue the build as a job for model_build_worker instead of building now.')
 
     def handle(self, *args, **kwargs):
         """Handle the call for this command."""
@@ -64,14 +69,20 @@ class Command(BaseCommand):
 
         verbose = (kwargs['verbosity'] > 0)
 
-        prepare_build_display_model(predictor_headers=predictor_headers, response_headers=response_headers,
-                                    modelVisitorLibrary=kwargs[
-                                        'model_library'], modelVisitorTool=kwargs['model_tool'],
-                                    splitter=kwargs['splitter'], training_set_name=kwargs['training_set_name'], test_set_name=kwargs['test_set_name'], reaction_set_name=kwargs['reaction_set_name'], description=kwargs['description'], verbose=verbose, container_id=kwargs['model_container_id'], splitterOptions=splitterOptions, visitorOptions=visitorOptions)
+        buildKwargs = dict(predictor_headers=predictor_headers, response_headers=response_headers,
+                           modelVisitorLibrary=kwargs[
+                               'model_library'], modelVisitorTool=kwargs['model_tool'],
+                           splitter=kwargs['splitter'], training_set_name=kwargs['training_set_name'], test_set_name=kwargs['test_set_name'], reaction_set_name=kwargs['reaction_set_name'], description=kwargs['description'], verbose=verbose, container_id=kwargs['model_container_id'], splitterOptions=splitterOptions, visitorOptions=visitorOptions, workers=kwargs['workers'])
+        if kwargs['enqueue']:
+            container = prepare_build_model(enqueue=True, **buildKwargs)
+            self.stdout.write('Queued build job {} for model container {}'.format(
+                container.buildJobs.latest('pk').pk, container.pk))
+        else:
+            prepare_build_display_model(**buildKwargs)
 
 
 def create_build_model(reactions=None, predictors=None, responses=None, modelVisitorLibrary=None, modelVisitorTool=None, splitter=None, trainingSet=None, testSet=None,
-                       description=None, verbose=False, splitterOptions=None, visitorOptions=None):
+                       description=None, verbose=False, splitterOptions=None, visitorOptions=None, workers=None, enqueue=False):
     """Build the model and puts it into the DB."""
     if trainingSet is not None:
         container = ModelContainer.create(modelVisitorLibrary, modelVisitorTool, predictors, responses, description=description, reactions=reactions,
@@ -84,14 +95,23 @@ def create_build_model(reactions=None, predictors=None, responses=None, modelVis
 
     container.full_clean()
     container.save()
-    return build_model(container, verbose=verbose)
+    return build_model(container, verbose=verbose, workers=workers, enqueue=enqueue)
+
 
+def build_model(container, verbose=False, workers=None, enqueue=False):
+    """
+    An additional function by GMN to build models. I don't really know what it's for- PA.
+
+    If enqueue is True, the container is saved and its build queued as a ModelBuildJob instead.
+    """
+    if enqueue:
+        container.save()
+        ModelBuildJob.objects.enqueue(container, workers=workers)
+        return container
 
-def build_model(container, verbose=False):
-    """An additional function by GMN to build models. I don't really know what it's for- PA."""
     for attempt in range(5):
         try:
-            container.build(verbose=verbose)
+            container.build(verbose=verbose, workers=workers)
             break
         except OperationalError as e:
             logger.warning(
@@ -171,8 +191,8 @@ def display_model_results(container, reactions=None, heading=""):
 
 
 def prepare_build_model(predictor_headers=None, response_headers=None, modelVisitorLibrary=None, modelVisitorTool=None, splitter=None, training_set_name=None,
-                        test_set_name=None, reaction_set_name=None, description=None, verbose=False, splitterOptions=None, visitorOptions=None, container_id=None):
-    """Build a model with the specified tools."""
+                        test_set_name=None, reaction_set_name=None, description=None, verbose=False, splitterOptions=None, visitorOptions=None, container_id=None, workers=None, enqueue=False):
+    """Build a model with the specified tools, or queue it to be built if enqueue is True."""
     if predictor_headers is not None:
         predictors = Descriptor.objects.filter(heading__in=predictor_headers)
         if predictors.count() < len(predictor_headers):
@@ -203,7 +223,7 @@ def prepare_build_model(predictor_headers=None, response_headers=None, modelVisi
         new_container = parent_container.create_duplicate(
             modelVisitorTool=modelVisitorTool, modelVisitorOptions=visitorOptions, description=description, predictors=predictors, responses=responses)
         new_container.full_clean()
-        container = build_model(new_container, verbose=verbose)
+        container = build_model(new_container, verbose=verbose, workers=workers, enqueue=enqueue)
     else:
         if training_set_name is None and reaction_set_name is None:
             assert(test_set_name is None)
@@ -224,16 +244,16 @@ def prepare_build_model(predictor_headers=None, response_headers=None, modelVisi
                                        modelVisitorLibrary=modelVisitorLibrary, modelVisitorTool=modelVisitorTool,
                                        splitter=splitter, trainingSet=trainingSet, testSet=testSet,
                                        description=description, verbose=verbose, splitterOptions=splitterOptions,
-                                       visitorOptions=visitorOptions)
+                                       visitorOptions=visitorOptions, workers=workers, enqueue=enqueue)
 
     return container
 
 
 def prepare_build_display_model(predictor_headers=None, response_headers=None, modelVisitorLibrary=None, modelVisitorTool=None, splitter=None, training_set_name=None, test_set_name=None,
-                                reaction_set_name=None, description=None, verbose=False, splitterOptions=None, visitorOptions=None, container_id=None):
+                                reaction_set_name=None, description=None, verbose=False, splitterOptions=None, visitorOptions=None, container_id=None, workers=None):
     """I'm not exactly clear on what this function by GMN is for- PA."""
     container = prepare_build_model(predictor_headers=predictor_headers, response_headers=response_headers, modelVisitorLibrary=modelVisitorLibrary, modelVisitorTool=modelVisitorTool,
                                     splitter=splitter, training_set_name=training_set_name, test_set_name=test_set_name, reaction_set_name=reaction_set_name, description=description,
-                                    verbose=verbose, splitterOptions=splitterOptions, visitorOptions=visitorOptions, container_id=container_id)
+                                    verbose=verbose, splitterOptions=splitterOptions, visitorOptions=visitorOptions, container_id=container_id, workers=workers)
 
     display_model_results(container)
@@ -1,10 +1,13 @@
 """Recalculate the descriptors for all compounds and reactions."""
 from django.core.management.base import BaseCommand
-from DRP.models import Reaction, Compound
+from DRP.models import Reaction, Compound, RxnDescriptorChange
+from DRP.plugins.rxndescriptors.dependencies import DependencyGraph
 from django import db
 from django.conf import settings
+from collections import defaultdict
 import logging
 import importlib
+import warnings
 from django.db import transaction
 
 molDescriptorPlugins = [importlib.import_module(plugin) for
@@ -30,6 +33,43 @@ def calculate_descriptors(queryset, descriptorPlugins, verbose=False, plugins=No
                 logger.info("Done with plugin: {}\n".format(plugin))
 
 
+def calculate_reaction_descriptors(reactions, verbose=False, whitelist=None, plugins=None):
+    """
+    Calculate reaction descriptors, recalculating only those affected by recorded changes.
+
+    Reactions with no recorded changes, or new ones, have all of their descriptors recalculated.
+    The changes are deleted once the descriptors have been calculated, unless they have been
+    recorded again in the meantime.
+    """
+    changes = RxnDescriptorChange.objects.filter(reaction__in=reactions)
+    recorded = []
+    sources = defaultdict(set)
+    for pk, reaction_id, source, count in changes.values_list('pk', 'reaction_id', 'source', 'recorded'):
+        recorded.append((pk, count))
+        sources[reaction_id].add(source)
+    groups = defaultdict(list)
+    for pk in reactions.values_list('pk', flat=True):
+        groups[frozenset(sources[pk])].append(pk)
+
+    graph = DependencyGraph(rxnDescriptorPlugins)
+    for groupSources, pks in groups.items():
+        group = Reaction.objects.filter(pk__in=pks)
+        for plugin in rxnDescriptorPlugins:
+            if plugins is None or plugin.__name__ in plugins:
+                pluginWhitelist = graph.whitelist(plugin, groupSources) if groupSources else None
+                if pluginWhitelist is None:
+                    pluginWhitelist = whitelist
+                elif whitelist is not None:
+                    pluginWhitelist &= set(whitelist)
+                if pluginWhitelist is not None and not pluginWhitelist:
+                    continue
+                if verbose:
+                    logger.info("Calculating {} descriptors for {} reactions with plugin: {}".format(
+                        'all' if pluginWhitelist is None else len(pluginWhitelist), len(pks), plugin))
+                plugin.calculate_many(group, verbose=verbose, whitelist=pluginWhitelist)
+    RxnDescriptorChange.objects.deleteCalculated(recorded)
+
+
 class Command(BaseCommand):
     """Recalculate the descriptors for all compounds and reactions."""
 
@@ -98,7 +138,7 @@ class Command(BaseCommand):
                     pk__gte=start).exclude(calculating=True)
                 logger.debug('Compounds count is {}'.format(compounds.count()))
                 if only_dirty:
-                    compounds = compounds.objects.filter(dirty=True)
+                    compounds = compounds.filter(dirty=True)
                 compounds = compounds[:limit]
                 # This hits our database again, but we have to because slices
                 # can't be updated and we need to call these specific reactions
@@ -114,6 +154,8 @@ class Command(BaseCommand):
                 except Exception as e:
                     compounds.update(calculating=False)
                     raise e
+                # so that only the affected reaction descriptors are recalculated.
+                RxnDescriptorChange.objects.recordCompounds(compounds, whitelist)
                 with transaction.atomic():
                     compounds = compounds.all()  # Refresh the queryset
                     compounds.filter(recalculate=False).update(
@@ -126,7 +168,7 @@ class Command(BaseCommand):
                     'pk').exclude(calculating=True)
                 reactions = reactions.exclude(compounds__dirty=True)
                 if only_dirty:
-                    reactions = reactions.objects.filter(dirty=True)
+                    reactions = reactions.filter(dirty=True)
                 if only_reactions:
                     reactions = reactions.filter(pk__gte=start)
                 if not include_invalid:
@@ -140,8 +182,8 @@ class Command(BaseCommand):
                 reactions.update(calculating=True)
             while reactions.count() > 1:
                 try:
-                    calculate_descriptors(reactions, rxnDescriptorPlugins,
-                                          verbose=verbose, whitelist=whitelist, plugins=plugins)
+                    calculate_reaction_descriptors(reactions, verbose=verbose,
+                                                   whitelist=whitelist, plugins=plugins)
                 except Exception as e:
                     reactions.update(calculating=False)
                     raise e
@@ -149,5 +191,6 @@ class Command(BaseCommand):
                     reactions = reactions.all()  # refresh the qs
                     reactions.filter(recalculate=False).update(
                         dirty=False, calculating=False)
+                    RxnDescriptorChange.objects.markOutstanding(reactions)
                     reactions = reactions.filter(recalculate=True)
                     reactions.update(recalculate=False)
@@ -0,0 +1,212 @@
+"""Calculate descriptors for compounds and reactions as they become dirty."""
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from DRP.models import Reaction, Compound, RxnDescriptorChange
+from DRP.management.commands.calculate_descriptors import calculate_descriptors, calculate_reaction_descriptors, molDescriptorPlugins
+from multiprocessing import Process
+import logging
+import signal
+import time
+import datetime
+
+logger = logging.getLogger('DRP.management')
+
+
+def supportsSkipLocked():
+    """Return True if the database can skip rows locked by other transactions when selecting for update."""
+    if connection.vendor == 'mysql':
+        return connection.mysql_version >= (8, 0, 1)
+    elif connection.vendor == 'postgresql':
+        return connection.pg_version >= 90500
+    return False
+
+
+def claim(queryset, batchSize):
+    """
+    Mark up to batchSize dirty objects in queryset as calculating, returning their primary keys.
+
+    The rows are locked while they are claimed, so parallel workers never claim the same object.
+    If the database supports it, rows locked by another worker are skipped; otherwise the claim
+    waits for the other worker to finish claiming, after which its rows are no longer candidates.
+    Objects whose calculation failed are skipped until their time to try again.
+    """
+    candidates = queryset.filter(dirty=True, calculating=False).filter(
+        Q(calculationRetry__isnull=True) | Q(calculationRetry__lte=timezone.now())).order_by('pk').values_list('pk', flat=True)
+    with transaction.atomic():
+        if supportsSkipLocked():
+            # Django can't yet express SKIP LOCKED, so it is added to the query by hand.
+            sql, params = candidates[:batchSize].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(sql + ' FOR UPDATE SKIP LOCKED', params)
+                pks = [row[0] for row in cursor.fetchall()]
+        else:
+            pks = list(candidates.select_for_update()[:batchSize])
+        queryset.model.objects.filter(pk__in=pks).update(calculating=True)
+    return pks
+
+
+def recordFailure(model, pk, retryDelay=60, maxRetryDelay=3600):
+    """
+    Record that calculating descriptors for an object failed, and release it.
+
+    It is not claimed again for retryDelay seconds, doubled for each failure since its last
+    success, up to maxRetryDelay.
+    """
+    failures = model.objects.filter(pk=pk).values_list('calculationFailures', flat=True).first() or 0
+    delay = min(retryDelay * 2 ** failures, maxRetryDelay)
+    model.objects.filter(pk=pk).update(calculating=False, calculationFailures=failures + 1,
+                                       calculationRetry=timezone.now() + datetime.timedelta(seconds=delay))
+    # the soil_* triggers clear dirty along with calculating, but the object still needs calculating.
+    model.objects.filter(pk=pk).update(dirty=True)
+
+
+def calculateClaimed(queryset, calculate):
+    """
+    Calculate descriptors for claimed objects and clear their flags, as calculate_descriptors does.
+
+    Objects changed while they were being calculated are calculated again.
+    """
+    while queryset.exists():
+        try:
+            calculate(queryset)
+        except Exception:
+            queryset.update(calculating=False)
+            raise
+        with transaction.atomic():
+            queryset = queryset.all()  # refresh the qs
+            queryset.filter(recalculate=False).update(
+                dirty=False, calculating=False, calculationFailures=0, calculationRetry=None)
+            if queryset.model is Reaction:
+                RxnDescriptorChange.objects.markOutstanding(queryset)
+            queryset = queryset.filter(recalculate=True)
+            queryset.update(recalculate=False)
+
+
+def calculateBatch(model, pks, calculate, retryDelay=60, maxRetryDelay=3600):
+    """
+    Calculate descriptors for a batch of claimed objects.
+
+    If the batch fails, its objects are calculated one at a time, so that only those which
+    fail themselves are recorded as failures and held back (see recordFailure).
+    """
+    try:
+        calculateClaimed(model.objects.filter(pk__in=pks), calculate)
+        return
+    except Exception:
+        if len(pks) == 1:
+            logger.exception("Descriptor calculation failed for {} {}".format(model.__name__, pks[0]))
+            recordFailure(model, pks[0], retryDelay, maxRetryDelay)
+            return
+        logger.exception("Descriptor calculation failed for a batch of {} {} objects; trying them one at a time".format(
+            len(pks), model.__name__))
+    for pk in pks:
+        model.objects.filter(pk=pk).update(calculating=True)
+        calculateBatch(model, [pk], calculate, retryDelay, maxRetryDelay)
+
+
+def work(batchSize=20, pollInterval=2, once=False, plugins=None, include_invalid=False, include_non_performed=False, verbose=False,
+         retryDelay=60, maxRetryDelay=3600):
+    """
+    Claim and calculate dirty compounds, then dirty reactions, until there are none left.
+
+    If once is False, wait pollInterval seconds and look again, until the process receives SIGTERM.
+    Objects whose calculation fails are tried again after retryDelay seconds, doubling for each
+    further failure up to maxRetryDelay, so that they don't hold back the objects after them.
+    """
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+    def calculateCompounds(compounds):
+        calculate_descriptors(compounds, molDescriptorPlugins, verbose=verbose, plugins=plugins)
+        RxnDescriptorChange.objects.recordCompounds(compounds)
+
+    def calculateReactions(reactions):
+        # the descriptor matrix cache is invalidated by the value writes themselves.
+        calculate_reaction_descriptors(reactions, verbose=verbose, plugins=plugins)
+
+    reactions = Reaction.objects.exclude(compounds__dirty=True)
+    if not include_invalid:
+        reactions = reactions.exclude(performedreaction__valid=False)
+    if not include_non_performed:
+        reactions = reactions.exclude(performedreaction=None)
+
+    while not stopping:
+        try:
+            pks = claim(Compound.objects.all(), batchSize)
+            if pks:
+                if verbose:
+                    logger.info("Calculating descriptors for {} compounds".format(len(pks)))
+                calculateBatch(Compound, pks, calculateCompounds, retryDelay, maxRetryDelay)
+                continue
+            pks = claim(reactions, batchSize)
+            if pks:
+                if verbose:
+                    logger.info("Calculating descriptors for {} reactions".format(len(pks)))
+                calculateBatch(Reaction, pks, calculateReactions, retryDelay, maxRetryDelay)
+                continue
+        except Exception:
+            logger.exception("Could not claim objects for descriptor calculation")
+        if once:
+            break
+        time.sleep(pollInterval)
+
+
+class Command(BaseCommand):
+    """Calculate descriptors for compounds and reactions as they become dirty."""
+
+    help = 'Run workers which calculate descriptors for dirty compounds and reactions as they appear.'
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('-n', '--processes', type=int, default=1,
+                            help='Number of worker processes to run.')
+        parser.add_argument('-b', '--batch-size', type=int, default=20,
+                            help='Number of objects each worker claims at a time.')
+        parser.add_argument('-i', '--poll-interval', type=float, default=2,
+                            help='Seconds to wait before looking for more dirty objects when there are none.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once there are no dirty objects left, rather than waiting for more.')
+        parser.add_argument('--retry-delay', type=float, default=60,
+                            help='Seconds to wait before trying an object whose calculation failed again, doubled for each further failure.')
+        parser.add_argument('--max-retry-delay', type=float, default=3600,
+                            help='The longest to wait before trying an object whose calculation failed again.')
+        parser.add_argument('-p', '--plugins', nargs='+',
+                            help='Plugins to use (default all).')
+        parser.add_argument('--include-invalid', action='store_true',
+                            help='Calculate descriptors for invalid reactions also.')
+        parser.add_argument('--include-non-performed', action='store_true',
+                            help='Calculate descriptors for non-performed reactions also.')
+
+    def handle(self, *args, **kwargs):
+        """Run the workers."""
+        workKwargs = {
+            'batchSize': kwargs['batch_size'],
+            'pollInterval': kwargs['poll_interval'],
+            'once': kwargs['once'],
+            'plugins': kwargs['plugins'],
+            'include_invalid': kwargs['include_invalid'],
+            'include_non_performed': kwargs['include_non_performed'],
+            'verbose': kwargs['verbosity'] > 0,
+            'retryDelay': kwargs['retry_delay'],
+            'maxRetryDelay': kwargs['max_retry_delay'],
+        }
+        if kwargs['processes'] == 1:
+            work(**workKwargs)
+            return
+
+        # each process must open a database connection of its own.
+        for conn in connections.all():
+            conn.close()
+        processes = [Process(target=work, kwargs=workKwargs) for i in range(kwargs['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
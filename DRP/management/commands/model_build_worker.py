@@ -0,0 +1,85 @@
+"""Run queued model build jobs."""
+from django.core.management.base import BaseCommand
+from django.db import connections
+from DRP.models import ModelBuildJob
+from multiprocessing import Process
+import logging
+import signal
+import time
+
+logger = logging.getLogger('DRP.management')
+
+
+def work(concurrency=None, pollInterval=5, once=False, verbose=False):
+    """
+    Claim and run queued build jobs, one at a time, until there are none left.
+
+    No more than concurrency jobs (default settings.MODEL_BUILD_CONCURRENCY) run at once across all
+    workers. If once is False, wait pollInterval seconds and look again, until the process receives SIGTERM.
+    """
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+    while not stopping:
+        try:
+            job = ModelBuildJob.objects.claim(concurrency)
+        except Exception:
+            logger.exception("Could not claim a build job")
+            time.sleep(pollInterval)
+            continue
+        if job is not None:
+            if verbose:
+                logger.info("Running build job {} of model container {}".format(job.pk, job.container_id))
+            try:
+                job.run(verbose=verbose)
+            except Exception:
+                # the job records its own failure.
+                logger.exception("Build job {} failed".format(job.pk))
+            continue
+        if once:
+            break
+        time.sleep(pollInterval)
+
+
+class Command(BaseCommand):
+    """Run queued model build jobs."""
+
+    help = 'Run workers which build the model containers of queued build jobs.'
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('-n', '--processes', type=int, default=1,
+                            help='Number of worker processes to run.')
+        parser.add_argument('-c', '--concurrency', type=int, default=None,
+                            help='Most jobs to run at once, across all workers. (default: settings.MODEL_BUILD_CONCURRENCY, or 1)')
+        parser.add_argument('-i', '--poll-interval', type=float, default=5,
+                            help='Seconds to wait before looking for more jobs when there are none.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once there are no queued jobs left, rather than waiting for more.')
+
+    def handle(self, *args, **kwargs):
+        """Run the workers."""
+        workKwargs = {
+            'concurrency': kwargs['concurrency'],
+            'pollInterval': kwargs['poll_interval'],
+            'once': kwargs['once'],
+            'verbose': kwargs['verbosity'] > 0,
+        }
+        if kwargs['processes'] == 1:
+            work(**workKwargs)
+            return
+
+        # each process must open a database connection of its own.
+        for conn in connections.all():
+            conn.close()
+        processes = [Process(target=work, kwargs=workKwargs) for i in range(kwargs['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
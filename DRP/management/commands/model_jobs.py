@@ -0,0 +1,40 @@
+"""List and cancel model build jobs."""
+from django.core.management.base import BaseCommand, CommandError
+from DRP.models import ModelBuildJob
+
+
+class Command(BaseCommand):
+    """List and cancel model build jobs."""
+
+    help = 'List model build jobs, or cancel some of them.'
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('-s', '--status', nargs='+', choices=[status for status, name in ModelBuildJob.STATUS_CHOICES],
+                            help='Only list jobs with these statuses. (default: all)')
+        parser.add_argument('--cancel', nargs='+', type=int, metavar='JOB_ID',
+                            help='Cancel the jobs with these ids. Running jobs stop once their current model is built.')
+
+    def handle(self, *args, **kwargs):
+        """List or cancel the jobs."""
+        if kwargs['cancel']:
+            jobs = ModelBuildJob.objects.in_bulk(kwargs['cancel'])
+            missing = set(kwargs['cancel']) - set(jobs)
+            if missing:
+                raise CommandError('No build jobs with ids {}'.format(sorted(missing)))
+            for job in jobs.values():
+                job.cancel()
+                if job.status == ModelBuildJob.CANCELLED:
+                    self.stdout.write('Cancelled job {}'.format(job.pk))
+                elif job.cancelRequested:
+                    self.stdout.write('Job {} will stop after its current model'.format(job.pk))
+                else:
+                    self.stdout.write('Job {} has already {}'.format(job.pk, job.status))
+            return
+
+        jobs = ModelBuildJob.objects.order_by('pk')
+        if kwargs['status']:
+            jobs = jobs.filter(status__in=kwargs['status'])
+        for job in jobs:
+            self.stdout.write('{id}\tcontainer {container}\t{status}\t{modelsBuilt}/{numModels} models\t'
+                              'expected finish {expectedFinish}'.format(**job.progress()))
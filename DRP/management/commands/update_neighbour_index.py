@@ -0,0 +1,38 @@
+"""Add newly performed reactions to the reaction nearest-neighbour index, or build it afresh."""
+from django.core.management.base import BaseCommand
+from DRP.models import PerformedReaction
+from DRP.recommendation.neighbourIndex import ReactionNeighbourIndex, defaultPath
+import os
+
+
+class Command(BaseCommand):
+    """Add newly performed reactions to the reaction nearest-neighbour index, or build it afresh."""
+
+    help = 'Add valid performed reactions not yet in the reaction nearest-neighbour index to it, building it if need be.'
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('--path', default=None,
+                            help='The index file. (default: settings.REACTION_NEIGHBOUR_INDEX_FILE)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Build the index afresh, fitting its metric to the reactions again.')
+        parser.add_argument('-d', '--descriptors', nargs='+', default=None,
+                            help='The csvHeaders of the descriptors to build a new index on. (default: all)')
+
+    def handle(self, *args, **kwargs):
+        """Update the index."""
+        verbose = (kwargs['verbosity'] > 0)
+        path = kwargs['path'] or defaultPath()
+        reactions = PerformedReaction.objects.filter(valid=True)
+        if kwargs['rebuild'] or not os.path.isfile(path):
+            index = ReactionNeighbourIndex.build(reactions, headers=kwargs['descriptors'])
+            added = len(index)
+        else:
+            index = ReactionNeighbourIndex.load(path)
+            new = reactions.exclude(pk__in=index.pks.tolist())
+            added = new.count()
+            if added:
+                index.add(new)
+        index.save(path)
+        if verbose:
+            self.stdout.write('Added {} reactions to the index of {} at {}'.format(added, len(index), path))
@@ -0,0 +1,43 @@
+"""Bring the hierarchical clustering of reactions up to date with the reaction nearest-neighbour index."""
+from django.core.management.base import BaseCommand
+from DRP.recommendation.neighbourIndex import ReactionNeighbourIndex
+from DRP.vis.hierarchy import ReactionHierarchy, METHODS, defaultPath
+import os
+
+
+class Command(BaseCommand):
+    """Bring the hierarchical clustering of reactions up to date with the reaction nearest-neighbour index."""
+
+    help = ('Insert reactions new to the reaction nearest-neighbour index into the hierarchical clustering of reactions, '
+            'clustering them afresh if need be, and optionally write the tree as json for the explore visualisation.')
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('--path', default=None,
+                            help='The hierarchy file. (default: settings.REACTION_HIERARCHY_FILE)')
+        parser.add_argument('--index', default=None,
+                            help='The neighbour index file. (default: settings.REACTION_NEIGHBOUR_INDEX_FILE)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Cluster every reaction afresh.')
+        parser.add_argument('-m', '--method', default='average', choices=METHODS,
+                            help='The linkage method used when clustering afresh. (default: average)')
+        parser.add_argument('--json', default=None,
+                            help='Write the tree to this json file.')
+        parser.add_argument('--depth', type=int, default=None,
+                            help='Leave clusters deeper than this in the json without children. (default: no limit)')
+
+    def handle(self, *args, **kwargs):
+        """Update the hierarchy."""
+        verbose = (kwargs['verbosity'] > 0)
+        path = kwargs['path'] or defaultPath()
+        index = ReactionNeighbourIndex.load(kwargs['index'])
+        if kwargs['rebuild'] or not os.path.isfile(path):
+            hierarchy = ReactionHierarchy.fromIndex(index, method=kwargs['method'])
+        else:
+            hierarchy = ReactionHierarchy.load(path)
+            hierarchy.update(index)
+        hierarchy.save(path)
+        if kwargs['json'] is not None:
+            hierarchy.writeJson(kwargs['json'], maxDepth=kwargs['depth'])
+        if verbose:
+            self.stdout.write('Saved the hierarchy of {} reactions at {}'.format(len(hierarchy), path))
@@ -0,0 +1,25 @@
+"""Bring the compound similarity index up to date."""
+from django.core.management.base import BaseCommand
+from DRP.models import CompoundSimilarity
+
+
+class Command(BaseCommand):
+    """Bring the compound similarity index up to date."""
+
+    help = ('Fingerprint new compounds and those whose SMILES have changed, '
+            'and find the most similar compounds of those affected.')
+
+    def add_arguments(self, parser):
+        """Add arguments for the parser."""
+        parser.add_argument('-k', '--neighbours', type=int, default=None,
+                            help='The number of most similar compounds to keep for each compound. '
+                                 '(default: settings.SIMILARITY_INDEX_SIZE, or 50)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Fingerprint every compound again.')
+
+    def handle(self, *args, **kwargs):
+        """Refresh the index."""
+        verbose = (kwargs['verbosity'] > 0)
+        updated = CompoundSimilarity.objects.refresh(k=kwargs['neighbours'], rebuild=kwargs['rebuild'], verbose=verbose)
+        if verbose:
+            self.stdout.write('Found the most similar compounds of {} compounds'.format(updated))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0045_auto_20160928_0849'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RxnDescriptorChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID',
+                                        serialize=False, auto_created=True, primary_key=True)),
+                ('source', models.CharField(max_length=255)),
+                ('reaction', models.ForeignKey(to='DRP.Reaction')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='rxndescriptorchange',
+            unique_together=set([('reaction', 'source')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import hashlib
+
+
+def fingerprintDataSets(apps, schema_editor):
+    DataSet = apps.get_model('DRP', 'DataSet')
+    DataSetRelation = apps.get_model('DRP', 'DataSetRelation')
+    for dataSet in DataSet.objects.all():
+        pks = DataSetRelation.objects.filter(dataSet=dataSet).order_by(
+            'reaction_id').values_list('reaction_id', flat=True)
+        dataSet.fingerprint = hashlib.sha1(','.join(str(pk) for pk in pks).encode()).hexdigest()
+        dataSet.save(update_fields=['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0046_rxndescriptorchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='fingerprint',
+            field=models.CharField(max_length=40, blank=True, default='', db_index=True),
+        ),
+        migrations.RunPython(fingerprintDataSets, migrations.RunPython.noop),
+    ]
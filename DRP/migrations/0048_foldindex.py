@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0047_dataset_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoldIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID',
+                                        serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('numFolds', models.PositiveIntegerField()),
+                ('seed', models.BigIntegerField()),
+                ('response', models.CharField(max_length=255, blank=True, default='')),
+                ('assignment', models.BinaryField()),
+                ('splitSets', models.TextField()),
+                ('reactionSet', models.ForeignKey(related_name='foldIndices', to='DRP.DataSet')),
+            ],
+        ),
+    ]
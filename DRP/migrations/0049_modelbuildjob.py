@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0048_foldindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelBuildJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID',
+                                        serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.CharField(max_length=10, default='queued', db_index=True, choices=[('queued', 'Queued'), (
+                    'running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed'), ('cancelled', 'Cancelled')])),
+                ('workers', models.PositiveIntegerField(null=True, blank=True)),
+                ('cancelRequested', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('modelsBuilt', models.PositiveIntegerField(default=0)),
+                ('numModels', models.PositiveIntegerField(default=0)),
+                ('expectedFinish', models.DateTimeField(null=True, blank=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('container', models.ForeignKey(related_name='buildJobs', to='DRP.ModelContainer')),
+            ],
+        ),
+    ]
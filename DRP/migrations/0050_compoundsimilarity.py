@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0049_modelbuildjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompoundFingerprint',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID',
+                                        serialize=False, auto_created=True, primary_key=True)),
+                ('smiles', models.TextField(blank=True, default='')),
+                ('numBits', models.PositiveIntegerField(default=2048)),
+                ('bits', models.BinaryField()),
+                ('valid', models.BooleanField(default=True)),
+                ('compound', models.OneToOneField(related_name='fingerprint', to='DRP.Compound')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CompoundSimilarity',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID',
+                                        serialize=False, auto_created=True, primary_key=True)),
+                ('rank', models.PositiveIntegerField()),
+                ('similarity', models.FloatField()),
+                ('compound', models.ForeignKey(related_name='similarities', to='DRP.Compound')),
+                ('similar', models.ForeignKey(related_name='+', to='DRP.Compound')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='compoundsimilarity',
+            unique_together=set([('compound', 'rank')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0050_compoundsimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rxndescriptorchange',
+            name='recorded',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
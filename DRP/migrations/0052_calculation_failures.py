@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0051_rxndescriptorchange_recorded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compound',
+            name='calculationFailures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='compound',
+            name='calculationRetry',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='calculationFailures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='calculationRetry',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
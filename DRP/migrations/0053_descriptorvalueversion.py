@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import DRP.models.descriptorValueVersions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0052_calculation_failures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DescriptorValueVersion',
+            fields=[
+                ('descriptor', models.OneToOneField(related_name='valueVersion', primary_key=True,
+                                                    serialize=False, to='DRP.Descriptor')),
+                ('version', models.CharField(default=DRP.models.descriptorValueVersions.newVersion, max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0053_descriptorvalueversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelbuildjob',
+            name='heartbeat',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='modelbuildjob',
+            name='lease',
+            field=models.CharField(max_length=32, blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import DRP.models.descriptorValueVersions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DRP', '0054_modelbuildjob_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionValueVersion',
+            fields=[
+                ('reaction', models.OneToOneField(related_name='valueVersion', primary_key=True,
+                                                  serialize=False, to='DRP.Reaction')),
+                ('version', models.BigIntegerField(default=DRP.models.descriptorValueVersions.newReactionVersion)),
+            ],
+        ),
+    ]
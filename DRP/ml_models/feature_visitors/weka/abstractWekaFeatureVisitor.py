@@ -2,6 +2,8 @@
 from django.conf import settings
 import uuid
 from DRP.ml_models.feature_visitors.abstractFeatureVisitor import AbstractFeatureVisitor, logger
+from DRP.ml_models import wekaServer
+from DRP.models.trainingDatasetCache import trainingDatasetCache
 from django.core.exceptions import ImproperlyConfigured
 import subprocess
 import os
@@ -33,8 +35,8 @@ class AbstractWekaFeatureVisitor(AbstractFeatureVisitor):
             raise NotImplementedError(
                 'Subclasses of AbstractWekaModelVisitor must define wekaCommand')
 
-    def _prepareArff(self, reactions, whitelistHeaders, verbose=False):
-        """Write an *.arff file using the provided queryset of reactions."""
+    def _prepareArff(self, reactions, headers, verbose=False):
+        """Write an *.arff file of the descriptors with headers for the provided queryset of reactions."""
         logger.debug("Preparing ARFF file...")
         filename = "featureSelection_{}_{}.arff".format(
             self.container.pk, uuid.uuid4())
@@ -43,11 +45,11 @@ class AbstractWekaFeatureVisitor(AbstractFeatureVisitor):
         while os.path.isfile(filepath):
             filename = "{}_{}.arff".format(self.container.pk, uuid.uuid4())
             filepath = os.path.join(settings.TMP_DIR, filename)
+        dataset = trainingDatasetCache.get(reactions, headers, verbose=verbose)[0]
         if verbose:
             logger.info("Writing arff to {}".format(filepath))
-        with open(filepath, "w") as f:
-            reactions.toArff(f, expanded=True,
-                             whitelistHeaders=whitelistHeaders)
+        with open(filepath, "wb") as f:
+            dataset.toArff(f, headers=headers)
         return filepath
 
     def _readWekaOutput(self, output):
@@ -68,7 +70,17 @@ class AbstractWekaFeatureVisitor(AbstractFeatureVisitor):
         return descriptors
 
     def _runWekaCommand(self, command, verbose=False):
-        """Set the CLASSPATH necessary to use Weka, then runs a shell `command`."""
+        """
+        Set the CLASSPATH necessary to use Weka, then runs a shell `command`, returning its output.
+
+        If settings.WEKA_SERVER is True the command is instead run by a long-lived weka
+        process (see DRP.ml_models.wekaServer).
+        """
+        if wekaServer.serverEnabled():
+            logger.debug("Running on weka server:\n{}".format(command))
+            if verbose:
+                logger.info("Running on weka server:\n{}".format(command))
+            return wekaServer.runCommand(command, self.WEKA_VERSION)
         if not settings.WEKA_PATH[self.WEKA_VERSION]:
             raise ImproperlyConfigured(
                 "'WEKA_PATH' is not set in settings.py!")
@@ -78,7 +90,7 @@ class AbstractWekaFeatureVisitor(AbstractFeatureVisitor):
         logger.debug("Running in Shell:\n{}".format(command))
         if verbose:
             logger.info("Running in Shell:\n{}".format(command))
-        output = subprocess.check_output(command, shell=True)
+        output = subprocess.check_output(command, shell=True).decode()
         return output
 
     def train(self, verbose=False):
@@ -86,17 +98,17 @@ class AbstractWekaFeatureVisitor(AbstractFeatureVisitor):
         descriptorHeaders = [d.csvHeader for d in chain(
             self.container.descriptors, self.container.outcomeDescriptors)]
         reactions = self.container.trainingSet.reactions.all()
+        headers = [h for h in reactions.expandedCsvHeaders()
+                   if h in descriptorHeaders]
 
         arff_file = self._prepareArff(
-            reactions, descriptorHeaders, verbose=verbose)
+            reactions, headers, verbose=verbose)
 
         results_file = "featureSelection_{}_{}.out".format(
             self.container.pk, uuid.uuid4())
         results_path = os.path.join(settings.TMP_DIR, results_file)
 
         # Currently, we support only one "response" variable.
-        headers = [h for h in reactions.expandedCsvHeaders()
-                   if h in descriptorHeaders]
         response_index = headers.index(
             list(self.container.outcomeDescriptors)[0].csvHeader) + 1
 
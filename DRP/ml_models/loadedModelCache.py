@@ -0,0 +1,69 @@
+"""
+An in-memory cache of model visitors with their trained models loaded.
+
+Each prediction from a ModelContainer previously made a new visitor for every component
+model, which then read the model back from its outputFile. Visitors kept here are reused
+until the outputFile changes (they are keyed by StatsModel pk and the file's modification
+time), and the least recently used are dropped once there are more than
+settings.LOADED_MODEL_CACHE_SIZE (default 32).
+
+Weka models are loaded by weka itself, so for those only the visitor is reused here. With
+settings.WEKA_SERVER, the weka servers keep their own cache of deserialized classifiers,
+keyed in the same way by the model file's path and modification time.
+"""
+from django.conf import settings
+from collections import OrderedDict
+import threading
+import os
+
+
+class LoadedModelCache(object):
+    """A size-bounded, least-recently-used mapping from statsModels to loaded visitors."""
+
+    def __init__(self, maxSize=None):
+        """Hold up to maxSize visitors (default settings.LOADED_MODEL_CACHE_SIZE, or 32)."""
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _maxSize(self):
+        if self.maxSize is not None:
+            return self.maxSize
+        return getattr(settings, 'LOADED_MODEL_CACHE_SIZE', 32)
+
+    def key(self, statsModel):
+        """Return the key for a statsModel: its pk and the modification time of its outputFile."""
+        fileName = statsModel.outputFile.name
+        mtime = os.path.getmtime(fileName) if fileName and os.path.isfile(fileName) else None
+        return (statsModel.pk, mtime)
+
+    def get(self, statsModel, load):
+        """Return the cached visitor for statsModel, calling load() to make and cache it if there is none."""
+        key = self.key(statsModel)
+        with self.lock:
+            if key in self.entries:
+                visitor = self.entries.pop(key)
+                self.entries[key] = visitor
+                return visitor
+        # loading can be slow, so it is done without holding the lock.
+        visitor = load()
+        with self.lock:
+            # drop any entries for older versions of the model.
+            for oldKey in [k for k in self.entries if k[0] == statsModel.pk]:
+                del self.entries[oldKey]
+            self.entries[key] = visitor
+            while len(self.entries) > self._maxSize():
+                self.entries.popitem(last=False)
+        return visitor
+
+    def clear(self):
+        """Drop every cached visitor."""
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        """Return the number of cached visitors."""
+        return len(self.entries)
+
+
+loadedModelCache = LoadedModelCache()
@@ -1,5 +1,8 @@
 """An abstract class to define the API for a model visitor."""
 from abc import ABCMeta, abstractmethod
+from DRP.models.descriptorDataset import DescriptorDataset, isDatasetFile
+from DRP.models.trainingDatasetCache import trainingDatasetCache
+import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,3 +38,42 @@ class AbstractModelVisitor(object):
         response where the ith prediction corresponds to the ith reaction.
         EG: {<NumRxnDescriptor> "outcome" }:[(<rxn1>, 1), (<rxn2>, 2), (<rxn3>, 1), (<rxn4>, 1)]}
         """
+
+    def load(self):
+        """
+        Load the trained model from the statsModel's outputFile, ready for repeated predictions.
+
+        Visitors kept in the loaded model cache are loaded once. Those whose models are read
+        by another program (such as weka) need not do anything.
+        """
+        pass
+
+    @abstractmethod
+    def scoreMatrix(self, data, headers):
+        """
+        Return a score for each row of a matrix of predictor values for reactions not in the database.
+
+        headers are the csvHeaders of the columns of data. Higher scores mean the model thinks a
+        better outcome more likely.
+        """
+
+    def _trainingDataset(self, headers, verbose=False):
+        """
+        Return a DescriptorDataset of the training set's values for the descriptors with headers.
+
+        The dataset is read from the statsModel's inputFile if that holds one with all of these
+        columns (as it does for the models of a duplicated container); otherwise it comes from
+        the training dataset cache, and the cached file becomes the new inputFile. The statsModel
+        is not saved here, as this may run in a worker process; the container saves it afterwards.
+        """
+        inputFile = self.statsModel.inputFile.name
+        if inputFile and isDatasetFile(inputFile) and os.path.isfile(inputFile):
+            dataset = DescriptorDataset.load(inputFile)
+            if set(headers) <= set(dataset.headers):
+                if verbose:
+                    logger.info("Using existing dataset file {}.".format(inputFile))
+                return dataset
+        reactions = self.statsModel.trainingSet.reactions.all()
+        dataset, path = trainingDatasetCache.get(reactions, headers, verbose=verbose)
+        self.statsModel.inputFile = path
+        return dataset
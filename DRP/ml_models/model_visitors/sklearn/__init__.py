@@ -0,0 +1,4 @@
+"""Library of scikit-learn model visitors."""
+from .visitors import SVM_PUK, KNN, NaiveBayes, J48, RandomForest
+
+tools = ("SVM_PUK", "KNN", "NaiveBayes", "J48", "RandomForest")
@@ -0,0 +1,189 @@
+"""Model visitors which train and predict in-process using scikit-learn."""
+from DRP.ml_models.model_visitors.abstractModelVisitor import AbstractModelVisitor
+from DRP.models import rxnDescriptors
+from DRP.models.descriptors import CategoricalDescriptorPermittedValue
+from abc import abstractmethod
+import numpy as np
+import warnings
+import logging
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
+
+logger = logging.getLogger(__name__)
+
+
+class AbstractSklearnModelVisitor(AbstractModelVisitor):
+    """
+    The abstract visitor class for scikit-learn estimators.
+
+    Unlike the weka visitors, no arff files are written for the data: training values are kept
+    as a DescriptorDataset in the statsModel's inputFile, and test values are read straight into
+    numpy arrays using ReactionQuerySet.toDescriptorMatrix. The fitted estimator is stored with
+    joblib in the statsModel's outputFile (in settings.MODEL_DIR).
+    """
+
+    maxResponseCount = 1
+
+    normalize = False
+    """If True, scale each predictor to the range [0, 1] before fitting, as weka does for SMO and IBk."""
+
+    supportsSampleWeight = True
+    """If False, the estimator's fit method does not accept sample weights, so BCR cannot be used."""
+
+    def __init__(self, BCR=False, *args, **kwargs):
+        """
+        Intialise the visitor.
+
+        BCR True will mean that the visitor optimises on BCR, by weighting each
+        training instance by the inverse of the frequency of its class.
+        """
+        self.BCR = BCR
+        self.stored = None
+        super(AbstractSklearnModelVisitor, self).__init__(*args, **kwargs)
+
+    @abstractmethod
+    def estimator(self):
+        """Return a new, unfitted, scikit-learn estimator."""
+
+    def _headers(self):
+        """Return a tuple of (predictor headers, response descriptor)."""
+        predictorHeaders = [d.csvHeader for d in self.statsModel.container.descriptors]
+        # Currently, we support only one "response" variable.
+        response = list(self.statsModel.container.outcomeDescriptors)[0]
+        if isinstance(response, rxnDescriptors.NumRxnDescriptor):
+            raise TypeError(
+                'Cannot train a classification algorithm to predict a numeric descriptor.')
+        return predictorHeaders, response
+
+    def _prepareArrays(self, reactions, predictorHeaders, response=None):
+        """
+        Return a tuple of (data, labels, pks) for the reactions.
+
+        Rows are in primary key order, as given by pks. labels is None if no response is given.
+        """
+        data, headers, pks = reactions.toDescriptorMatrix(
+            whitelistHeaders=predictorHeaders, missing=np.nan)
+        if list(headers) != list(predictorHeaders):
+            raise RuntimeError('Could not find values for the descriptors {}'.format(
+                set(predictorHeaders) - set(headers)))
+        labels = None
+        if response is not None:
+            labels = reactions.toDescriptorMatrix(
+                whitelistHeaders=[response.csvHeader], missing=np.nan)[0][:, 0]
+        return data, labels, pks
+
+    def _classWeights(self, labels):
+        """Return a weight for each label: the number of instances divided by the size of its class."""
+        classes, inverse = np.unique(labels, return_inverse=True)
+        counts = np.bincount(inverse)
+        return (len(labels) / counts.astype(np.float64))[inverse]
+
+    def _fit(self, estimator, data, labels):
+        """Fit the estimator, weighting each instance by the inverse of the frequency of its class if optimising on BCR."""
+        if self.BCR and self.supportsSampleWeight:
+            estimator.fit(data, labels, sample_weight=self._classWeights(labels))
+        else:
+            if self.BCR:
+                warnings.warn('{} does not support instance weights, so is not optimising on BCR'.format(
+                    type(self).__name__))
+            estimator.fit(data, labels)
+
+    def _decoder(self, response):
+        """Return a function converting encoded labels back into descriptor values."""
+        if isinstance(response, rxnDescriptors.BoolRxnDescriptor):
+            return lambda label: bool(label)
+        elif isinstance(response, rxnDescriptors.OrdRxnDescriptor):
+            return lambda label: int(label)
+        elif isinstance(response, rxnDescriptors.CatRxnDescriptor):
+            # toDescriptorMatrix encodes categories by their position amongst the
+            # permitted values ordered by primary key.
+            values = list(CategoricalDescriptorPermittedValue.objects.filter(
+                descriptor=response).order_by('pk').values_list('value', flat=True))
+            return lambda label: values[int(label)]
+        else:
+            raise TypeError(
+                "Response descriptor is of invalid type {}".format(type(response)))
+
+    def _transform(self, data, stored):
+        """Fill missing values with the training means and apply any scaling."""
+        data = np.where(np.isnan(data), stored['means'], data)
+        if self.normalize:
+            data = (data - stored['minimums']) / stored['ranges']
+        return data
+
+    def train(self, verbose=False):
+        """Fit the estimator to the training set and save it."""
+        predictorHeaders, response = self._headers()
+        dataset = self._trainingDataset(predictorHeaders + [response.csvHeader], verbose=verbose)
+        if not set(predictorHeaders) <= set(dataset.headers):
+            raise RuntimeError('Could not find values for the descriptors {}'.format(
+                set(predictorHeaders) - set(dataset.headers)))
+        data = dataset.matrix(predictorHeaders)
+        labels = dataset.matrix([response.csvHeader])[:, 0]
+        # as with weka, instances without a value for the response are not used.
+        known = ~np.isnan(labels)
+        data, labels = data[known], labels[known]
+
+        means = np.nanmean(data, axis=0) if len(data) else np.zeros(data.shape[1])
+        means[np.isnan(means)] = 0
+        stored = {'headers': predictorHeaders, 'means': means}
+        data = np.where(np.isnan(data), means, data)
+        if self.normalize:
+            minimums = data.min(axis=0) if len(data) else np.zeros(data.shape[1])
+            ranges = (data.max(axis=0) - minimums) if len(data) else np.ones(data.shape[1])
+            ranges[ranges == 0] = 1
+            stored['minimums'] = minimums
+            stored['ranges'] = ranges
+            data = (data - minimums) / ranges
+
+        estimator = self.estimator()
+        if verbose:
+            logger.info("Fitting {} to {} reactions".format(estimator, len(labels)))
+        self._fit(estimator, data, labels)
+        stored['estimator'] = estimator
+
+        joblib.dump(stored, self.statsModel.outputFile.name)
+        if verbose:
+            logger.info("Saved model to {}".format(self.statsModel.outputFile.name))
+
+    def load(self):
+        """Load the fitted estimator and its preprocessing values."""
+        self.stored = joblib.load(self.statsModel.outputFile.name)
+
+    def scoreMatrix(self, data, headers):
+        """
+        Return a score for each row of a matrix of predictor values, whose columns have the given headers.
+
+        The score is the estimated probability of the greatest label (the best outcome) where
+        the estimator gives probabilities, and the predicted label otherwise. Predictors missing
+        from headers are treated as missing values.
+        """
+        stored = self.stored if self.stored is not None else joblib.load(self.statsModel.outputFile.name)
+        columns = {header: j for j, header in enumerate(headers)}
+        matrix = np.full((len(data), len(stored['headers'])), np.nan)
+        for j, header in enumerate(stored['headers']):
+            if header in columns:
+                matrix[:, j] = data[:, columns[header]]
+        if not len(matrix):
+            return np.zeros(0)
+        estimator = stored['estimator']
+        matrix = self._transform(matrix, stored)
+        if hasattr(estimator, 'predict_proba'):
+            return estimator.predict_proba(matrix)[:, np.argmax(estimator.classes_)]
+        return estimator.predict(matrix).astype(np.float64)
+
+    def predict(self, reactions, verbose=False):
+        """Create the predictions for these reactions for the model."""
+        predictorHeaders, response = self._headers()
+        stored = self.stored if self.stored is not None else joblib.load(self.statsModel.outputFile.name)
+        data, _, pks = self._prepareArrays(reactions, stored['headers'])
+        if len(pks):
+            predicted = stored['estimator'].predict(self._transform(data, stored))
+        else:
+            predicted = []
+        decode = self._decoder(response)
+        rowLookup = {pk: i for i, pk in enumerate(pks.tolist())}
+        results = tuple((reaction, decode(predicted[rowLookup[reaction.pk]])) for reaction in reactions)
+        return {response: results}
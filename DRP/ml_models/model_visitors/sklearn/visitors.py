@@ -0,0 +1,99 @@
+"""scikit-learn's model visitor library, mirroring the weka tools of the same names."""
+from DRP.ml_models.model_visitors.sklearn.abstractSklearnModelVisitor import AbstractSklearnModelVisitor
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.ensemble import RandomForestClassifier
+import numpy as np
+
+
+class PukKernel(object):
+    """The Pearson VII function-based universal kernel, as used by weka's Puk kernel."""
+
+    def __init__(self, omega=1, sigma=1):
+        """Set the kernel parameters."""
+        self.omega = omega
+        self.sigma = sigma
+
+    def __call__(self, X, Y):
+        """Return the kernel matrix between the rows of X and the rows of Y."""
+        squaredDistances = (np.sum(X * X, axis=1)[:, np.newaxis] +
+                            np.sum(Y * Y, axis=1)[np.newaxis, :] - 2 * np.dot(X, Y.T))
+        distances = np.sqrt(np.maximum(squaredDistances, 0))
+        scale = 2 * np.sqrt(2 ** (1.0 / self.omega) - 1) / self.sigma
+        return 1 / (1 + (scale * distances) ** 2) ** self.omega
+
+
+class J48(AbstractSklearnModelVisitor):
+    """Entropy based decision tree, in place of weka's C4.5 implementation."""
+
+    def estimator(self):
+        """Return a decision tree with J48's minimum of two instances per leaf."""
+        return DecisionTreeClassifier(criterion='entropy', min_samples_leaf=2)
+
+
+class KNN(AbstractSklearnModelVisitor):
+    """K nearest neighbours classifier."""
+
+    normalize = True
+    supportsSampleWeight = False
+
+    def __init__(self, k=1, *args, **kwargs):
+        """Set the number of neighbours, which defaults to 1 as for weka's IBk."""
+        super(KNN, self).__init__(*args, **kwargs)
+        self.k = k
+
+    def estimator(self):
+        """Return a nearest neighbours classifier."""
+        return KNeighborsClassifier(n_neighbors=self.k)
+
+
+class NaiveBayes(AbstractSklearnModelVisitor):
+    """Gaussian naive Bayes predictor."""
+
+    def estimator(self):
+        """Return a gaussian naive bayes classifier."""
+        return GaussianNB()
+
+    def _fit(self, estimator, data, labels):
+        """
+        Fit the estimator, giving every class the same prior if optimising on BCR.
+
+        Weights which are constant within each class leave the class means and variances
+        unchanged and only even out the class priors, so this is the same as fitting with
+        inverse class frequency weights. GaussianNB.fit only takes sample_weight from
+        scikit-learn 0.16, so the priors are set directly instead.
+        """
+        estimator.fit(data, labels)
+        if self.BCR:
+            estimator.class_prior_ = np.full(len(estimator.classes_), 1.0 / len(estimator.classes_))
+
+
+class RandomForest(AbstractSklearnModelVisitor):
+    """Random forest classifier."""
+
+    def __init__(self, numTrees=10, *args, **kwargs):
+        """Set the number of trees, which defaults to 10 as for weka 3.6."""
+        super(RandomForest, self).__init__(*args, **kwargs)
+        self.numTrees = numTrees
+
+    def estimator(self):
+        """Return a random forest classifier."""
+        return RandomForestClassifier(n_estimators=self.numTrees, max_features='log2')
+
+
+class SVM_PUK(AbstractSklearnModelVisitor):
+    """PUK Kernel Support Vector Machine."""
+
+    normalize = True
+
+    def __init__(self, puk_omega=1, puk_sigma=1, *args, **kwargs):
+        """Additional setup specific to support vector machines."""
+        super(SVM_PUK, self).__init__(*args, **kwargs)
+        self.puk_omega = puk_omega
+        self.puk_sigma = puk_sigma
+
+    def estimator(self):
+        """Return a support vector classifier with weka's SMO defaults."""
+        return SVC(C=1.0, kernel=PukKernel(self.puk_omega, self.puk_sigma))
@@ -1,12 +1,15 @@
 """Model Visitor Concrete classes for use with DRP."""
 from django.conf import settings
 import uuid
-from DRP.models import rxnDescriptors
+from DRP.models import rxnDescriptors, Reaction
 from DRP.ml_models.model_visitors.abstractModelVisitor import AbstractModelVisitor, logger
+from DRP.ml_models import wekaServer
 from DRP.models.descriptors import BooleanDescriptor, NumericDescriptor, CategoricalDescriptor, OrdinalDescriptor
 from DRP.models.rxnDescriptorValues import BoolRxnDescriptorValue, OrdRxnDescriptorValue, BoolRxnDescriptorValue
+from DRP.models.descriptorDataset import DescriptorDataset
 from django.core.exceptions import ImproperlyConfigured
 import subprocess
+import numpy as np
 import os
 from abc import abstractmethod, abstractproperty
 import warnings
@@ -38,8 +41,8 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
             raise NotImplementedError(
                 'Subclasses of AbstractWekaModelVisitor must define wekaCommand')
 
-    def _prepareArff(self, reactions, whitelistHeaders, verbose=False):
-        """Write an *.arff file using the provided queryset of reactions."""
+    def _prepareArff(self, dataset, headers, verbose=False):
+        """Write an *.arff file of the columns of a DescriptorDataset with the given headers."""
         logger.debug("Preparing ARFF file...")
         filename = "{}_{}.arff".format(self.statsModel.pk, uuid.uuid4())
         filepath = os.path.join(settings.TMP_DIR, filename)
@@ -49,25 +52,44 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
             filepath = os.path.join(settings.TMP_DIR, filename)
         if verbose:
             logger.info("Writing arff to {}".format(filepath))
-        with open(filepath, "w") as f:
-            reactions.toArff(f, expanded=True,
-                             whitelistHeaders=whitelistHeaders)
+        with open(filepath, "wb") as f:
+            dataset.toArff(f, headers=headers)
         return filepath
 
+    def _headers(self, reactions):
+        """Return the headers of the model's descriptors, in the order of the arff columns."""
+        descriptorHeaders = [d.csvHeader for d in chain(
+            self.statsModel.container.descriptors, self.statsModel.container.outcomeDescriptors)]
+        return [h for h in reactions.expandedCsvHeaders() if h in descriptorHeaders]
+
+    def _readWekaOutput(self, output, typeConversionFunction):
+        """Read the text of a weka predictions output and outputs an ordered list of the predicted values in it."""
+        prediction_index = 2
+        # Discard the headers and ending line.
+        raw_lines = output.splitlines(True)[5:-1]
+        raw_predictions = [line.split()[prediction_index]
+                           for line in raw_lines]
+        predictions = [typeConversionFunction(
+            prediction) for prediction in raw_predictions]
+        return predictions
+
     def _readWekaOutputFile(self, filename, typeConversionFunction):
         """Read a *.out file called `filename` and outputs an ordered list of the predicted values in that file."""
-        prediction_index = 2
         with open(filename, "r") as f:
-            # Discard the headers and ending line.
-            raw_lines = f.readlines()[5:-1]
-            raw_predictions = [line.split()[prediction_index]
-                               for line in raw_lines]
-            predictions = [typeConversionFunction(
-                prediction) for prediction in raw_predictions]
-        return predictions
+            return self._readWekaOutput(f.read(), typeConversionFunction)
 
     def _runWekaCommand(self, command, verbose=False):
-        """Set the CLASSPATH necessary to use Weka, then runs a shell `command`."""
+        """
+        Set the CLASSPATH necessary to use Weka, then runs a shell `command`.
+
+        If settings.WEKA_SERVER is True the command is instead run by a long-lived weka
+        process (see DRP.ml_models.wekaServer) and its output, if not redirected, is returned.
+        """
+        if wekaServer.serverEnabled():
+            logger.debug("Running on weka server:\n{}".format(command))
+            if verbose:
+                logger.info("Running on weka server:\n{}".format(command))
+            return wekaServer.runCommand(command, self.WEKA_VERSION)
         if not settings.WEKA_PATH[self.WEKA_VERSION]:
             raise ImproperlyConfigured(
                 "'WEKA_PATH' is not set in settings.py!")
@@ -77,7 +99,7 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
         logger.debug("Running in Shell:\n{}".format(command))
         if verbose:
             logger.info("Running in Shell:\n{}".format(command))
-        subprocess.check_output(command, shell=True)
+        return subprocess.check_output(command, shell=True).decode()
 
     def BCR_cost_matrix(self, reactions, response):
         """
@@ -136,32 +158,26 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
     def train(self, verbose=False):
         """Train the weka model."""
         reactions = self.statsModel.trainingSet.reactions.all()
-        descriptorHeaders = [d.csvHeader for d in chain(
-            self.statsModel.container.descriptors, self.statsModel.container.outcomeDescriptors)]
+        headers = self._headers(reactions)
         filePath = self.statsModel.outputFile.name
-        if not self.statsModel.inputFile.name:
-            self.statsModel.inputFile = self._prepareArff(
-                reactions, descriptorHeaders, verbose)
-            self.statsModel.save(update_fields=['inputFile'])
-        elif not os.path.isfile(self.statsModel.inputFile.name):
-            if self.invalid:
-                raise RuntimeError(
-                    'Could not find statsModel arff file and model is invalid')
-            else:
-                raise warning.warn(
-                    'Could not find statsModel arff file, but model is valid, so recreating')
-                self.statsModel.inputFile.name = self._prepareArff(
-                    reactions, descriptorHeaders, verbose)
-                self.statsModel.save(update_fields=['inputFile'])
-        elif verbose:
-            logger.info("Using existing arff file.")
-
-        arff_file = self.statsModel.inputFile.name
+        inputFile = self.statsModel.inputFile.name
+        if inputFile.endswith('.arff') and os.path.isfile(inputFile):
+            # models built before the dataset format was introduced keep their arff files.
+            if verbose:
+                logger.info("Using existing arff file.")
+            arff_file = inputFile
+        else:
+            if inputFile and not os.path.isfile(inputFile):
+                if self.statsModel.invalid:
+                    raise RuntimeError(
+                        'Could not find statsModel input file and model is invalid')
+                warnings.warn(
+                    'Could not find statsModel input file, but model is valid, so recreating')
+            dataset = self._trainingDataset(headers, verbose=verbose)
+            arff_file = self._prepareArff(dataset, headers, verbose=verbose)
 
         # Currently, we support only one "response" variable.
         response = list(self.statsModel.container.outcomeDescriptors)[0]
-        headers = [h for h in reactions.expandedCsvHeaders()
-                   if h in descriptorHeaders]
         response_index = headers.index(response.csvHeader) + 1
 
         if self.BCR:
@@ -173,29 +189,28 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
                 self.wekaCommand, arff_file, filePath, response_index, self.wekaTrainOptions)
         self._runWekaCommand(command, verbose=verbose)
 
-    def predict(self, reactions, verbose=False):
-        """Create the predictions for these reactions for the model."""
-        descriptorHeaders = [d.csvHeader for d in chain(
-            self.statsModel.container.descriptors, self.statsModel.container.outcomeDescriptors)]
-
-        arff_file = self._prepareArff(
-            reactions, descriptorHeaders, verbose=verbose)
+    def _runPredictions(self, dataset, headers, verbose=False):
+        """Return a tuple of (response, predictions) of the model for the rows of a DescriptorDataset with the model's headers."""
+        arff_file = self._prepareArff(dataset, headers, verbose=verbose)
         model_file = self.statsModel.outputFile.name
 
-        results_file = "{}_{}.out".format(self.statsModel.pk, uuid.uuid4())
-        results_path = os.path.join(settings.TMP_DIR, results_file)
-
         # Currently, we support only one "response" variable.
-        headers = [h for h in reactions.expandedCsvHeaders()
-                   if h in descriptorHeaders]
         response = list(self.statsModel.container.outcomeDescriptors)[0]
         response_index = headers.index(response.csvHeader) + 1
 
-        command = "java {} -T {} -l {} -p 0 -c {} 1> {}".format(
-            self.wekaCommand, arff_file, model_file, response_index, results_path)
-        if verbose:
-            logger.info("Writing results to {}".format(results_path))
-        self._runWekaCommand(command, verbose=verbose)
+        command = "java {} -T {} -l {} -p 0 -c {}".format(
+            self.wekaCommand, arff_file, model_file, response_index)
+        if wekaServer.serverEnabled():
+            # the server hands the predictions straight back.
+            output = self._runWekaCommand(command, verbose=verbose)
+        else:
+            results_file = "{}_{}.out".format(self.statsModel.pk, uuid.uuid4())
+            results_path = os.path.join(settings.TMP_DIR, results_file)
+            if verbose:
+                logger.info("Writing results to {}".format(results_path))
+            self._runWekaCommand("{} 1> {}".format(command, results_path), verbose=verbose)
+            with open(results_path, "r") as f:
+                output = f.read()
 
         if isinstance(response, rxnDescriptors.BoolRxnDescriptor):
             typeConversionFunction = booleanConversion
@@ -208,10 +223,39 @@ class AbstractWekaModelVisitor(AbstractModelVisitor):
         else:
             raise TypeError(
                 "Response descriptor is of invalid type {}".format(type(response)))
-        results = tuple((reaction, result) for reaction, result in zip(
-            reactions, self._readWekaOutputFile(results_path, typeConversionFunction)))
+        return response, self._readWekaOutput(output, typeConversionFunction)
+
+    def predict(self, reactions, verbose=False):
+        """Create the predictions for these reactions for the model."""
+        headers = self._headers(reactions)
+        dataset = DescriptorDataset.fromReactions(reactions, headers)
+        response, predictions = self._runPredictions(dataset, headers, verbose=verbose)
+        # the arff rows are in primary key order.
+        reactionsByPk = {reaction.pk: reaction for reaction in reactions}
+        results = tuple((reactionsByPk[pk], result) for pk, result in zip(dataset.pks.tolist(), predictions))
         return {response: results}
 
+    def scoreMatrix(self, data, headers):
+        """
+        Return a score for each row of a matrix of predictor values, whose columns have the given headers.
+
+        The rows are written to an arff file and predicted by weka as for predict, and the score is
+        the predicted label. Predictors missing from headers are treated as missing values.
+        """
+        modelHeaders = self._headers(Reaction.objects.none())
+        columns = {header: j for j, header in enumerate(headers)}
+        matrix = np.full((len(data), len(modelHeaders)), np.nan)
+        for j, header in enumerate(modelHeaders):
+            if header in columns:
+                matrix[:, j] = data[:, columns[header]]
+        if not len(matrix):
+            return np.zeros(0)
+        dataset = DescriptorDataset.fromMatrix(matrix, modelHeaders, np.arange(len(matrix), dtype=np.int64))
+        response, predictions = self._runPredictions(dataset, modelHeaders)
+        if isinstance(response, rxnDescriptors.CatRxnDescriptor):
+            raise TypeError('Cannot score predictions of the categorical descriptor {}'.format(response.csvHeader))
+        return np.array(predictions, dtype=np.float64)
+
 
 def numConversion(s):
     """Convert string to float."""
@@ -23,8 +23,14 @@ class AbstractSplitter(object):
 
     def package(self, data):
         """Save the splits as datasets in the database."""
-        dataSet = DRP.models.DataSet.create('{}_{}'.format(
-            self.namingStub, self.namingCounter), data)
-        self.namingCounter += 1
+        return self.packageMany([[datum.pk for datum in data]])[0]
 
-        return dataSet
+    def packageMany(self, members):
+        """
+        Save each list of reaction pks in members as a dataset, all at once, returning the datasets.
+
+        A dataset which already holds exactly the same reactions is reused rather than created.
+        """
+        names = ['{}_{}'.format(self.namingStub, self.namingCounter + i) for i in range(len(members))]
+        self.namingCounter += len(members)
+        return DRP.models.DataSet.createMany(zip(names, members), reuse=True)
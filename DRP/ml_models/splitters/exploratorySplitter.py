@@ -1,8 +1,8 @@
 """A splitter to create training and test sets dependent upon apparently disctinct chemistry."""
 from .abstractSplitter import AbstractSplitter
-from DRP.models.compound import Compound
 from DRP.models import CatRxnDescriptor
-from django.db.models import Count
+from itertools import groupby
+from operator import itemgetter
 import random
 import logging
 logger = logging.getLogger(__name__)
@@ -26,12 +26,25 @@ class Splitter(AbstractSplitter):
     def split(self, reactions, verbose=False):
         """Actually perform the split."""
         super(Splitter, self).split(reactions, verbose=verbose)
-        key_counts = self._count_compound_sets(reactions).items()
-        splits = [self._single_split(
-            reactions, key_counts, verbose=verbose) for i in xrange(self.num_splits)]
-        return splits
+        compound_sets = self._group_compound_sets(reactions)
+        key_counts = [(key, len(pks)) for key, pks in compound_sets.items()]
 
-    def _single_split(self, reactions, key_counts, verbose=False):
+        members = []
+        for i in range(self.num_splits):
+            test_keys = set(self._test_keys(key_counts))
+            train = [pk for key, pks in compound_sets.items() if key not in test_keys for pk in pks]
+            test = [pk for key in test_keys for pk in compound_sets[key]]
+            if verbose:
+                logger.info("Split into train ({}), test ({})".format(
+                    len(train), len(test)))
+            members += [sorted(train), sorted(test)]
+
+        dataSets = self.packageMany(members)
+        return list(zip(dataSets[::2], dataSets[1::2]))
+
+    def _test_keys(self, key_counts):
+        """Choose the compound sets to be tested, such that they hold close to test_percent of the reactions."""
+        key_counts = list(key_counts)
         random.shuffle(key_counts)
 
         total_size = sum(count for key, count in key_counts)
@@ -57,24 +70,17 @@ class Splitter(AbstractSplitter):
             raise RuntimeError(
                 'Failed to make a split under the given parameters.')
 
-        rxnhash_descriptor = CatRxnDescriptor.objects.get(
-            heading='rxnSpaceHash1')
-        rxn_hashes = reactions.filter(
-            catrxndescriptorvalue__descriptor=rxnhash_descriptor)
-        test = rxn_hashes.filter(catrxndescriptorvalue__value__in=test_keys)
-        train = rxn_hashes.exclude(catrxndescriptorvalue__value__in=test_keys)
-
-        if verbose:
-            logger.info("Split into train ({}), test ({})".format(
-                train.count(), test.count()))
+        return test_keys
 
-        return (self.package(train), self.package(test))
+    def _group_compound_sets(self, reactions):
+        """
+        Return a dictionary of the pks of the reactions with each value of the reaction hash descriptor.
 
-    def _count_compound_sets(self, reactions):
+        The pairs of hash and reaction are read in one query, sorted by hash, and grouped here:
+        MySQL's GROUP_CONCAT would silently truncate the lists of the larger groups.
+        """
         rxnhash_descriptor = CatRxnDescriptor.objects.get(
             heading='rxnSpaceHash1')
-        rxn_hashes = reactions.filter(
-            catrxndescriptorvalue__descriptor=rxnhash_descriptor)
-        counts = {rxnhash_val: rxn_hashes.filter(catrxndescriptorvalue__value=rxnhash_val).count(
-        ) for rxnhash_val in rxn_hashes.values_list('catrxndescriptorvalue__value', flat=True).distinct()}
-        return counts
+        rows = reactions.filter(catrxndescriptorvalue__descriptor=rxnhash_descriptor).values_list(
+            'catrxndescriptorvalue__value', 'pk').order_by('catrxndescriptorvalue__value', 'pk')
+        return {key: [pk for key, pk in group] for key, group in groupby(rows, key=itemgetter(0))}
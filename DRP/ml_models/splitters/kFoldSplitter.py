@@ -8,28 +8,28 @@ logger = logging.getLogger(__name__)
 class Splitter(AbstractSplitter):
     """The splitter class for K-fold validation."""
 
-    def __init__(self, namingStub, num_folds=4):
-        """Standard splitter initialisation."""
+    def __init__(self, namingStub, num_folds=4, seed=None):
+        """Standard splitter initialisation. With a seed, the same reactions always give the same folds."""
         super(Splitter, self).__init__(namingStub)
         self.k = num_folds
+        self.seed = seed
 
     def split(self, reactions, verbose=False):
         """Perform the split."""
         super(Splitter, self).split(reactions, verbose=verbose)
         # Split the reactions' IDs into K randomly-organized buckets.
-        rxn_ids = [reaction.id for reaction in reactions]
-        random.shuffle(rxn_ids)
+        rxn_ids = list(reactions.order_by('pk').values_list('pk', flat=True))
+        random.Random(self.seed).shuffle(rxn_ids)
         buckets = [rxn_ids[i::self.k] for i in range(self.k)]
 
         if verbose:
             logger.info("Split into {} buckets with sizes: {}".format(
-                len(buckets), map(len, buckets)))
+                len(buckets), [len(b) for b in buckets]))
 
-        splits = []
+        members = []
         for i in range(self.k):
-            train = reactions.filter(id__in=[item for b in buckets[:i] + buckets[i + 1:]
-                                             for item in b])
-            test = reactions.filter(id__in=buckets[i])
-            splits.append((self.package(train), self.package(test)))
+            train = [item for b in buckets[:i] + buckets[i + 1:] for item in b]
+            members += [train, buckets[i]]
+        dataSets = self.packageMany(members)
 
-        return splits
+        return list(zip(dataSets[::2], dataSets[1::2]))
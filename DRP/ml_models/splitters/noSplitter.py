@@ -18,6 +18,6 @@ class Splitter(AbstractSplitter):
         if verbose:
             logger.info("Training set ({}) and no test set.".format(
                 reactions.count()))
-        splits = [(self.package(reactions), self.package([]))]
+        splits = [tuple(self.packageMany([reactions.values_list('pk', flat=True), []]))]
 
         return splits
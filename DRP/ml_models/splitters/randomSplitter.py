@@ -9,32 +9,35 @@ logger = logging.getLogger(__name__)
 class Splitter(AbstractSplitter):
     """The splitter visitor."""
 
-    def __init__(self, namingStub, test_percent=0.33, num_splits=1):
-        """Standard splitter initialisation."""
+    def __init__(self, namingStub, test_percent=0.33, num_splits=1, seed=None):
+        """Standard splitter initialisation. With a seed, the same reactions always give the same splits."""
         super(Splitter, self).__init__(namingStub)
         self.test_percent = test_percent
         self.num_splits = num_splits
+        self.random = random.Random(seed)
 
     def split(self, reactions, verbose=False):
         """Actually perform the split."""
         super(Splitter, self).split(reactions, verbose=verbose)
-        splits = [self._single_split(reactions, verbose)
-                  for i in xrange(self.num_splits)]
-        return splits
+        rxn_ids = list(reactions.order_by('pk').values_list('pk', flat=True))
+        members = []
+        for i in range(self.num_splits):
+            members += self._single_split(rxn_ids, verbose)
+        dataSets = self.packageMany(members)
+        return list(zip(dataSets[::2], dataSets[1::2]))
 
-    def _single_split(self, reactions, verbose=False):
-        num_rxns = reactions.count()
-        test_size = int(self.test_percent * num_rxns)
+    def _single_split(self, rxn_ids, verbose=False):
+        test_size = int(self.test_percent * len(rxn_ids))
 
         # Split the reactions' IDs into two randomly-organized buckets.
-        rxn_ids = [reaction.id for reaction in reactions]
-        random.shuffle(rxn_ids)
+        rxn_ids = list(rxn_ids)
+        self.random.shuffle(rxn_ids)
 
-        test = reactions.filter(id__in=rxn_ids[:test_size])
-        train = reactions.filter(id__in=rxn_ids[test_size:])
+        test = rxn_ids[:test_size]
+        train = rxn_ids[test_size:]
 
         if verbose:
             logger.info("Split into train ({}), test ({})".format(
-                train.count(), test.count()))
+                len(train), len(test)))
 
-        return (self.package(train), self.package(test))
+        return [train, test]
@@ -0,0 +1,88 @@
+"""Contains a class for performing seeded, stratified k-fold validation splits."""
+from .abstractSplitter import AbstractSplitter
+from DRP.models import FoldIndex, DataSet
+from DRP.models.dataSets import fingerprint
+from DRP.models.foldIndex import foldIndexKey
+from django.db import transaction, IntegrityError
+import numpy as np
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+
+def assignFolds(strata, numFolds, seed):
+    """
+    Return the fold of each item given its stratum, as an array.
+
+    The items are shuffled with the seed and dealt to the folds in turn, one stratum after another,
+    so each fold gets as near as possible the same number of items of each stratum.
+    """
+    rng = np.random.RandomState(seed)
+    order = np.lexsort((rng.permutation(len(strata)), strata))
+    folds = np.empty(len(strata), dtype=np.int16)
+    folds[order] = np.arange(len(strata)) % numFolds
+    return folds
+
+
+class Splitter(AbstractSplitter):
+    """
+    The splitter class for stratified K-fold validation.
+
+    The folds depend only on the reactions, the seed and the values of the response descriptor,
+    and are kept in a FoldIndex, so any later split with the same options reuses the same datasets.
+    """
+
+    def __init__(self, namingStub, num_folds=4, seed=0, response=None):
+        """Specify the number of folds, the seed and the csvHeader of the descriptor to stratify by (default none)."""
+        super(Splitter, self).__init__(namingStub)
+        self.k = num_folds
+        self.seed = seed
+        self.response = response
+
+    def split(self, reactions, verbose=False):
+        """Perform the split, or look up a previous identical one."""
+        super(Splitter, self).split(reactions, verbose=verbose)
+        if self.response is None:
+            pks = np.fromiter(reactions.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+            strata = np.zeros(len(pks), dtype=np.int64)
+        else:
+            matrix, headers, pks = reactions.toDescriptorMatrix(whitelistHeaders=[self.response])
+            if self.response not in headers:
+                raise ValueError('{} is not a reaction descriptor'.format(self.response))
+            pks = np.asarray(pks, dtype=np.int64)
+            # missing values make a stratum of their own.
+            values = np.where(np.isnan(matrix[:, 0]), np.inf, matrix[:, 0])
+            strata = np.unique(values, return_inverse=True)[1]
+
+        key = foldIndexKey(fingerprint(pks.tolist()), self.k, self.seed, self.response or '', strata)
+        foldIndex = FoldIndex.objects.filter(key=key).first()
+        if foldIndex is not None:
+            try:
+                splits = foldIndex.splits()
+            except DataSet.DoesNotExist:
+                logger.warning("Some datasets of fold index {} were deleted; splitting again".format(foldIndex.pk))
+                foldIndex.delete()
+            else:
+                if verbose:
+                    logger.info("Using the folds of fold index {}".format(foldIndex.pk))
+                return splits
+
+        folds = assignFolds(strata, self.k, self.seed)
+        if verbose:
+            logger.info("Split into {} folds with sizes: {}".format(
+                self.k, np.bincount(folds, minlength=self.k).tolist()))
+        members = [pks]
+        for i in range(self.k):
+            members += [pks[folds != i], pks[folds == i]]
+        dataSets = self.packageMany(members)
+        splits = list(zip(dataSets[1::2], dataSets[2::2]))
+
+        try:
+            with transaction.atomic():
+                FoldIndex.objects.create(key=key, reactionSet=dataSets[0], numFolds=self.k, seed=self.seed,
+                                         response=self.response or '', assignment=folds.tostring(),
+                                         splitSets=json.dumps([[train.pk, test.pk] for train, test in splits]))
+        except IntegrityError:
+            # another build made the same split at the same time; use its datasets.
+            return FoldIndex.objects.get(key=key).splits()
+        return splits
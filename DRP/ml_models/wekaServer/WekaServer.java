@@ -0,0 +1,182 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.OutputStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.io.Writer;
+import java.io.OutputStreamWriter;
+import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+
+import weka.attributeSelection.ASEvaluation;
+import weka.attributeSelection.AttributeSelection;
+import weka.classifiers.Classifier;
+import weka.classifiers.Evaluation;
+import weka.core.Instance;
+import weka.core.Instances;
+import weka.core.Utils;
+import weka.core.converters.ConverterUtils.DataSource;
+
+/**
+ * A long-lived weka process for the Dark Reactions Project.
+ *
+ * Jobs are read from stdin, one per line, as tab separated fields:
+ * the path to write the output to (empty to return it instead), the weka
+ * class to run, then the command line options for that class, exactly as
+ * they would be given to weka on the command line.
+ *
+ * For each job a header line "OK <length>" or "ERROR <length>" is written to
+ * stdout, followed by length bytes of UTF-8 text: the output of the job (if
+ * it was not written to a file) or the stack trace of the error.
+ *
+ * Predictions from a saved model (-l with -T and -p 0) do not go through
+ * weka's Evaluation, which would deserialize the model for every job.
+ * Instead the deserialized classifier is kept in memory, keyed by the
+ * path and modification time of the model file, and its predictions are
+ * written in the layout of weka's own -p 0 output.
+ */
+public class WekaServer {
+
+    /** The number of deserialized classifiers to keep in memory. */
+    private static final int MODEL_CACHE_SIZE = Integer.getInteger("drp.wekaServer.modelCacheSize", 8);
+
+    /** A deserialized classifier and the modification time of the file it was read from. */
+    private static class CachedModel {
+        final long modified;
+        final Classifier classifier;
+
+        CachedModel(long modified, Classifier classifier) {
+            this.modified = modified;
+            this.classifier = classifier;
+        }
+    }
+
+    /** Classifiers by model path, least recently used first. */
+    private static final Map<String, CachedModel> models = new LinkedHashMap<String, CachedModel>(16, 0.75f, true) {
+        @Override
+        protected boolean removeEldestEntry(Map.Entry<String, CachedModel> eldest) {
+            return size() > MODEL_CACHE_SIZE;
+        }
+    };
+
+    public static void main(String[] argv) throws IOException {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        // anything weka prints by itself goes to stderr, so it can't corrupt the replies.
+        System.setOut(System.err);
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] fields = line.split("\t", -1);
+            String status;
+            String result;
+            try {
+                result = run(fields[1], Arrays.copyOfRange(fields, 2, fields.length));
+                if (!fields[0].isEmpty()) {
+                    try (Writer file = new OutputStreamWriter(new FileOutputStream(fields[0]), StandardCharsets.UTF_8)) {
+                        file.write(result);
+                    }
+                    result = "";
+                }
+                status = "OK";
+            } catch (Throwable e) {
+                StringWriter trace = new StringWriter();
+                e.printStackTrace(new PrintWriter(trace));
+                result = trace.toString();
+                status = "ERROR";
+            }
+            byte[] bytes = result.getBytes(StandardCharsets.UTF_8);
+            out.write((status + " " + bytes.length + "\n").getBytes(StandardCharsets.UTF_8));
+            out.write(bytes);
+            out.flush();
+        }
+    }
+
+    /** Run an attribute evaluator or a classifier, returning what its main method would print. */
+    private static String run(String className, String[] options) throws Exception {
+        Class<?> cls = Class.forName(className);
+        if (ASEvaluation.class.isAssignableFrom(cls)) {
+            return AttributeSelection.SelectAttributes((ASEvaluation) cls.newInstance(), options);
+        }
+        List<String> optionList = Arrays.asList(options);
+        int p = optionList.indexOf("-p");
+        if (optionList.contains("-l") && optionList.contains("-T") && !optionList.contains("-t")
+                && p >= 0 && p + 1 < options.length && options[p + 1].equals("0")) {
+            return predict(Utils.getOption('l', options), Utils.getOption('T', options), Utils.getOption('c', options));
+        }
+        return Evaluation.evaluateModel(className, options);
+    }
+
+    /** Return the classifier saved in a model file, deserializing it only if it is not cached or has changed. */
+    private static Classifier loadModel(String path) throws Exception {
+        long modified = new File(path).lastModified();
+        CachedModel cached = models.get(path);
+        if (cached == null || cached.modified != modified) {
+            // the file may be followed by the training header, which is not needed here.
+            try (ObjectInputStream in = new ObjectInputStream(new BufferedInputStream(new FileInputStream(path)))) {
+                cached = new CachedModel(modified, (Classifier) in.readObject());
+            }
+            models.put(path, cached);
+        }
+        return cached.classifier;
+    }
+
+    /**
+     * Predict the instances of an arff file with a saved model, given the class index option (1-based,
+     * "first" or "last", defaulting to the last attribute), in the layout of weka's -p 0 output.
+     */
+    private static String predict(String modelPath, String testPath, String classIndex) throws Exception {
+        Classifier classifier = loadModel(modelPath);
+        Instances test = new DataSource(testPath).getDataSet();
+        if (classIndex.isEmpty() || classIndex.equals("last")) {
+            test.setClassIndex(test.numAttributes() - 1);
+        } else if (classIndex.equals("first")) {
+            test.setClassIndex(0);
+        } else {
+            test.setClassIndex(Integer.parseInt(classIndex) - 1);
+        }
+
+        StringBuilder text = new StringBuilder("\n\n=== Predictions on test data ===\n\n");
+        text.append(" inst#     actual  predicted error prediction\n");
+        boolean nominal = test.classAttribute().isNominal();
+        for (int i = 0; i < test.numInstances(); i++) {
+            Instance instance = test.instance(i);
+            String actual;
+            String predicted;
+            String error;
+            String prediction;
+            if (nominal) {
+                double[] distribution = classifier.distributionForInstance(instance);
+                int best = Utils.maxIndex(distribution);
+                actual = instance.classIsMissing() ? "?" : label(test, (int) instance.classValue());
+                predicted = label(test, best);
+                error = !instance.classIsMissing() && (int) instance.classValue() != best ? "+" : "";
+                prediction = Utils.doubleToString(distribution[best], 3);
+            } else {
+                double value = classifier.classifyInstance(instance);
+                actual = instance.classIsMissing() ? "?" : Utils.doubleToString(instance.classValue(), 3);
+                predicted = Utils.doubleToString(value, 3);
+                error = instance.classIsMissing() ? "?" : Utils.doubleToString(value - instance.classValue(), 3);
+                prediction = "";
+            }
+            text.append(String.format("%6d %10s %10s %5s %s\n", i + 1, actual, predicted, error, prediction));
+        }
+        return text.append("\n").toString();
+    }
+
+    /** Return a nominal class value as weka prints it, as its 1-based index and label. */
+    private static String label(Instances instances, int value) {
+        return (value + 1) + ":" + instances.classAttribute().value(value);
+    }
+}
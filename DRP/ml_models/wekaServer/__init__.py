@@ -0,0 +1,202 @@
+"""
+A pool of long-lived weka processes.
+
+Running weka from the shell pays for starting a JVM and loading weka's classes
+on every call, which dominates the time taken to train or predict on small sets
+of reactions. If settings.WEKA_SERVER is True, the weka visitors instead send
+their commands to WekaServer.java processes, which are started once per python
+process and then reused. Up to settings.WEKA_SERVER_WORKERS (default 2) of them
+are run at once for each weka version. Each server also keeps the classifiers it
+has used for predictions in memory, so a model is only deserialized again once
+its file changes.
+
+The server is compiled against settings.WEKA_PATH into settings.TMP_DIR the
+first time it is needed, so a JDK (javac) must be available.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import subprocess
+import threading
+import atexit
+import fcntl
+import queue
+import shlex
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'WekaServer.java')
+
+
+class WekaServerError(RuntimeError):
+    """Raised when weka fails to run a job, or a weka server dies."""
+
+    pass
+
+
+def serverEnabled():
+    """Return True if weka commands should be run on the weka server pool."""
+    return getattr(settings, 'WEKA_SERVER', False)
+
+
+def _compile(version):
+    """Compile the server for the given weka version if necessary, returning the directory holding it."""
+    if not settings.WEKA_PATH.get(version):
+        raise ImproperlyConfigured(
+            "'WEKA_PATH' is not set in settings.py!")
+    classDir = os.path.join(settings.TMP_DIR, 'weka_server', version)
+    classFile = os.path.join(classDir, 'WekaServer.class')
+    if not os.path.isdir(classDir):
+        os.makedirs(classDir, exist_ok=True)
+    with open(os.path.join(classDir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.isfile(classFile) or os.path.getmtime(classFile) < os.path.getmtime(SOURCE):
+            logger.info("Compiling weka server to {}".format(classDir))
+            subprocess.check_call(['javac', '-cp', settings.WEKA_PATH[version], '-d', classDir, SOURCE])
+    return classDir
+
+
+class WekaWorker(object):
+    """A single weka server process."""
+
+    def __init__(self, version):
+        """Start the server for the given weka version."""
+        classpath = os.pathsep.join((settings.WEKA_PATH[version], _compile(version)))
+        self.process = subprocess.Popen(
+            ['java', '-cp', classpath, 'WekaServer'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def alive(self):
+        """Return True if the server process is still running."""
+        return self.process.poll() is None
+
+    def run(self, className, options, outputPath=None):
+        """
+        Run the weka class with the given command line options.
+
+        If outputPath is given the output is written there, otherwise it is returned as a string.
+        """
+        line = '\t'.join([outputPath or '', className] + list(options))
+        if '\n' in line:
+            raise ValueError('Weka server jobs may not contain newlines')
+        try:
+            self.process.stdin.write((line + '\n').encode())
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().decode()
+            if not header:
+                raise WekaServerError('The weka server exited with code {}'.format(self.process.wait()))
+            status, length = header.split()
+            body = self.process.stdout.read(int(length)).decode()
+        except WekaServerError:
+            raise
+        except Exception:
+            # we can no longer be sure where we are in the conversation with this server.
+            self.close()
+            raise
+        if status != 'OK':
+            raise WekaServerError(body)
+        return body
+
+    def close(self):
+        """Stop the server."""
+        if self.alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class WekaWorkerPool(object):
+    """A pool of weka servers for one weka version, started as they are needed."""
+
+    def __init__(self, version, size):
+        """Create an empty pool which will hold at most size servers."""
+        self.version = version
+        self.size = size
+        self._idle = queue.Queue()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        """Return an idle server, starting one if there are none and the pool is not full."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._count < self.size
+            if start:
+                self._count += 1
+        if start:
+            try:
+                return WekaWorker(self.version)
+            except:
+                with self._lock:
+                    self._count -= 1
+                raise
+        return self._idle.get()
+
+    def run(self, className, options, outputPath=None):
+        """Run a job on the first free server. Arguments are as for WekaWorker.run."""
+        worker = self._acquire()
+        try:
+            return worker.run(className, options, outputPath)
+        finally:
+            if worker.alive():
+                self._idle.put(worker)
+            else:
+                with self._lock:
+                    self._count -= 1
+
+    def close(self):
+        """Stop all the idle servers in the pool."""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+            with self._lock:
+                self._count -= 1
+
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+
+def pool(version):
+    """Return the pool of servers for a weka version belonging to this process."""
+    # pools are keyed by process so that forked processes start servers of their own.
+    key = (os.getpid(), version)
+    with _poolsLock:
+        if key not in _pools:
+            _pools[key] = WekaWorkerPool(version, getattr(settings, 'WEKA_SERVER_WORKERS', 2))
+        return _pools[key]
+
+
+def runCommand(command, version):
+    """
+    Run a shell command line of the form used by the weka visitors on a pooled server.
+
+    The command should be 'java <class> <options>', optionally redirecting stdout to a file
+    with '1> <path>'. The output of the command is returned if it is not redirected.
+    """
+    tokens = shlex.split(command)
+    if not tokens or tokens[0] != 'java':
+        raise ValueError('Not a weka command: {}'.format(command))
+    outputPath = None
+    if '1>' in tokens:
+        i = tokens.index('1>')
+        outputPath = tokens[i + 1]
+        del tokens[i:i + 2]
+    return pool(version).run(tokens[1], tokens[2:], outputPath)
+
+
+@atexit.register
+def _closePools():
+    """Stop this process's servers when it exits."""
+    for (pid, version), workerPool in list(_pools.items()):
+        if pid == os.getpid():
+            workerPool.close()
@@ -5,7 +5,9 @@
 # Classes that should get included.
 
 from .dataSets import DataSet, DataSetRelation
+from .foldIndex import FoldIndex
 from .descriptors import Descriptor, CategoricalDescriptor, BooleanDescriptor, NumericDescriptor, OrdinalDescriptor, CategoricalDescriptorPermittedValue
+from .descriptorValueVersions import DescriptorValueVersion, ReactionValueVersion
 from .rxnDescriptors import CatRxnDescriptor, OrdRxnDescriptor, BoolRxnDescriptor, NumRxnDescriptor
 from .predRxnDescriptors import PredCatRxnDescriptor, PredOrdRxnDescriptor, PredBoolRxnDescriptor, PredNumRxnDescriptor
 from .molDescriptors import CatMolDescriptor, BoolMolDescriptor, NumMolDescriptor, OrdMolDescriptor
@@ -18,11 +20,14 @@ from .reaction import Reaction
 from .performedReaction import PerformedReaction
 from .compound import Compound, CompoundGuideEntry
 from .compoundQuantity import CompoundQuantity
+from .compoundSimilarity import CompoundFingerprint, CompoundSimilarity
+from .rxnDescriptorChange import RxnDescriptorChange
 from .recommendedReaction import RecommendedReaction
 from .statsModel import StatsModel
 from .chemicalClass import ChemicalClass
 from .confirmationCode import ConfirmationCode
 from .compoundRole import CompoundRole
 from .modelContainer import ModelContainer
+from .modelBuildJob import ModelBuildJob
 from .metricContainer import MetricContainer
 from .featureSelectionContainer import FeatureSelectionContainer
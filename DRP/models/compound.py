@@ -213,6 +213,9 @@ class Compound(models.Model):
     dirty = models.BooleanField(default=True)
     calculating = models.BooleanField(default=False)
     recalculate = models.BooleanField(default=False)
+    # failed calculations by the descriptor worker since the last success, and when to try again
+    calculationFailures = models.PositiveIntegerField(default=0)
+    calculationRetry = models.DateTimeField(null=True, blank=True)
 
     formula = models.CharField(
         max_length=500,
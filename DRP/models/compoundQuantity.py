@@ -6,6 +6,7 @@ from .compound import Compound
 from .compoundRole import CompoundRole
 from .reaction import Reaction
 from .performedReaction import PerformedReaction
+from .rxnDescriptorChange import RxnDescriptorChange, quantitySource
 from .validators import GreaterThanValidator
 
 
@@ -21,7 +22,9 @@ class CompoundQuantityQuerySet(models.query.QuerySet):
                 reaction.performedreaction.save()
             except PerformedReaction.DoesNotExist:
                 pass  # we don't care about this outcome
-        super(CompdoundQuantityQuerySet, self).delete()
+        RxnDescriptorChange.objects.record((reaction_id, quantitySource(label))
+                                           for reaction_id, label in self.values_list('reaction_id', 'role__label'))
+        super(CompoundQuantityQuerySet, self).delete()
 
 
 class CompoundQuantityManager(models.Manager):
@@ -52,7 +55,13 @@ class CompoundQuantity(models.Model):
 
     def save(self, invalidate_models=True, *args, **kwargs):
         """Re-save associated reactions dependent upon this quantity as this will cause descriptor values to change."""
+        # the descriptors for the role the quantity had before also change.
+        changed = set(CompoundQuantity.objects.filter(pk=self.pk).values_list(
+            'reaction_id', 'role__label')) if self.pk is not None else set()
         super(CompoundQuantity, self).save(*args, **kwargs)
+        changed.add((self.reaction_id, self.role.label))
+        RxnDescriptorChange.objects.record((reaction_id, quantitySource(label))
+                                           for reaction_id, label in changed)
         try:
             self.reaction.performedreaction.save(
                 invalidate_models=invalidate_models)  # invalidate models
@@ -66,6 +75,8 @@ class CompoundQuantity(models.Model):
             self.reaction.performedreaction.save()  # invalidate models
         except PerformedReaction.DoesNotExist:
             self.reaction.save()  # descriptor recalculation
+        RxnDescriptorChange.objects.record(
+            [(self.reaction_id, quantitySource(self.role.label))])
         super(CompoundQuantity, self).save()
 
     def __str__(self):
@@ -0,0 +1,213 @@
+"""
+The compound similarity index: a fingerprint for every compound and its most similar compounds.
+
+The recommender previously compared compounds with RDKit pairwise, as it needed them, and kept
+the similarities in an unbounded dictionary. Here the topological fingerprint of each compound is
+stored as an array of packed bits, and the Tanimoto similarities of many compounds at once are
+found by counting the bits of the bitwise ands of blocks of uint64 words. The settings.SIMILARITY_INDEX_SIZE
+(default 50) most similar compounds of each compound are stored, so finding the substitutes of
+a compound is a read of those rows.
+
+The index is brought up to date by refresh (run by the update_similarity_index command), which
+fingerprints only the compounds which are new or whose SMILES have changed, and finds anew the
+neighbours of only those compounds and of the compounds they may now be among the neighbours of.
+"""
+from django.db import models, transaction
+from django.conf import settings
+from .compound import Compound
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 2048
+"""The length of the fingerprints, that of the RDKit FingerprintMol the recommender used."""
+
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def rdkitFingerprint(smiles, numBits=FINGERPRINT_BITS):
+    """
+    Return the on bits of the RDKit topological fingerprint of a SMILES string, or None if it cannot be read.
+
+    With these options, this is the fingerprint made by rdkit.Chem.Fingerprints.FingerprintMols.FingerprintMol.
+    """
+    from rdkit import Chem
+    mol = Chem.MolFromSmiles(str(smiles)) if smiles else None
+    if mol is None:
+        return None
+    return list(Chem.RDKFingerprint(mol, minPath=1, maxPath=7, fpSize=numBits).GetOnBits())
+
+
+def packBits(onBits, numBits=FINGERPRINT_BITS):
+    """Return a fingerprint given by the indices of its on bits as an array of little-endian uint64 words."""
+    words = np.zeros((numBits + 63) // 64, dtype='<u8')
+    onBits = np.asarray(onBits, dtype=np.int64)
+    np.bitwise_or.at(words, onBits // 64, np.left_shift(np.uint64(1), (onBits % 64).astype(np.uint64)))
+    return words
+
+
+def popcount(words):
+    """Return the number of set bits along the last axis of an array of uint64 words."""
+    words = np.ascontiguousarray(words, dtype='<u8')
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _BYTE_COUNTS[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def tanimoto(a, b, blockWords=1 << 22):
+    """
+    Return the matrix of Tanimoto similarities of the rows of two arrays of packed fingerprints.
+
+    The rows of a are compared with all of b a block at a time, with at most about blockWords
+    words in each block. Two empty fingerprints have a similarity of 0.
+    """
+    countsA = popcount(a)
+    countsB = popcount(b)
+    similarities = np.zeros((len(a), len(b)))
+    blockRows = max(1, blockWords // max(1, b.size))
+    for start in range(0, len(a), blockRows):
+        stop = start + blockRows
+        intersection = popcount(a[start:stop, np.newaxis, :] & b[np.newaxis, :, :])
+        union = countsA[start:stop, np.newaxis] + countsB[np.newaxis, :] - intersection
+        similarities[start:stop] = np.where(union > 0, intersection / np.maximum(union, 1).astype(np.float64), 0.0)
+    return similarities
+
+
+def nearest(similarities, rowPks, columnPks, k):
+    """
+    Return arrays of (indices, similarities) of the k most similar columns to each row, leaving out the row itself.
+
+    Ties are broken by primary key, so the neighbours do not depend on the order of the columns.
+    """
+    similarities = np.where(rowPks[:, np.newaxis] == columnPks[np.newaxis, :], -np.inf, similarities)
+    order = np.lexsort((np.tile(columnPks, (len(similarities), 1)), -similarities), axis=-1)
+    k = min(k, max(len(columnPks) - 1, 0))
+    indices = order[:, :k]
+    return indices, similarities[np.arange(len(indices))[:, np.newaxis], indices]
+
+
+class CompoundFingerprint(models.Model):
+    """The packed fingerprint of a compound, and the SMILES it was made from."""
+
+    class Meta:
+        app_label = "DRP"
+
+    compound = models.OneToOneField(Compound, related_name='fingerprint')
+    smiles = models.TextField(blank=True, default='')
+    numBits = models.PositiveIntegerField(default=FINGERPRINT_BITS)
+    # little-endian uint64 words; all zero if the SMILES could not be read.
+    bits = models.BinaryField()
+    valid = models.BooleanField(default=True)
+
+    @property
+    def words(self):
+        """The fingerprint as an array of uint64 words."""
+        return np.frombuffer(bytes(self.bits), dtype='<u8')
+
+
+class CompoundSimilarityManager(models.Manager):
+    """A manager for keeping and reading the compound similarity index."""
+
+    def similarityMap(self, compoundPks, k=None, minimum=0.0):
+        """
+        Return a dictionary from each compound pk to a list of (pk, similarity) pairs of its k most similar compounds.
+
+        The pairs are in descending order of similarity, and only those with a similarity above minimum are given.
+        All of the compounds are read in a single query.
+        """
+        result = {pk: [] for pk in compoundPks}
+        neighbours = self.filter(compound__in=list(result), similarity__gt=minimum)
+        if k is not None:
+            neighbours = neighbours.filter(rank__lt=k)
+        for compound_id, similar_id, similarity in neighbours.order_by('compound', 'rank').values_list(
+                'compound_id', 'similar_id', 'similarity'):
+            result[compound_id].append((similar_id, similarity))
+        return result
+
+    def refresh(self, k=None, fingerprinter=rdkitFingerprint, rebuild=False, verbose=False):
+        """
+        Bring the index up to date with the compounds, keeping the k most similar compounds of each.
+
+        k defaults to settings.SIMILARITY_INDEX_SIZE, or 50. Compounds are fingerprinted with
+        fingerprinter, which is given a SMILES string and returns the indices of the on bits, or
+        None if it cannot. If rebuild is True, every compound is fingerprinted again.
+        Return the number of compounds whose neighbours were found anew.
+        """
+        if k is None:
+            k = getattr(settings, 'SIMILARITY_INDEX_SIZE', 50)
+        current = dict(Compound.objects.values_list('pk', 'smiles'))
+        stored = dict(CompoundFingerprint.objects.values_list('compound_id', 'smiles'))
+        changed = sorted(pk for pk, smiles in current.items() if rebuild or pk not in stored or stored[pk] != smiles)
+        if verbose:
+            logger.info("Fingerprinting {} new or changed compounds of {}".format(len(changed), len(current)))
+
+        fingerprints = []
+        for pk in changed:
+            onBits = fingerprinter(current[pk])
+            fingerprints.append(CompoundFingerprint(
+                compound_id=pk, smiles=current[pk], numBits=FINGERPRINT_BITS,
+                bits=packBits(onBits or [], FINGERPRINT_BITS).tostring(), valid=onBits is not None))
+
+        with transaction.atomic():
+            CompoundFingerprint.objects.filter(compound__in=changed).delete()
+            CompoundFingerprint.objects.bulk_create(fingerprints)
+
+            pks = []
+            blocks = []
+            for compound_id, bits in CompoundFingerprint.objects.order_by('compound').values_list('compound_id', 'bits'):
+                pks.append(compound_id)
+                blocks.append(bytes(bits))
+            pks = np.array(pks, dtype=np.int64)
+            words = np.frombuffer(b''.join(blocks), dtype='<u8').reshape(len(pks), -1) if len(pks) else \
+                np.zeros((0, (FINGERPRINT_BITS + 63) // 64), dtype='<u8')
+            expected = min(k, max(len(pks) - 1, 0))
+
+            # compounds whose lists may be out of date, besides the changed ones: those with too few
+            # neighbours (as after compounds are added or deleted) and those with a changed neighbour.
+            changedPks = np.array(changed, dtype=np.int64)
+            counts = dict(self.values('compound').annotate(n=models.Count('pk')).values_list('compound', 'n'))
+            stale = set(changed)
+            stale.update(pk for pk in pks.tolist() if counts.get(pk, 0) != expected)
+            stale.update(self.filter(similar__in=changed).values_list('compound_id', flat=True))
+
+            # a compound may also gain a changed compound as a neighbour, if it is more similar than its last.
+            rest = np.flatnonzero(~np.in1d(pks, np.array(sorted(stale), dtype=np.int64)))
+            if len(changedPks) and len(rest):
+                changedWords = words[np.searchsorted(pks, changedPks)]
+                lastSimilarity = dict(self.filter(rank=expected - 1).values_list('compound_id', 'similarity'))
+                for start in range(0, len(rest), 1000):
+                    rows = rest[start:start + 1000]
+                    toChanged = tanimoto(words[rows], changedWords).max(axis=1)
+                    stale.update(pk for pk, similarity in zip(pks[rows].tolist(), toChanged.tolist())
+                                 if similarity >= lastSimilarity.get(pk, -1))
+
+            stale = np.array(sorted(stale), dtype=np.int64)
+            if verbose:
+                logger.info("Finding the neighbours of {} compounds".format(len(stale)))
+            self.filter(compound__in=stale.tolist()).delete()
+            staleRows = np.searchsorted(pks, stale)
+            for start in range(0, len(stale), 1000):
+                rows = staleRows[start:start + 1000]
+                indices, similarities = nearest(tanimoto(words[rows], words), pks[rows], pks, k)
+                self.bulk_create([CompoundSimilarity(compound_id=int(pks[row]), similar_id=int(pks[index]),
+                                                     rank=rank, similarity=float(similarity))
+                                  for row, rowIndices, rowSimilarities in zip(rows, indices, similarities)
+                                  for rank, (index, similarity) in enumerate(zip(rowIndices, rowSimilarities))])
+        return len(stale)
+
+
+class CompoundSimilarity(models.Model):
+    """One of the most similar compounds to a compound, by the Tanimoto similarity of their fingerprints."""
+
+    class Meta:
+        app_label = "DRP"
+        unique_together = ('compound', 'rank')
+
+    objects = CompoundSimilarityManager()
+
+    compound = models.ForeignKey(Compound, related_name='similarities')
+    similar = models.ForeignKey(Compound, related_name='+')
+    # 0 for the most similar compound
+    rank = models.PositiveIntegerField()
+    similarity = models.FloatField()
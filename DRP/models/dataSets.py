@@ -7,8 +7,16 @@ an erroneous proxy for a many-to-many relationship between Reactions and Models,
 This allows the datasets to exist independently of the models.
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.utils.functional import cached_property
 from .performedReaction import PerformedReaction
+import numpy as np
+import hashlib
+
+
+def fingerprint(pks):
+    """Return a hash identifying the set of reactions with the given primary keys."""
+    return hashlib.sha1(','.join(str(pk) for pk in sorted(set(pks))).encode()).hexdigest()
 
 
 class DataSet(models.Model):
@@ -20,11 +28,19 @@ class DataSet(models.Model):
     name = models.CharField(max_length=200, unique=True)
     reactions = models.ManyToManyField(
         PerformedReaction, through="DataSetRelation")
+    fingerprint = models.CharField(max_length=40, blank=True, default='', db_index=True)
+
+    @cached_property
+    def pks(self):
+        """The primary keys of the reactions in the set, as a sorted array."""
+        return np.fromiter(DataSetRelation.objects.filter(dataSet=self).order_by(
+            'reaction_id').values_list('reaction_id', flat=True), dtype=np.int64)
 
     @classmethod
     def create(cls, name, data):
         """Bulk create a set of datasetrelations."""
-        dataSet = cls(name=name)
+        data = list(data)
+        dataSet = cls(name=name, fingerprint=fingerprint(datum.pk for datum in data))
         dataSet.save()
         dsrs = [DataSetRelation(dataSet=dataSet, reaction=datum)
                 for datum in data]
@@ -32,6 +48,43 @@ class DataSet(models.Model):
 
         return dataSet
 
+    @classmethod
+    def createMany(cls, members, reuse=False):
+        """
+        Create a dataset for each (name, reaction pks) pair in members, returning the datasets in the same order.
+
+        All of the datasets are created in one transaction, with one insert for the datasets
+        and another for their relations. If reuse is True, an existing dataset with the same
+        reactions is returned in place of a new one, and so is the first of any repeated sets.
+        """
+        members = [(name, np.unique(np.asarray(list(pks), dtype=np.int64))) for name, pks in members]
+        fingerprints = [fingerprint(pks.tolist()) for name, pks in members]
+        with transaction.atomic():
+            reused = {}
+            if reuse:
+                # the oldest of any duplicates is kept.
+                for dataSet in cls.objects.filter(fingerprint__in=set(fingerprints)).order_by('-pk'):
+                    reused[dataSet.fingerprint] = dataSet
+            toCreate = []
+            pending = set()
+            for (name, pks), fp in zip(members, fingerprints):
+                if reuse and (fp in reused or fp in pending):
+                    continue
+                pending.add(fp)
+                toCreate.append((name, pks, fp))
+            cls.objects.bulk_create([cls(name=name, fingerprint=fp) for name, pks, fp in toCreate])
+            # bulk_create does not set primary keys on every backend, so fetch them by name.
+            created = {dataSet.name: dataSet for dataSet in cls.objects.filter(
+                name__in=[name for name, pks, fp in toCreate])}
+            DataSetRelation.objects.bulk_create([DataSetRelation(dataSet=created[name], reaction_id=pk)
+                                                 for name, pks, fp in toCreate for pk in pks.tolist()])
+        for name, pks, fp in toCreate:
+            created[name].pks = pks
+        if reuse:
+            reused.update((fp, created[name]) for name, pks, fp in toCreate)
+            return [reused[fp] for fp in fingerprints]
+        return [created[name] for name, pks in members]
+
 
 class DataSetRelation(models.Model):
     """Defines the relationships between a data set and a reaction."""
@@ -0,0 +1,204 @@
+"""
+A compact binary format for the descriptor values of a set of reactions.
+
+Model visitors previously exchanged training and test data as text arff files,
+in which every value was written as a quoted string. A DescriptorDataset instead
+holds one typed column per reaction descriptor csvHeader, and is saved as an
+uncompressed numpy .npz archive containing:
+
+    meta            a json document (as uint8) with the format version, the number of
+                    rows and the header, kind and arff header of each column.
+    pks             int64 primary keys of the reactions, in ascending order.
+    values_<i>      the values of column i: float64 for numeric descriptors, int64
+                    for ordinal ones, uint8 (1 or 0) for booleans and int32 codes
+                    for categorical ones. Missing entries hold 0.
+    missing_<i>     a bitmap (numpy.packbits) of the missing entries of column i.
+    categories_<i>  for categorical columns, the dictionary of permitted values that
+                    the codes index, ordered by primary key.
+
+Categorical codes are the same as those used by ReactionQuerySet.toDescriptorMatrix.
+Weka reads arff, so toArff/iterArff export a dataset in that format.
+"""
+from .descriptorMatrixCache import reactionDescriptors
+from .descriptors import CategoricalDescriptorPermittedValue
+from django.conf import settings
+from collections import OrderedDict
+import numpy as np
+import json
+import uuid
+import os
+
+FORMAT_VERSION = 1
+"""Bump this whenever the layout of the archive changes."""
+
+FILE_EXTENSION = '.drpdata'
+"""The extension given to dataset files, by which they are told apart from arff files."""
+
+DTYPES = {'num': np.float64, 'ord': np.int64, 'bool': np.uint8, 'cat': np.int32}
+
+
+def isDatasetFile(filename):
+    """Return True if filename names a dataset file (rather than, say, an arff file)."""
+    return filename.endswith(FILE_EXTENSION)
+
+
+class DatasetColumn(object):
+    """The typed values of one descriptor for the reactions of a dataset."""
+
+    def __init__(self, header, kind, values, missing, arffHeader, categories=None):
+        """Initialise the column. missing is a boolean array, and categories a list of strings."""
+        self.header = header
+        self.kind = kind
+        self.values = values
+        self.missing = missing
+        self.arffHeader = arffHeader
+        self.categories = categories
+
+    def asFloat(self):
+        """Return the column as floats, with NaN for missing values."""
+        column = self.values.astype(np.float64)
+        column[self.missing] = np.nan
+        return column
+
+    def asStrings(self, missing='?'):
+        """Return an object array of the values as they are written in arff files."""
+        if self.kind == 'cat':
+            strings = np.array(['"{}"'.format(c) for c in self.categories] + [missing], dtype=object)
+            codes = np.where(self.missing, len(self.categories), self.values)
+            return strings[codes]
+        elif self.kind == 'bool':
+            strings = np.array(['False', 'True'], dtype=object)[self.values]
+        elif self.kind == 'num':
+            strings = np.array([repr(v) for v in self.values.tolist()], dtype=object)
+        else:
+            strings = self.values.astype(str).astype(object)
+        strings[self.missing] = missing
+        return strings
+
+
+class DescriptorDataset(object):
+    """The values of a list of reaction descriptors for a set of reactions, as typed columns."""
+
+    def __init__(self, pks, columns):
+        """Initialise the dataset from an array of reaction pks and a list of DatasetColumns."""
+        self.pks = pks
+        self.columns = OrderedDict((column.header, column) for column in columns)
+
+    @property
+    def headers(self):
+        """Return the list of column headers."""
+        return list(self.columns.keys())
+
+    def __len__(self):
+        """Return the number of reactions."""
+        return len(self.pks)
+
+    @classmethod
+    def fromReactions(cls, reactions, headers):
+        """
+        Build a dataset of the descriptors with the given csvHeaders for a ReactionQuerySet.
+
+        Values are read with one query per descriptor value table (see toDescriptorMatrix).
+        Headers which are not reaction descriptors are left out.
+        """
+        matrix, foundHeaders, pks = reactions.toDescriptorMatrix(whitelistHeaders=headers)
+        return cls.fromMatrix(matrix, foundHeaders, pks)
+
+    @classmethod
+    def fromMatrix(cls, matrix, headers, pks):
+        """
+        Build a dataset from a float matrix of descriptor values, as given by toDescriptorMatrix.
+
+        headers are the csvHeaders of the columns of the matrix, which must all be reaction
+        descriptors, and pks label its rows. NaN entries are missing values.
+        """
+        descriptors = reactionDescriptors(list(headers))
+        columns = []
+        for i, header in enumerate(headers):
+            kind, descriptor = descriptors[header]
+            missing = np.isnan(matrix[:, i])
+            values = np.where(missing, 0, matrix[:, i]).astype(DTYPES[kind])
+            categories = None
+            if kind == 'cat':
+                categories = list(CategoricalDescriptorPermittedValue.objects.filter(
+                    descriptor=descriptor).order_by('pk').values_list('value', flat=True))
+            columns.append(DatasetColumn(header, kind, values, missing, descriptor.arffHeader, categories))
+        return cls(pks, columns)
+
+    def matrix(self, headers=None):
+        """
+        Return a float matrix of the columns with the given headers (default all), in that order.
+
+        This is as returned by ReactionQuerySet.toDescriptorMatrix, with rows in the order of pks.
+        """
+        headers = self.headers if headers is None else headers
+        missingHeaders = set(headers) - set(self.columns)
+        if missingHeaders:
+            raise KeyError('The dataset has no columns for {}'.format(missingHeaders))
+        if not headers:
+            return np.empty((len(self.pks), 0))
+        return np.column_stack([self.columns[header].asFloat() for header in headers])
+
+    def save(self, f):
+        """Save the dataset to a filename or binary file-like object."""
+        meta = {
+            'version': FORMAT_VERSION,
+            'rows': len(self.pks),
+            'columns': [{'header': c.header, 'kind': c.kind, 'arffHeader': c.arffHeader} for c in self.columns.values()],
+        }
+        arrays = {'meta': np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), 'pks': self.pks}
+        for i, column in enumerate(self.columns.values()):
+            arrays['values_{}'.format(i)] = column.values
+            arrays['missing_{}'.format(i)] = np.packbits(column.missing)
+            if column.kind == 'cat':
+                arrays['categories_{}'.format(i)] = np.array(column.categories, dtype=np.str_)
+        if isinstance(f, str):
+            with open(f, 'wb') as fh:
+                np.savez(fh, **arrays)
+        else:
+            np.savez(f, **arrays)
+
+    def saveToTmp(self, prefix=''):
+        """Save the dataset to a new file in settings.TMP_DIR and return its path."""
+        filepath = os.path.join(settings.TMP_DIR, '{}_{}{}'.format(prefix, uuid.uuid4(), FILE_EXTENSION))
+        self.save(filepath)
+        return filepath
+
+    @classmethod
+    def load(cls, f):
+        """Load a dataset from a filename or binary file-like object."""
+        with np.load(f) as archive:
+            meta = json.loads(archive['meta'].tostring().decode())
+            if meta['version'] != FORMAT_VERSION:
+                raise ValueError('Dataset format version {} is not supported (expected {})'.format(
+                    meta['version'], FORMAT_VERSION))
+            rows = meta['rows']
+            columns = []
+            for i, info in enumerate(meta['columns']):
+                missing = np.unpackbits(archive['missing_{}'.format(i)])[:rows].astype(bool)
+                categories = archive['categories_{}'.format(i)].tolist() if info['kind'] == 'cat' else None
+                columns.append(DatasetColumn(info['header'], info['kind'], archive['values_{}'.format(i)],
+                                             missing, info['arffHeader'], categories))
+            return cls(archive['pks'], columns)
+
+    def toArff(self, writeable, headers=None, relationName='relation', missing='?'):
+        """Write the columns with the given headers (default all) to a binary file-like object as arff."""
+        for chunk in self.iterArff(headers, relationName, missing):
+            writeable.write(chunk)
+
+    def iterArff(self, headers=None, relationName='relation', missing='?', chunksize=1000):
+        """Generate the arff file as a series of encoded byte strings, each holding up to chunksize rows."""
+        headers = self.headers if headers is None else headers
+        columns = [self.columns[header] for header in headers]
+        yield ''.join((
+            '%arff file generated by the Dark Reactions Project provided by Haverford College\n',
+            '\n@relation {}\n'.format(relationName),
+            '\n'.join(column.arffHeader for column in columns),
+            '\n\n@data\n'
+        )).encode()
+
+        strings = [column.asStrings(missing) for column in columns]
+        for start in range(0, len(self.pks), chunksize):
+            lines = [','.join(row) for row in zip(*(s[start:start + chunksize] for s in strings))]
+            lines.append('')
+            yield '\n'.join(lines).encode()
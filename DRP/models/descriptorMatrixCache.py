@@ -0,0 +1,365 @@
+"""
+A persistent columnar cache of reaction descriptor values.
+
+Expanded exports of reactions (csv, arff and numpy arrays) previously rebuilt
+every row from the four descriptor value tables on every call. This module
+keeps one column per reaction descriptor csvHeader on disk as a .npy file,
+keyed by an index of reaction primary keys, so that exports only touch the
+database for reactions which have changed since they were last cached.
+
+Columns are stored as follows:
+    numeric and ordinal descriptors: float64, NaN for missing values.
+    boolean descriptors: int8, 1 for True, 0 for False and -1 for missing.
+    categorical descriptors: float64 holding the primary key of the
+        permitted value, NaN for missing values.
+
+Rows are invalidated per reaction. Alongside the index the cache keeps the
+version of each reaction's values it read (see DRP.models.descriptorValueVersions),
+which is replaced in the same transaction as any write to the reaction's values.
+A reaction is re-read from the database if it is not yet in the index, if it was
+dirty when it was cached, if it is dirty now, or if its version has changed.
+Only the column files in which a re-read value differs are rewritten, unless new
+reactions were added to the index.
+"""
+from django.conf import settings
+from django.db import transaction
+from DRP.utils import atomicWrite
+from .descriptors import CategoricalDescriptorPermittedValue
+from .rxnDescriptors import BoolRxnDescriptor, NumRxnDescriptor, OrdRxnDescriptor, CatRxnDescriptor
+from .rxnDescriptorValues import BoolRxnDescriptorValue, NumRxnDescriptorValue, OrdRxnDescriptorValue, CatRxnDescriptorValue
+from . import descriptorValueVersions
+from collections import OrderedDict
+from itertools import islice
+import numpy as np
+import hashlib
+import fcntl
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+"""Bump this whenever the on-disk layout changes. Caches of other versions are discarded."""
+
+DIRTY = -1
+"""The version stored for rows which were dirty when cached, which never matches a current version."""
+
+# kind: (descriptor class, value class, column dtype, missing value)
+KINDS = OrderedDict((
+    ('bool', (BoolRxnDescriptor, BoolRxnDescriptorValue, np.int8, -1)),
+    ('num', (NumRxnDescriptor, NumRxnDescriptorValue, np.float64, np.nan)),
+    ('ord', (OrdRxnDescriptor, OrdRxnDescriptorValue, np.float64, np.nan)),
+    ('cat', (CatRxnDescriptor, CatRxnDescriptorValue, np.float64, np.nan)),
+))
+
+
+def _encode(kind, value):
+    """Convert a raw database value to the stored representation of the column."""
+    if value is None:
+        return KINDS[kind][3]
+    elif kind == 'bool':
+        return 1 if value else 0
+    return value
+
+
+def _sameValues(a, b):
+    """Return True if two encoded column slices hold the same values, counting NaNs as equal."""
+    return bool(np.all((a == b) | ((a != a) & (b != b))))
+
+
+def decodeColumn(kind, column):
+    """
+    Decode a (slice of a) cached column into a list of python values.
+
+    Missing values become None and categorical values are given as strings.
+    """
+    if kind == 'bool':
+        return [None if v < 0 else bool(v) for v in column.tolist()]
+    elif kind == 'num':
+        return [None if v != v else v for v in column.tolist()]
+    elif kind == 'ord':
+        return [None if v != v else int(v) for v in column.tolist()]
+    values = column.tolist()
+    valuePks = set(int(v) for v in values if v == v)
+    permitted = dict(CategoricalDescriptorPermittedValue.objects.filter(
+        pk__in=valuePks).values_list('pk', 'value')) if valuePks else {}
+    return [None if v != v else permitted[int(v)] for v in values]
+
+
+def cacheEnabled():
+    """Return True if the descriptor matrix cache is switched on in the settings."""
+    return getattr(settings, 'DESCRIPTOR_MATRIX_CACHE', True)
+
+
+def reactionDescriptors(headers=None):
+    """
+    Return an ordered dictionary of csvHeader: (kind, descriptor) for reaction descriptors.
+
+    If headers is given, only descriptors with those headers are included, in the order given,
+    otherwise all reaction descriptors are included, sorted by header.
+    """
+    found = {}
+    for kind, (descriptorClass, _, _, _) in KINDS.items():
+        qs = descriptorClass.objects.all()
+        if headers is not None:
+            qs = qs.filter(csvHeader__in=headers)
+        for d in qs:
+            found[d.csvHeader] = (kind, d)
+    if headers is None:
+        return OrderedDict(sorted(found.items()))
+    return OrderedDict((h, found[h]) for h in headers if h in found)
+
+
+def pivotValues(kind, descriptorPks, index, reactionPks=None, blocksize=100000):
+    """
+    Fetch (reaction, descriptor, value) triples for one kind of descriptor with a single query.
+
+    descriptorPks is an array of descriptor primary keys, and index a sorted array of reaction primary keys.
+    Values are restricted to the reactions in reactionPks if it is given.
+    Yield blocks of blocksize triples as a tuple of arrays (rows, columns, values), where rows are
+    positions in index, columns are positions in descriptorPks and values are encoded as in the cache
+    columns. Values for reactions which are not in index are dropped.
+    """
+    if len(index) == 0 or len(descriptorPks) == 0:
+        return
+    valueClass, dtype = KINDS[kind][1], KINDS[kind][2]
+    qs = valueClass.objects.filter(descriptor__in=[int(pk) for pk in descriptorPks])
+    if reactionPks is not None:
+        qs = qs.filter(reaction__in=[int(pk) for pk in reactionPks])
+    triples = qs.values_list('reaction_id', 'descriptor_id',
+                             'value_id' if kind == 'cat' else 'value').iterator()
+
+    descriptorOrder = np.argsort(descriptorPks)
+    sortedDescriptorPks = np.asarray(descriptorPks)[descriptorOrder]
+    while True:
+        block = list(islice(triples, blocksize))
+        if not block:
+            break
+        rxnPks, valueDescriptorPks, values = zip(*block)
+        rxnPks = np.array(rxnPks, dtype=np.int64)
+        rows = np.searchsorted(index, rxnPks).clip(0, len(index) - 1)
+        present = index[rows] == rxnPks
+        cols = descriptorOrder[np.searchsorted(
+            sortedDescriptorPks, np.array(valueDescriptorPks, dtype=np.int64))]
+        values = np.array([_encode(kind, v) for v in values], dtype=dtype)
+        yield rows[present], cols[present], values[present]
+
+
+class DescriptorMatrixCache(object):
+    """A columnar, memory-mapped cache of reaction descriptor values stored in a directory."""
+
+    def __init__(self, directory=None):
+        """Use the given directory, or the DESCRIPTOR_MATRIX_CACHE_DIR setting, defaulting to a folder in TMP_DIR."""
+        if directory is None:
+            directory = getattr(settings, 'DESCRIPTOR_MATRIX_CACHE_DIR', os.path.join(
+                settings.TMP_DIR, 'descriptor_matrix_cache'))
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _ensureDirectory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def invalidate(self, reactionPks):
+        """
+        Mark the rows for the given reaction primary keys as stale, in this and every other cache.
+
+        Writes to descriptor values already do this in their own transaction, so this is only
+        needed when values are changed some other way.
+        """
+        descriptorValueVersions.invalidateReactions(reactionPks)
+
+    def clear(self):
+        """Remove every file belonging to the cache."""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(self._path(name))
+
+    def _readManifest(self):
+        try:
+            with open(self._path('manifest.json')) as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if manifest.get('version') != FORMAT_VERSION:
+            logger.info('Discarding descriptor matrix cache with format version {}'.format(
+                manifest.get('version')))
+            return None
+        return manifest
+
+    def _load(self, name, mmap_mode=None):
+        return np.load(self._path(name), mmap_mode=mmap_mode)
+
+    def _save(self, name, array):
+        """Write an array atomically, so that readers holding the old memory map are unaffected."""
+        with atomicWrite(self._path(name)) as f:
+            np.save(f, array)
+
+    @staticmethod
+    def _columnFile(header):
+        return hashlib.md5(header.encode('utf-8')).hexdigest() + '.npy'
+
+    def _fetch(self, columns, index, pks=None):
+        """
+        Fill columns from the database.
+
+        columns is a dictionary of header: (kind, descriptor pk, array aligned with index).
+        Only the rows for the given reaction pks are filled, or all rows if pks is None.
+        """
+        for kind in KINDS:
+            kindColumns = [(descriptorPk, column) for (k, descriptorPk, column) in columns.values() if k == kind]
+            if not kindColumns:
+                continue
+            descriptorPks = np.array([descriptorPk for descriptorPk, _ in kindColumns], dtype=np.int64)
+            for rows, cols, values in pivotValues(kind, descriptorPks, index, pks):
+                # sort the block by column so each column is filled from one contiguous slice.
+                order = np.argsort(cols, kind='mergesort')
+                cols = cols[order]
+                starts = np.flatnonzero(np.r_[True, cols[1:] != cols[:-1]])
+                ends = np.r_[starts[1:], len(cols)]
+                for start, end in zip(starts, ends):
+                    kindColumns[cols[start]][1][rows[order[start:end]]] = values[order[start:end]]
+
+    def refresh(self, reactions, headers=None, load=False):
+        """
+        Bring the cache up to date for the given reactions and descriptor headers.
+
+        Return the manifest describing the cache after refreshing. If load is True, return
+        a tuple of the manifest, the index and the requested columns (see columns()) instead,
+        loaded while the cache is still locked so that they are guaranteed to be aligned.
+        """
+        self._ensureDirectory()
+        with open(self._path('cache.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                manifest = self._refresh(reactions, headers)
+                if not load:
+                    return manifest
+                wanted = headers if headers is not None else sorted(manifest['columns'].keys())
+                columns = OrderedDict()
+                for header in wanted:
+                    if header in manifest['columns']:
+                        info = manifest['columns'][header]
+                        columns[header] = (info['kind'], self._load(info['file'], mmap_mode='r'))
+                return manifest, self._load('index.npy', mmap_mode='r'), columns
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self, reactions, headers):
+        manifest = self._readManifest()
+        fresh = manifest is None
+        if fresh:
+            manifest = {'version': FORMAT_VERSION, 'columns': {}}
+            index = np.array([], dtype=np.int64)
+            versions = np.array([], dtype=np.int64)
+        else:
+            index = self._load('index.npy')
+            versions = self._load('versions.npy')
+
+        wanted = reactionDescriptors(headers)
+        cached = manifest['columns']
+        # Drop columns whose header now refers to another descriptor.
+        current = reactionDescriptors(list(cached.keys()))
+        dropped = [header for header in cached if header not in current or
+                   (current[header][0], current[header][1].pk) != (cached[header]['kind'], cached[header]['descriptor'])]
+        for header in dropped:
+            del cached[header]
+
+        with transaction.atomic():
+            rxnPks = np.array(sorted(reactions.values_list('pk', flat=True)), dtype=np.int64)
+            dirtyPks = np.array(sorted(reactions.filter(dirty=True).values_list('pk', flat=True)), dtype=np.int64)
+            newPks = np.setdiff1d(rxnPks, index, assume_unique=True)
+            newIndex = np.union1d(index, newPks)
+            # read before any values, so that values written after this are found stale next time.
+            currentVersions = descriptorValueVersions.reactionVersions(newIndex)
+
+        positions = np.searchsorted(newIndex, index)
+        changed = index[versions != currentVersions[positions]]
+        stalePks = np.union1d(np.union1d(newPks, np.intersect1d(rxnPks, changed, assume_unique=True)), dirtyPks)
+        newHeaders = [h for h in wanted if h not in cached]
+
+        if len(stalePks) > 0 or newHeaders:
+            logger.debug('Refreshing descriptor matrix cache: {} stale reactions, {} new columns'.format(
+                len(stalePks), len(newHeaders)))
+            stalePositions = np.searchsorted(newIndex, stalePks)
+
+            staleColumns = {}
+            for header, info in cached.items():
+                kind = info['kind']
+                staleColumns[header] = (kind, info['descriptor'], np.full(
+                    len(stalePks), KINDS[kind][3], dtype=KINDS[kind][2]))
+            # When most of the cache is stale, one unfiltered pass is cheaper than a huge IN clause.
+            self._fetch(staleColumns, stalePks, stalePks if 2 * len(stalePks) < len(newIndex) else None)
+
+            for header, (kind, descriptorPk, staleValues) in staleColumns.items():
+                old = self._load(cached[header]['file'], mmap_mode='r')
+                if len(newPks) > 0:
+                    column = np.full(len(newIndex), KINDS[kind][3], dtype=KINDS[kind][2])
+                    column[positions] = old
+                elif not _sameValues(old[stalePositions], staleValues):
+                    column = np.array(old)
+                else:
+                    # none of this column's values changed, so leave its file alone.
+                    continue
+                del old
+                column[stalePositions] = staleValues
+                self._save(cached[header]['file'], column)
+
+            freshColumns = {}
+            for header in newHeaders:
+                kind, descriptor = wanted[header]
+                freshColumns[header] = (kind, descriptor.pk, np.full(
+                    len(newIndex), KINDS[kind][3], dtype=KINDS[kind][2]))
+            self._fetch(freshColumns, newIndex)
+            for header, (kind, descriptorPk, column) in freshColumns.items():
+                self._save(self._columnFile(header), column)
+                cached[header] = {'kind': kind, 'descriptor': descriptorPk,
+                                  'file': self._columnFile(header)}
+
+            newVersions = np.empty(len(newIndex), dtype=np.int64)
+            newVersions[positions] = versions
+            newVersions[stalePositions] = currentVersions[stalePositions]
+            newVersions[np.searchsorted(newIndex, dirtyPks)] = DIRTY
+            index = newIndex
+            versions = newVersions
+        elif not (dropped or fresh):
+            return manifest
+
+        self._save('index.npy', index)
+        self._save('versions.npy', versions)
+        with atomicWrite(self._path('manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def columns(self, reactions, headers=None):
+        """
+        Return a tuple of (index, columns) for the given reactions.
+
+        index is the sorted array of reaction primary keys in the cache (which may
+        include reactions beyond those requested), and columns is an ordered
+        dictionary of csvHeader: (kind, memory-mapped array aligned with index)
+        for every requested header which belongs to a reaction descriptor.
+        """
+        manifest, index, columns = self.refresh(reactions, headers, load=True)
+        return index, columns
+
+    def pythonColumns(self, reactions, headers=None):
+        """
+        Return a tuple of (row lookup, columns) with columns decoded to python values.
+
+        The row lookup maps reaction primary keys to positions in the columns, and
+        the values match those produced by the descriptor value objects in the database,
+        except that categorical values are given as strings.
+        """
+        index, columns = self.columns(reactions, headers)
+        decoded = OrderedDict((header, decodeColumn(kind, column))
+                              for header, (kind, column) in columns.items())
+        rowLookup = {pk: i for i, pk in enumerate(index.tolist())}
+        return rowLookup, decoded
+
+
+descriptorMatrixCache = DescriptorMatrixCache()
+"""The default cache, stored in settings.DESCRIPTOR_MATRIX_CACHE_DIR."""
@@ -0,0 +1,126 @@
+"""
+Version tokens for the values of each descriptor and of each reaction.
+
+Every descriptor has a random token in the DescriptorValueVersion table which is replaced
+whenever any of its reaction descriptor values are saved, created, updated or deleted (see
+DRP.models.rxnDescriptorValues). The token is replaced after the values are written, in the
+same transaction, so a token is never seen together with values older than it. Anything
+computed from descriptor values can be cached under a key including the tokens of the
+descriptors it read, and it will simply stop being found once those values change.
+
+Every reaction likewise has a token in the ReactionValueVersion table, replaced in the same way
+whenever any of its values are written. These are integers, so that a cache of rows can keep
+the token each row was read under in an array (see DRP.models.descriptorMatrixCache).
+
+Tokens are random rather than counters, so that keys made before the database was reset or
+restored are not used again.
+"""
+from django.db import models, transaction, IntegrityError
+import numpy as np
+import uuid
+
+
+def newVersion():
+    """Return a new random version token."""
+    return uuid.uuid4().hex
+
+
+def newReactionVersion():
+    """Return a new random, positive reaction version token which fits in a signed 64 bit integer."""
+    return (uuid.uuid4().int >> 66) + 1
+
+
+class DescriptorValueVersion(models.Model):
+    """The current version of the values of a descriptor."""
+
+    class Meta:
+        app_label = 'DRP'
+
+    descriptor = models.OneToOneField('DRP.Descriptor', primary_key=True, related_name='valueVersion')
+    version = models.CharField(max_length=32, default=newVersion)
+
+
+def versions(descriptorPks):
+    """Return a dictionary from each descriptor pk to the current version of its values."""
+    descriptorPks = set(descriptorPks)
+    found = dict(DescriptorValueVersion.objects.filter(
+        descriptor_id__in=descriptorPks).values_list('descriptor_id', 'version'))
+    for pk in descriptorPks - set(found):
+        found[pk] = DescriptorValueVersion.objects.get_or_create(descriptor_id=pk)[0].version
+    return found
+
+
+def invalidate(descriptorPks):
+    """
+    Replace the versions of these descriptors' values, because the values have changed.
+
+    This must be called after the values are written and in the same transaction.
+    """
+    descriptorPks = set(descriptorPks)
+    if not descriptorPks:
+        return
+    version = newVersion()
+    with transaction.atomic():
+        existing = set(DescriptorValueVersion.objects.filter(
+            descriptor_id__in=descriptorPks).values_list('descriptor_id', flat=True))
+        for pk in descriptorPks - existing:
+            DescriptorValueVersion.objects.get_or_create(descriptor_id=pk, defaults={'version': version})
+        DescriptorValueVersion.objects.filter(descriptor_id__in=descriptorPks).update(version=version)
+
+
+class ReactionValueVersion(models.Model):
+    """The current version of the descriptor values of a reaction."""
+
+    class Meta:
+        app_label = 'DRP'
+
+    reaction = models.OneToOneField('DRP.Reaction', primary_key=True, related_name='valueVersion')
+    version = models.BigIntegerField(default=newReactionVersion)
+
+
+def reactionVersions(index):
+    """
+    Return an int64 array of the current versions of the reactions in index, a sorted array of pks.
+
+    Reactions which have never had a value written have the version 0.
+    """
+    versions = np.zeros(len(index), dtype=np.int64)
+    if len(index) == 0:
+        return versions
+    found = ReactionValueVersion.objects.all()
+    # reading the whole table is cheaper than a huge IN clause.
+    if len(index) < 1000:
+        found = found.filter(reaction_id__in=[int(pk) for pk in index])
+    found = list(found.values_list('reaction_id', 'version'))
+    if found:
+        pks, values = (np.array(column, dtype=np.int64) for column in zip(*found))
+        rows = np.searchsorted(index, pks).clip(0, len(index) - 1)
+        present = index[rows] == pks
+        versions[rows[present]] = values[present]
+    return versions
+
+
+def invalidateReactions(reactionPks):
+    """
+    Replace the versions of these reactions' values, because the values have changed.
+
+    This must be called after the values are written and in the same transaction.
+    """
+    reactionPks = set(int(pk) for pk in reactionPks)
+    if not reactionPks:
+        return
+    version = newReactionVersion()
+    with transaction.atomic():
+        existing = set(ReactionValueVersion.objects.filter(
+            reaction_id__in=reactionPks).values_list('reaction_id', flat=True))
+        missing = reactionPks - existing
+        if missing:
+            try:
+                with transaction.atomic():
+                    ReactionValueVersion.objects.bulk_create(
+                        [ReactionValueVersion(reaction_id=pk, version=version) for pk in missing])
+            except IntegrityError:
+                # another transaction created some of them first.
+                for pk in missing:
+                    ReactionValueVersion.objects.get_or_create(reaction_id=pk, defaults={'version': version})
+        ReactionValueVersion.objects.filter(reaction_id__in=reactionPks).update(version=version)
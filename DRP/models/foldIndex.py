@@ -0,0 +1,60 @@
+"""
+A module containing only the FoldIndex class.
+
+A fold index records how a deterministic splitter divided a set of reactions into
+cross-validation folds. It is keyed by everything the division depends on, so a later
+model build asking for the same folds looks them up by key instead of splitting again,
+and builds comparing different tools need not wait for one another.
+"""
+from django.db import models
+from .dataSets import DataSet
+import numpy as np
+import hashlib
+import json
+
+
+def foldIndexKey(fingerprint, numFolds, seed, response, strata):
+    """
+    Return the key of the folds of the reactions with a fingerprint, for a number of folds, seed and response.
+
+    strata is the stratum of each reaction, in pk order, as given by the values of the response,
+    so the key changes whenever those values divide the reactions differently.
+    """
+    strataHash = hashlib.sha1(np.asarray(strata, dtype=np.int64).tostring()).hexdigest()
+    return hashlib.sha1(json.dumps([fingerprint, numFolds, seed, response, strataHash]).encode()).hexdigest()
+
+
+class FoldIndex(models.Model):
+    """The assignment of the reactions of a dataset to folds, and the training and test sets of each fold."""
+
+    class Meta:
+        app_label = "DRP"
+
+    key = models.CharField(max_length=40, unique=True)
+    reactionSet = models.ForeignKey(DataSet, related_name='foldIndices')
+    numFolds = models.PositiveIntegerField()
+    seed = models.BigIntegerField()
+    response = models.CharField(max_length=255, blank=True, default='')
+    # one int16 per reaction, in the order of reactionSet.pks
+    assignment = models.BinaryField()
+    # a json list of [training set pk, test set pk] for each fold
+    splitSets = models.TextField()
+
+    @property
+    def folds(self):
+        """The fold of each reaction of the reaction set, as an array in the order of its pks."""
+        return np.frombuffer(bytes(self.assignment), dtype=np.int16)
+
+    def splits(self):
+        """
+        Return a list of (training set, test set) pairs, one per fold.
+
+        Raise DataSet.DoesNotExist if any of the datasets has since been deleted.
+        """
+        splitSets = json.loads(self.splitSets)
+        dataSets = DataSet.objects.in_bulk([pk for split in splitSets for pk in split])
+        missing = set(pk for split in splitSets for pk in split) - set(dataSets)
+        if missing:
+            raise DataSet.DoesNotExist('The datasets {} of fold index {} have been deleted.'.format(
+                sorted(missing), self.pk))
+        return [(dataSets[train], dataSets[test]) for train, test in splitSets]
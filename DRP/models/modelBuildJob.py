@@ -0,0 +1,209 @@
+"""
+A module containing only the ModelBuildJob class.
+
+Building a ModelContainer can take hours, so rather than building in the foreground a
+build may be queued as a job. Jobs are run by the model_build_worker management command,
+which records the progress of each one here, and are listed and cancelled with model_jobs.
+
+A running job holds a lease, which its worker renews every so often. If the worker dies, the
+lease expires after settings.MODEL_BUILD_LEASE seconds and the job is queued again.
+"""
+from django.db import models, transaction, connection
+from django.conf import settings
+from django.utils import timezone
+from .modelContainer import ModelContainer
+import threading
+import datetime
+import traceback
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def leaseDuration():
+    """Return how long a running job's lease lasts without being renewed."""
+    return datetime.timedelta(seconds=getattr(settings, 'MODEL_BUILD_LEASE', 600))
+
+
+class BuildCancelled(Exception):
+    """Raised within a build when its job has been cancelled."""
+
+    pass
+
+
+class LeaseLost(Exception):
+    """Raised within a build when its job's lease has expired and the job has been queued again."""
+
+    pass
+
+
+class ModelBuildJobManager(models.Manager):
+    """A manager for queueing and claiming jobs."""
+
+    def enqueue(self, container, workers=None):
+        """Queue a build of an unbuilt container, with workers processes of its own, and return the job."""
+        if container.built:
+            raise RuntimeError("Cannot build a model that has already been built.")
+        return self.create(container=container, workers=workers)
+
+    def claim(self, concurrency=None):
+        """
+        Mark the oldest queued job as running and return it, if fewer than concurrency jobs are running.
+
+        concurrency defaults to settings.MODEL_BUILD_CONCURRENCY, or 1. The unfinished jobs are locked
+        while a job is claimed, so that workers claiming at the same time cannot exceed the limit.
+        Running jobs whose leases have expired are queued again first. Return None if there is no
+        job to run.
+        """
+        if concurrency is None:
+            concurrency = getattr(settings, 'MODEL_BUILD_CONCURRENCY', 1)
+        with transaction.atomic():
+            unfinished = list(self.select_for_update().filter(
+                status__in=(ModelBuildJob.QUEUED, ModelBuildJob.RUNNING)).order_by('pk'))
+            now = timezone.now()
+            for job in unfinished:
+                if job.status == ModelBuildJob.RUNNING and (job.heartbeat is None or job.heartbeat < now - leaseDuration()):
+                    logger.warning("The lease of build job {} expired; queueing it again".format(job.pk))
+                    job.status = ModelBuildJob.QUEUED
+                    job.started = job.heartbeat = None
+                    job.lease = ''
+                    job.save(update_fields=['status', 'started', 'heartbeat', 'lease'])
+            running = sum(1 for job in unfinished if job.status == ModelBuildJob.RUNNING)
+            queued = [job for job in unfinished if job.status == ModelBuildJob.QUEUED]
+            if running >= concurrency or not queued:
+                return None
+            job = queued[0]
+            job.status = ModelBuildJob.RUNNING
+            job.started = job.heartbeat = now
+            job.lease = uuid.uuid4().hex
+            job.save(update_fields=['status', 'started', 'heartbeat', 'lease'])
+        return job
+
+
+class ModelBuildJob(models.Model):
+    """A queued, running or finished build of a model container."""
+
+    class Meta:
+        app_label = "DRP"
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (FINISHED, 'Finished'),
+                      (FAILED, 'Failed'), (CANCELLED, 'Cancelled'))
+
+    objects = ModelBuildJobManager()
+
+    container = models.ForeignKey(ModelContainer, related_name='buildJobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    workers = models.PositiveIntegerField(null=True, blank=True)
+    cancelRequested = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    modelsBuilt = models.PositiveIntegerField(default=0)
+    numModels = models.PositiveIntegerField(default=0)
+    expectedFinish = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    # the last renewal of the running job's lease, and a token identifying the worker holding it
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    lease = models.CharField(max_length=32, blank=True, default='')
+
+    def cancel(self):
+        """
+        Cancel the job.
+
+        A queued job is cancelled at once; a running one stops once the model being built finishes.
+        """
+        if ModelBuildJob.objects.filter(pk=self.pk, status=self.QUEUED).update(
+                status=self.CANCELLED, finished=timezone.now()):
+            self.status = self.CANCELLED
+        elif ModelBuildJob.objects.filter(pk=self.pk, status=self.RUNNING).update(cancelRequested=True):
+            self.cancelRequested = True
+
+    def renewLease(self):
+        """Renew the lease of the running job, raising LeaseLost if it has expired and the job been queued again."""
+        if not ModelBuildJob.objects.filter(pk=self.pk, status=self.RUNNING, lease=self.lease).update(
+                heartbeat=timezone.now()):
+            raise LeaseLost('The lease of build job {} has expired'.format(self.pk))
+
+    def _renewLeaseUntil(self, stopped, interval):
+        """Renew the lease every interval seconds until stopped is set."""
+        try:
+            while not stopped.wait(interval):
+                try:
+                    self.renewLease()
+                except LeaseLost:
+                    return
+        finally:
+            # the thread has a database connection of its own.
+            connection.close()
+
+    def recordProgress(self, modelsBuilt, numModels, expectedFinish):
+        """Record the progress of the build, raising BuildCancelled if the job has been cancelled, or LeaseLost if its lease has expired."""
+        self.renewLease()
+        if settings.USE_TZ and timezone.is_naive(expectedFinish):
+            # the container times its builds in local time.
+            expectedFinish = timezone.make_aware(expectedFinish, timezone.get_current_timezone())
+        self.modelsBuilt = modelsBuilt
+        self.numModels = numModels
+        self.expectedFinish = expectedFinish
+        self.save(update_fields=['modelsBuilt', 'numModels', 'expectedFinish'])
+        if ModelBuildJob.objects.filter(pk=self.pk, cancelRequested=True).exists():
+            raise BuildCancelled('Build job {} was cancelled'.format(self.pk))
+
+    def run(self, verbose=False):
+        """
+        Build the container of a claimed job, recording the outcome.
+
+        The lease is renewed in the background every third of its duration while the job runs.
+        If it has nonetheless expired, the job belongs to whichever worker claimed it next, so
+        the outcome is not recorded.
+        """
+        stopped = threading.Event()
+        renewer = threading.Thread(target=self._renewLeaseUntil,
+                                   args=(stopped, leaseDuration().total_seconds() / 3))
+        renewer.daemon = True
+        renewer.start()
+        try:
+            self.container.build(verbose=verbose, workers=self.workers, progress=self.recordProgress)
+            self.container.save()
+            self.status = self.FINISHED
+        except LeaseLost:
+            logger.warning("The lease of build job {} expired while it was running".format(self.pk))
+            return
+        except BuildCancelled:
+            self.status = self.CANCELLED
+        except Exception:
+            self.status = self.FAILED
+            self.error = traceback.format_exc()
+            raise
+        finally:
+            stopped.set()
+            renewer.join()
+            self.finished = timezone.now()
+            ModelBuildJob.objects.filter(pk=self.pk, lease=self.lease).update(
+                status=self.status, finished=self.finished, error=self.error)
+
+    def progress(self, showError=True):
+        """
+        Return a dictionary of the state of the job, suitable for serialising as json.
+
+        The traceback of a failed build is left out unless showError is True.
+        """
+        return {
+            'id': self.pk,
+            'container': self.container_id,
+            'status': self.status,
+            'cancelRequested': self.cancelRequested,
+            'modelsBuilt': self.modelsBuilt,
+            'numModels': self.numModels,
+            'created': self.created.isoformat() if self.created else None,
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None,
+            'expectedFinish': self.expectedFinish.isoformat() if self.expectedFinish else None,
+            'error': self.error if showError else '',
+        }
@@ -1,21 +1,25 @@
 """A module containing the ModelContainer class and related classes for descriptor attributes."""
 from django.db import models
 from django.conf import settings
-from django.db import transaction
+from django.db import transaction, connections
 from django.core.exceptions import ValidationError
-from numpy import average
+import numpy as np
 from itertools import chain, zip_longest
-import random
+from collections import namedtuple
 import datetime
 import importlib
+import multiprocessing
 import os
 from DRP.models.rxnDescriptors import BoolRxnDescriptor, OrdRxnDescriptor, NumRxnDescriptor, CatRxnDescriptor
 from DRP.models.rxnDescriptorValues import BoolRxnDescriptorValue, NumRxnDescriptorValue, OrdRxnDescriptorValue, CatRxnDescriptorValue
 from .statsModel import StatsModel
+from .descriptorDataset import isDatasetFile
+from DRP.ml_models.loadedModelCache import loadedModelCache
 from DRP.utils import accuracy, BCR, Matthews, confusionMatrixString, confusionMatrixTable
 import json
 import sys
 import logging
+import DRP
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +39,95 @@ FEATURE_SELECTION_TOOL_CHOICES = tuple(
     tool for library in featureVisitorModules.values() for tool in library.tools)
 
 
+valueModels = (
+    (BoolRxnDescriptor, BoolRxnDescriptorValue, bool),
+    (OrdRxnDescriptor, OrdRxnDescriptorValue, int),
+    (NumRxnDescriptor, NumRxnDescriptorValue, float),
+    (CatRxnDescriptor, CatRxnDescriptorValue, None),
+)
+"""The value model for each type of response descriptor, and a conversion for its predicted values."""
+
+
+def predictionArrays(outcomes):
+    """Return an array of reaction pks and an array of the values predicted for them, from a list of (reaction, value) tuples."""
+    outcomes = list(outcomes)
+    reactionPks = np.array([reaction.pk for reaction, value in outcomes], dtype=int)
+    values = np.empty(len(outcomes), dtype=object)
+    values[:] = [value for reaction, value in outcomes]
+    return reactionPks, values
+
+
+def ensemblePredictions(componentPredictions, numeric=False):
+    """
+    Combine component model predictions, given as a list of (reaction pks, values) array pairs.
+
+    Return an array of the pks of every reaction predicted and an array of the overall
+    predictions for them. The component predictions are laid out as a (models x reactions)
+    matrix; numeric predictions are averaged over the models which predicted each reaction,
+    and otherwise the value with the most votes wins, with ties broken at random.
+    If nothing was predicted, both arrays are empty.
+    """
+    if not any(len(pks) for pks, values in componentPredictions):
+        return np.array([], dtype=int), np.empty(0, dtype=object)
+    reactionPks = np.unique(np.concatenate([pks for pks, values in componentPredictions]))
+    shape = (len(componentPredictions), len(reactionPks))
+    columns = [np.searchsorted(reactionPks, pks) for pks, values in componentPredictions]
+
+    if numeric:
+        matrix = np.full(shape, np.nan)
+        for row, (column, (pks, values)) in enumerate(zip(columns, componentPredictions)):
+            matrix[row, column] = np.array(values, dtype=float)  # None becomes nan
+        present = ~np.isnan(matrix)
+        counts = present.sum(axis=0)
+        means = np.where(present, matrix, 0).sum(axis=0) / np.maximum(counts, 1)
+        predictions = np.empty(len(reactionPks), dtype=object)
+        predictions[:] = [mean if count else None for mean, count in zip(means.tolist(), counts.tolist())]
+        return reactionPks, predictions
+
+    outcomeIndex = {}
+    matrix = np.full(shape, -1, dtype=int)
+    for row, (column, (pks, values)) in enumerate(zip(columns, componentPredictions)):
+        matrix[row, column] = [outcomeIndex.setdefault(value, len(outcomeIndex)) for value in values]
+    outcomes = np.empty(len(outcomeIndex), dtype=object)
+    for value, index in outcomeIndex.items():
+        outcomes[index] = value
+    rows, cols = np.nonzero(matrix >= 0)
+    votes = np.zeros((len(outcomes), len(reactionPks)))
+    np.add.at(votes, (matrix[rows, cols], cols), 1)
+    # the votes are whole numbers, so noise below one only decides between tied leaders.
+    winners = np.argmax(votes + np.random.random(votes.shape), axis=0)
+    return reactionPks, outcomes[winners]
+
+
+def alignPredictions(reactionPks, pks, values):
+    """Return an object array of values predicted for pks, in the order of reactionPks, with None for those not predicted."""
+    aligned = np.empty(len(reactionPks), dtype=object)
+    if len(pks):
+        order = np.argsort(pks)
+        positions = np.minimum(np.searchsorted(pks, reactionPks, sorter=order), len(pks) - 1)
+        indices = order[positions]
+        found = pks[indices] == reactionPks
+        aligned[found] = values[indices[found]]
+    return aligned
+
+
+Predictions = namedtuple('Predictions', ('reactionPks', 'statsModelPks', 'components', 'ensemble'))
+"""
+The predictions of a model container for one response descriptor, as returned by ModelContainer.predictionTable.
+
+components is a (component models x reactions) object array, with a row for each of statsModelPks and
+a column for each of reactionPks; ensemble holds the voted prediction for each reaction.
+"""
+
+
+def _trainAndTestStatsModel(args):
+    """Train and test one component model of a container in a worker process (see ModelContainer.build)."""
+    containerPk, statsModelPk, verbose = args
+    container = ModelContainer.objects.get(pk=containerPk)
+    statsModel = StatsModel.objects.get(pk=statsModelPk)
+    return statsModel, container._trainAndTest(statsModel, verbose)
+
+
 class PredictsDescriptorsAttribute(object):
     """An attribute manager object which allows the setting and deletion of the related predictable descriptors."""
 
@@ -318,6 +411,9 @@ class ModelContainer(models.Model):
                     container=m, trainingSet=sm.trainingSet)
                 if set(m.descriptors) == set(self.descriptors) and set(m.outcomeDescriptors) == set(self.outcomeDescriptors):
                     statsModel.inputFile = sm.inputFile
+                elif isDatasetFile(sm.inputFile.name) and set(chain(m.descriptors, m.outcomeDescriptors)) <= set(chain(self.descriptors, self.outcomeDescriptors)):
+                    # datasets can supply any subset of their columns.
+                    statsModel.inputFile = sm.inputFile
                 statsModel.save()
                 statsModel.testSets = sm.testSets.all()
         else:
@@ -364,7 +460,7 @@ class ModelContainer(models.Model):
             statsModel.save()
             statsModel.testSets.add(testSet)
 
-    def build(self, verbose=False):
+    def build(self, verbose=False, workers=None, progress=None):
         """
         Take all options confirmed so far and generate a full model set.
 
@@ -373,11 +469,21 @@ class ModelContainer(models.Model):
 
         Run the tests for the model using the test sets of data, and then saves that information.
 
+        The component models are independent, so with workers greater than 1 (default:
+        settings.MODEL_BUILD_WORKERS, or 1) each is trained and tested in its own process
+        from a pool of that size. Results are still stored to the database by this process.
+
+        If given, progress is called after each component model is stored, with the number
+        of models built, the total number and the expected completion time. It may stop the
+        build by raising an exception.
         """
         if self.built:
             raise RuntimeError(
                 "Cannot build a model that has already been built.")
 
+        if workers is None:
+            workers = getattr(settings, 'MODEL_BUILD_WORKERS', 1)
+
         if verbose:
             logger.info("Starting building at {}".format(
                 datetime.datetime.now()))
@@ -386,85 +492,34 @@ class ModelContainer(models.Model):
         # hairy real fast.
         resDict = {}
 
-        num_models = self.statsmodel_set.all().count()
+        statsModels = list(self.statsmodel_set.all())
+        num_models = len(statsModels)
         num_finished = 0
         overall_start_time = datetime.datetime.now()
-        for statsModel in self.statsmodel_set.all():
-            visitorOptions = json.loads(self.modelVisitorOptions)
-            modelVisitor = getattr(visitorModules[self.modelVisitorLibrary], self.modelVisitorTool)(
-                statsModel=statsModel, **visitorOptions)
-            # Train the model.
-            statsModel.startTime = datetime.datetime.now()
-            fileName = os.path.join(settings.MODEL_DIR, '{}_{}_{}_{}.model'.format(
-                self.pk, statsModel.pk, self.modelVisitorLibrary, self.modelVisitorTool))
-            statsModel.outputFile = fileName
-            if verbose:
-                logger.info("{} statsModel {}, saving to {}, training...".format(
-                    statsModel.startTime, statsModel.pk, fileName))
-            modelVisitor.train(verbose=verbose)
-            statsModel.endTime = datetime.datetime.now()
-            if verbose:
-                logger.info("\t...Trained. Finished at {}. Saving statsModel...".format(
-                    statsModel.endTime)),
-            statsModel.save()
-            if verbose:
-                logger.info("saved")
-
-            # Test the model.
-            for testSet in statsModel.testSets.all():
-                if testSet.reactions.all().count() != 0:
-                    if verbose:
-                        logger.info("Predicting test set...")
-                    predictions = modelVisitor.predict(
-                        testSet.reactions.all(), verbose=verbose)
-                    if verbose:
-                        logger.info(
-                            "\t...finished predicting. Storing predictions...",)
-                    newResDict = self._storePredictionComponents(
-                        predictions, statsModel)
-
-                    # Update the overall result-dictionary with these new
-                    # counts.
-                    for reaction, responseDict in newResDict.items():
-                        for response, outcomeDict in responseDict.items():
-                            for outcome, count in outcomeDict.items():
-                                if reaction not in resDict:
-                                    resDict[reaction] = {}
-                                if response not in resDict[reaction]:
-                                    resDict[reaction][response] = {}
-
-                                if outcome not in resDict[reaction][response]:
-                                    resDict[reaction][response][
-                                        outcome] = count
-                                resDict[reaction][response][outcome] += count
-
-                    if verbose:
-                        logger.info("predictions stored.")
-                        for response in self.outcomeDescriptors:
-                            predDesc = response.predictedDescriptorType.objects.get(
-                                modelContainer=self, statsModel=statsModel, predictionOf=response)
-                            conf_mtrx = predDesc.getConfusionMatrix()
-
-                            logger.info(
-                                "Confusion matrix for {}:".format(predDesc.heading))
-                            logger.info(confusionMatrixString(conf_mtrx))
-                            logger.info("Accuracy: {:.3}".format(
-                                accuracy(conf_mtrx)))
-                            logger.info("BCR: {:.3}".format(BCR(conf_mtrx)))
-
-                elif verbose:
-                    logger.info("Test set is empty.")
-
-            if verbose:
+        if workers > 1 and num_models > 1:
+            # the worker processes must not share this process's database connections.
+            for connection in connections.all():
+                connection.close()
+            pool = multiprocessing.Pool(min(workers, num_models))
+            try:
+                results = pool.imap_unordered(_trainAndTestStatsModel, [
+                    (self.pk, statsModel.pk, verbose) for statsModel in statsModels])
+                for statsModel, testPredictions in results:
+                    self._recordStatsModel(statsModel, testPredictions, resDict, verbose)
+                    num_finished += 1
+                    self._reportProgress(num_finished, num_models, overall_start_time, progress, verbose)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            for statsModel in statsModels:
+                testPredictions = self._trainAndTest(statsModel, verbose)
+                self._recordStatsModel(statsModel, testPredictions, resDict, verbose)
                 num_finished += 1
-                end_time = datetime.datetime.now()
-                elapsed = (end_time - overall_start_time)
-                expected_finish = datetime.timedelta(seconds=(elapsed.total_seconds(
-                ) * (num_models / float(num_finished)))) + overall_start_time
-                logger.info("{}. {} of {} models built.".format(
-                    end_time, num_finished, num_models))
-                logger.info("Elapsed model building time: {}. Expected completion time: {}".format(
-                    elapsed, expected_finish))
+                self._reportProgress(num_finished, num_models, overall_start_time, progress, verbose)
 
         if resDict:
             if verbose:
@@ -478,95 +533,233 @@ class ModelContainer(models.Model):
             overall_end_time = datetime.datetime.now()
             logger.info("Finished at {}".format(overall_end_time))
 
+    def _trainAndTest(self, statsModel, verbose=False):
+        """
+        Train a component model and make predictions for its test sets.
+
+        Return a list of the predictions for each non-empty test set. Nothing is stored to
+        the database here, so that this may be run in a separate process.
+        """
+        modelVisitor = self._visitor(statsModel)
+        # Train the model.
+        statsModel.startTime = datetime.datetime.now()
+        fileName = os.path.join(settings.MODEL_DIR, '{}_{}_{}_{}.model'.format(
+            self.pk, statsModel.pk, self.modelVisitorLibrary, self.modelVisitorTool))
+        statsModel.outputFile = fileName
+        if verbose:
+            logger.info("{} statsModel {}, saving to {}, training...".format(
+                statsModel.startTime, statsModel.pk, fileName))
+        modelVisitor.train(verbose=verbose)
+        statsModel.endTime = datetime.datetime.now()
+        if verbose:
+            logger.info("\t...Trained. Finished at {}.".format(
+                statsModel.endTime))
+
+        # Test the model.
+        testPredictions = []
+        for testSet in statsModel.testSets.all():
+            if testSet.reactions.all().count() != 0:
+                if verbose:
+                    logger.info("Predicting test set...")
+                testPredictions.append(modelVisitor.predict(
+                    testSet.reactions.all(), verbose=verbose))
+                if verbose:
+                    logger.info("\t...finished predicting.")
+            elif verbose:
+                logger.info("Test set is empty.")
+        return testPredictions
+
+    def _recordStatsModel(self, statsModel, testPredictions, resDict, verbose=False):
+        """Save a trained component model and store its test set predictions, adding them to resDict."""
+        if verbose:
+            logger.info("Saving statsModel {}...".format(statsModel.pk))
+        statsModel.save()
+        if verbose:
+            logger.info("saved")
+
+        for predictions in testPredictions:
+            if verbose:
+                logger.info("Storing predictions...")
+            self._storePredictionComponents(
+                predictions, statsModel, resDict)
+
+            if verbose:
+                logger.info("predictions stored.")
+                for response in self.outcomeDescriptors:
+                    predDesc = response.predictedDescriptorType.objects.get(
+                        modelContainer=self, statsModel=statsModel, predictionOf=response)
+                    conf_mtrx = predDesc.getConfusionMatrix()
+
+                    logger.info(
+                        "Confusion matrix for {}:".format(predDesc.heading))
+                    logger.info(confusionMatrixString(conf_mtrx))
+                    logger.info("Accuracy: {:.3}".format(
+                        accuracy(conf_mtrx)))
+                    logger.info("BCR: {:.3}".format(BCR(conf_mtrx)))
+
+    def _reportProgress(self, num_finished, num_models, overall_start_time, progress=None, verbose=False):
+        """Log the progress of a build, and pass it to the progress callback if there is one."""
+        end_time = datetime.datetime.now()
+        elapsed = (end_time - overall_start_time)
+        expected_finish = datetime.timedelta(seconds=(elapsed.total_seconds(
+        ) * (num_models / float(num_finished)))) + overall_start_time
+        if verbose:
+            logger.info("{}. {} of {} models built.".format(
+                end_time, num_finished, num_models))
+            logger.info("Elapsed model building time: {}. Expected completion time: {}".format(
+                elapsed, expected_finish))
+        if progress is not None:
+            progress(num_finished, num_models, expected_finish)
+
     def _storePredictionComponents(self, predictions, statsModel, resDict=None):
         """
-        Return resDict, a dictionary of dictionaries of dictionaries.
+        Store the predictions of a component model and return resDict.
 
-        The first key is the reaction, the second is the response descriptor
-        (the descriptor to be predicted), the third is the predicted outcome.
-        The value is 1 if that outcome is predicted and 0 otherwise.
-        This setup is for easier aggregating into the full model container
-        voting-based prediction.
+        predictions are as returned by a model visitor's predict method. resDict is a
+        dictionary from each response descriptor (the descriptor to be predicted) to a list
+        of (reaction pks, values) array pairs, one for each set of component predictions;
+        these predictions are added to it, ready for the vote in _storePredictions.
         """
         resDict = {} if resDict is None else resDict
 
         for response, outcomes in predictions.items():
             predDesc = response.createPredictionDescriptor(self, statsModel)
             predDesc.save()
-            vals = []
-            for reaction, outcome in outcomes:
-                if reaction not in resDict:
-                    resDict[reaction] = {}
-                if response not in resDict[reaction]:
-                    resDict[reaction][response] = {}
-                if outcome not in resDict[reaction][response]:
-                    resDict[reaction][response][outcome] = 0
-                resDict[reaction][response][outcome] += 1
-                val = predDesc.createValue(reaction, outcome)
-                if val.pk is None:  # if the value already exists
-                    vals.append(val)
-                else:
-                    val.save()
-            if vals:
-                type(vals[0]).objects.bulk_create(vals)
+            reactionPks, values = predictionArrays(outcomes)
+            self._storeValues(response, predDesc, reactionPks, values)
+            if response not in resDict:
+                resDict[response] = []
+            resDict[response].append((reactionPks, values))
         return resDict
 
     def _storePredictions(self, resDict):
-        """Store predictions from the overall container as voted for by each componenet model."""
+        """
+        Store predictions from the overall container as voted for by each componenet model.
+
+        Return a dictionary from each response descriptor to an array of the pks of the
+        reactions predicted and an array of the predictions for them.
+        """
         finalPredictions = {}
-        bool_vals = []
-        num_vals = []
-        ord_vals = []
-        cat_vals = []
-        for reaction, responseDict in resDict.items():
-            for response, outcomeDict in responseDict.items():
-                predDesc = response.createPredictionDescriptor(self)
-                if predDesc.pk is None:
-                    predDesc.save()
-                if isinstance(response, NumRxnDescriptor):
-                    # estimate the weighted average of the estimates from the
-                    # component models
-                    values = tuple(value for value in resDict[
-                                   reaction][response].keys())
-                    weights = tuple(weight for value, weight in resDict[
-                                    reaction][response].items())
-                    val = predDesc.createValue(
-                        reaction, average(values, weights=weights))
-                    num_vals.append(val)
-                else:
-                    # find the 'competitors' with the highest number of votes
-                    # and pick one at random (in case multiple categories have
-                    # equal numbers of votes)
-                    maxVotes = max(count for response,
-                                   count in outcomeDict.items())
-                    winners = [(response, count) for response,
-                               count in outcomeDict.items() if count == maxVotes]
-                    winner = random.choice(winners)
-                    val = predDesc.createValue(reaction, winner[0])
-                    if val.pk is not None:
-                        val.save()
-                    elif isinstance(val, BoolRxnDescriptorValue):
-                        bool_vals.append(val)
-                    elif isinstance(val, OrdRxnDescriptorValue):
-                        ord_vals.append(val)
-                    elif isinstance(val, CatRxnDescriptorValue):
-                        cat_vals.append(val)
-                    else:
-                        raise ValueError(
-                            "Value just created is of unexpected type {}".format(type(val)))
-
-                if response not in finalPredictions:
-                    finalPredictions[response] = []
-                finalPredictions[response].append((reaction, val))
-
-        BoolRxnDescriptorValue.objects.bulk_create(bool_vals)
-        NumRxnDescriptorValue.objects.bulk_create(num_vals)
-        OrdRxnDescriptorValue.objects.bulk_create(ord_vals)
-        CatRxnDescriptorValue.objects.bulk_create(cat_vals)
+        for response, componentPredictions in resDict.items():
+            predDesc = response.createPredictionDescriptor(self)
+            if predDesc.pk is None:
+                predDesc.save()
+            reactionPks, values = ensemblePredictions(
+                componentPredictions, numeric=isinstance(response, NumRxnDescriptor))
+            self._storeValues(response, predDesc, reactionPks, values)
+            finalPredictions[response] = (reactionPks, values)
         return finalPredictions
 
+    def _storeValues(self, response, predDesc, reactionPks, values):
+        """Store values predicted for response as the values of predDesc, replacing any stored already."""
+        for descriptorClass, valueModel, conversion in valueModels:
+            if isinstance(response, descriptorClass):
+                break
+        else:
+            raise TypeError(
+                "Response descriptor is of invalid type {}".format(type(response)))
+        if valueModel is CatRxnDescriptorValue:
+            permittedValues = dict(
+                response.permittedValues.values_list('value', 'pk'))
+            conversion = lambda value: permittedValues[str(value)]
+        # values may be numpy scalars, which the database adapter does not understand.
+        values = [None if value is None else conversion(value) for value in values]
+        valueModel.objects.replaceValues(predDesc, reactionPks, values)
+
+    def _visitor(self, statsModel):
+        """Return a new model visitor for a component model."""
+        visitorOptions = json.loads(self.modelVisitorOptions)
+        return getattr(visitorModules[self.modelVisitorLibrary], self.modelVisitorTool)(
+            statsModel=statsModel, **visitorOptions)
+
+    def _loadedVisitor(self, statsModel):
+        """Return a visitor for a trained component model with its model loaded, reusing a cached one if possible."""
+        def load():
+            visitor = self._visitor(statsModel)
+            visitor.load()
+            return visitor
+        return loadedModelCache.get(statsModel, load)
+
+    def vote(self, reactions, verbose=False):
+        """
+        Predict outcomes for a set of reactions without storing anything in the database.
+
+        Return a dictionary from each response descriptor to an array of the pks of the
+        reactions and an array of the predictions voted for by the component models. The
+        component models are kept loaded (see DRP.ml_models.loadedModelCache), so repeated
+        calls, such as for scoring candidate reactions one at a time, are quick.
+        """
+        if not self.built:
+            raise RuntimeError(
+                'A model container cannot be used to make predictions before the build method has been called')
+        resDict = {}
+        for model in self.statsmodel_set.all():
+            predictions = self._loadedVisitor(model).predict(reactions, verbose=verbose)
+            for response, outcomes in predictions.items():
+                resDict.setdefault(response, []).append(predictionArrays(outcomes))
+        return {response: ensemblePredictions(componentPredictions, numeric=isinstance(response, NumRxnDescriptor))
+                for response, componentPredictions in resDict.items()}
+
+    def scoreMatrix(self, data, headers):
+        """
+        Return the mean score of the component models for each row of a matrix of descriptor values.
+
+        This scores reactions which are not in the database, such as candidates for recommendation,
+        in one call per component model. headers are the csvHeaders of the columns of data.
+        """
+        if not self.built:
+            raise RuntimeError(
+                'A model container cannot be used to make predictions before the build method has been called')
+        scores = [self._loadedVisitor(model).scoreMatrix(data, headers) for model in self.statsmodel_set.all()]
+        if not scores:
+            return np.full(len(data), np.nan)
+        return np.mean(scores, axis=0)
+
+    def predictionTable(self, reactions, verbose=False, store=False):
+        """
+        Predict outcomes for a set of reactions, returning the prediction of each component model as well as the vote.
+
+        Return a dictionary from each response descriptor to a Predictions tuple, whose arrays
+        are aligned with the reactions in the order given. Nothing is written to the database
+        unless store is True, in which case the predictions are stored as by predict.
+        """
+        if not self.built:
+            raise RuntimeError(
+                'A model container cannot be used to make predictions before the build method has been called')
+        reactionPks = np.fromiter(reactions.values_list('pk', flat=True), dtype=np.int64)
+        statsModels = list(self.statsmodel_set.all())
+        componentPredictions = {}
+        storeDict = {}
+        for model in statsModels:
+            predictions = self._loadedVisitor(model).predict(reactions, verbose=verbose)
+            for response, outcomes in predictions.items():
+                componentPredictions.setdefault(response, {})[model.pk] = predictionArrays(outcomes)
+            if store:
+                self._storePredictionComponents(predictions, model, storeDict)
+
+        if store:
+            ensembles = self._storePredictions(storeDict)
+        else:
+            ensembles = {response: ensemblePredictions(list(byModel.values()), numeric=isinstance(response, NumRxnDescriptor))
+                         for response, byModel in componentPredictions.items()}
+
+        tables = {}
+        for response, byModel in componentPredictions.items():
+            components = np.empty((len(statsModels), len(reactionPks)), dtype=object)
+            for row, model in enumerate(statsModels):
+                if model.pk in byModel:
+                    components[row] = alignPredictions(reactionPks, *byModel[model.pk])
+            tables[response] = Predictions(reactionPks, np.array([model.pk for model in statsModels], dtype=np.int64),
+                                           components, alignPredictions(reactionPks, *ensembles[response]))
+        return tables
+
     def predict(self, reactions, verbose=False):
-        """Make predictions from the voting for a set of provided reactions."""
+        """
+        Make predictions from the voting for a set of provided reactions.
+
+        Return a dictionary from each response descriptor to an array of the pks of the
+        reactions and an array of the predictions for them.
+        """
         if self.built:
             resDict = {}
 
@@ -574,9 +767,7 @@ class ModelContainer(models.Model):
             num_finished = 0
             overall_start_time = datetime.datetime.now()
             for model in self.statsmodel_set.all():
-                visitorOptions = json.loads(self.modelVisitorOptions)
-                modelVisitor = getattr(visitorModules[self.modelVisitorLibrary], self.modelVisitorTool)(
-                    statsModel=model, **visitorOptions)
+                modelVisitor = self._loadedVisitor(model)
                 if verbose:
                     logger.info("statsModel {}, saved at {}, predicting...".format(
                         model.pk, model.outputFile))
@@ -584,21 +775,7 @@ class ModelContainer(models.Model):
                 if verbose:
                     logger.info(
                         "\t...finished predicting. Storing predictions...")
-                newResDict = self._storePredictionComponents(
-                    predictions, model)
-
-                # Update the overall result-dictionary with these new counts.
-                for reaction, responseDict in newResDict.items():
-                    for response, outcomeDict in responseDict.items():
-                        for outcome, count in outcomeDict.items():
-                            if reaction not in resDict:
-                                resDict[reaction] = {}
-                            if response not in resDict[reaction]:
-                                resDict[reaction][response] = {}
-
-                            if outcome not in resDict[reaction][response]:
-                                resDict[reaction][response][outcome] = count
-                            resDict[reaction][response][outcome] += count
+                self._storePredictionComponents(predictions, model, resDict)
 
                 if verbose:
                     logger.info("predictions stored.")
@@ -633,12 +810,9 @@ class ModelContainer(models.Model):
 
     def getOverallConfusionMatrices(self, reactions=None):
         """Return the confusion matrix for the voted predictions from this ModelContainer."""
-        confusion_matrix_list = []
-        for descriptor in self.predictsDescriptors:
-            if descriptor.statsModel is None:
-                confusion_matrix_list.append(
-                    (descriptor.csvHeader, descriptor.getConfusionMatrix(reactions=reactions)))
-        return confusion_matrix_list
+        descriptors = [descriptor for descriptor in self.predictsDescriptors if descriptor.statsModel_id is None]
+        matrices = DRP.models.predRxnDescriptors.confusionMatrices(descriptors, reactions)
+        return [(descriptor.csvHeader, matrices[descriptor.pk]) for descriptor in descriptors if descriptor.pk in matrices]
 
     def getComponentConfusionMatrices(self, reactions=None):
         """
@@ -648,14 +822,17 @@ class ModelContainer(models.Model):
         For each model there is a list of tuples.
         Each tuple is of the form (descriptor_heading, confusion matrix)
         """
-        confusion_matrix_lol = []
+        descriptors = [descriptor for descriptor in self.predictsDescriptors if descriptor.statsModel_id is not None]
+        # one query counts the predictions of every component model.
+        matrices = DRP.models.predRxnDescriptors.confusionMatrices(descriptors, reactions)
 
+        confusion_matrix_lol = []
         for model in self.statsmodel_set.all():
             confusion_matrix_list = []
-            for descriptor in self.predictsDescriptors:
-                if descriptor.statsModel == model:
+            for descriptor in descriptors:
+                if descriptor.statsModel_id == model.pk and descriptor.pk in matrices:
                     confusion_matrix_list.append(
-                        (descriptor.csvHeader, descriptor.getConfusionMatrix(reactions=reactions)))
+                        (descriptor.csvHeader, matrices[descriptor.pk]))
             confusion_matrix_lol.append(confusion_matrix_list)
 
         return confusion_matrix_lol
@@ -1,12 +1,101 @@
 """Module for information about predicted reaction descriptors."""
 from django.db import models
 from .rxnDescriptors import BoolRxnDescriptor, OrdRxnDescriptor, NumRxnDescriptor, CatRxnDescriptor
-from .rxnDescriptorValues import BoolRxnDescriptorValue
-from .descriptors import DescriptorManager
+from .rxnDescriptorValues import BoolRxnDescriptorValue, OrdRxnDescriptorValue, CatRxnDescriptorValue
+from .descriptors import DescriptorManager, CategoricalDescriptorPermittedValue
 from .modelContainer import ModelContainer
 from .statsModel import StatsModel
 from .performedReaction import PerformedReaction
-from django.db.models import F
+from django.db import connection
+from .descriptorValueVersions import versions as valueVersions
+from django.core.cache import cache
+import hashlib
+
+
+def confusionMatrices(descriptors, reactions=None):
+    """
+    Return a dictionary from the pk of each of the predicted descriptors to its confusion matrix.
+
+    The matrices are as described in PredBoolRxnDescriptor.getConfusionMatrix, and count the
+    performed reactions in reactions (default all). Numeric descriptors have no confusion
+    matrix and are left out. The matrices of descriptors with the same value table which predict
+    the same descriptor are counted together in one grouped query, and each is cached until a
+    value of it or of the descriptor it predicts changes.
+    """
+    descriptors = [d for d in descriptors if not isinstance(d, PredNumRxnDescriptor)]
+    if reactions is None:
+        reactionPks = None
+        reactionsKey = 'all'
+    else:
+        reactionPks = list(reactions.order_by('pk').values_list('pk', flat=True))
+        reactionsKey = hashlib.sha1(','.join(str(pk) for pk in reactionPks).encode()).hexdigest()
+
+    versions = valueVersions(set(d.pk for d in descriptors) | set(d.predictionOf_id for d in descriptors))
+    keys = {d.pk: 'DRP.confusionMatrix.{}.{}.{}.{}'.format(
+        d.pk, versions[d.pk], versions[d.predictionOf_id], reactionsKey) for d in descriptors}
+    cached = cache.get_many(keys.values())
+    matrices = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    groups = {}
+    for descriptor in descriptors:
+        if descriptor.pk not in matrices:
+            groups.setdefault((type(descriptor), descriptor.predictionOf_id), []).append(descriptor)
+    for (descriptorType, predictionOf_id), group in groups.items():
+        counted = _countPredictions(descriptorType.valueModel, predictionOf_id, [d.pk for d in group], reactionPks)
+        for descriptor in group:
+            matrix = descriptor._emptyConfusionMatrix()
+            for true, guess, count in counted.get(descriptor.pk, []):
+                matrix.setdefault(true, {})[guess] = count
+            matrices[descriptor.pk] = matrix
+        cache.set_many({keys[d.pk]: matrices[d.pk] for d in group}, None)
+    return matrices
+
+
+def _countPredictions(valueModel, predictionOf_id, descriptorPks, reactionPks=None):
+    """
+    Count the pairs of actual and predicted values of the descriptors in one grouped query.
+
+    Return a dictionary from each descriptor pk to a list of (true, guess, count) tuples.
+    """
+    qn = connection.ops.quote_name
+    opts = valueModel._meta
+    reaction = qn(opts.get_field('reaction').column)
+    descriptor = qn(opts.get_field('descriptor').column)
+    value = qn(opts.get_field('value').column)
+    sql = ('SELECT pred.{descriptor}, actual.{value}, pred.{value}, COUNT(*) FROM {table} pred '
+           'INNER JOIN {table} actual ON actual.{reaction} = pred.{reaction} '
+           'INNER JOIN {performed} performed ON performed.{performedPk} = pred.{reaction} '
+           'WHERE actual.{descriptor} = %s AND pred.{descriptor} IN ({descriptorPks})').format(
+        table=qn(opts.db_table), performed=qn(PerformedReaction._meta.db_table),
+        performedPk=qn(PerformedReaction._meta.pk.column), reaction=reaction, descriptor=descriptor,
+        value=value, descriptorPks=', '.join(['%s'] * len(descriptorPks)))
+    params = [predictionOf_id] + list(descriptorPks)
+    if reactionPks is not None:
+        if not reactionPks:
+            return {}
+        sql += ' AND pred.{} IN ({})'.format(reaction, ', '.join(['%s'] * len(reactionPks)))
+        params += reactionPks
+    sql += ' GROUP BY pred.{descriptor}, actual.{value}, pred.{value}'.format(descriptor=descriptor, value=value)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    if valueModel is CatRxnDescriptorValue:
+        permittedValues = dict(CategoricalDescriptorPermittedValue.objects.filter(
+            pk__in=set(v for row in rows for v in row[1:3])).values_list('pk', 'value'))
+        convert = permittedValues.get
+    elif valueModel is BoolRxnDescriptorValue:
+        convert = bool
+    else:
+        convert = int
+
+    counted = {}
+    for descriptorPk, true, guess, count in rows:
+        # missing values are not counted.
+        if true is not None and guess is not None:
+            counted.setdefault(descriptorPk, []).append((convert(true), convert(guess), count))
+    return counted
 
 
 class PredictedDescriptor(models.Model):
@@ -33,6 +122,7 @@ class PredBoolRxnDescriptor(BoolRxnDescriptor, PredictedDescriptor):
         verbose_name = 'Predicted Boolean Rxn Descriptor'
 
     objects = DescriptorManager()
+    valueModel = BoolRxnDescriptorValue
 
     def summarize(self):
         """Return the accuracy of the boolean predictions."""
@@ -100,21 +190,12 @@ class PredBoolRxnDescriptor(BoolRxnDescriptor, PredictedDescriptor):
            }
           }
         """
-        if reactions is None:
-            reactions = PerformedReaction.objects.filter(
-                boolrxndescriptorvalue__descriptor=self).distinct()
+        return confusionMatrices([self], reactions)[self.pk]
 
+    def _emptyConfusionMatrix(self):
+        """Return a confusion matrix with no counts."""
         permittedValues = [True, False]
-
-        reactions = reactions.filter(boolrxndescriptorvalue__descriptor=self).annotate(
-            predicted_val=F('boolrxndescriptorvalue__value'))
-        reactions = reactions.filter(boolrxndescriptorvalue__descriptor=self.predictionOf).annotate(
-            actual_val=F('boolrxndescriptorvalue__value'))
-
-        matrix = {true: {guess: reactions.filter(predicted_val=guess, actual_val=true).count(
-        ) for guess in permittedValues} for true in permittedValues}
-
-        return matrix
+        return {true: {guess: 0 for guess in permittedValues} for true in permittedValues}
 
     def getPredictionTuples(self):
         """
@@ -148,6 +229,7 @@ class PredOrdRxnDescriptor(OrdRxnDescriptor, PredictedDescriptor):
         verbose_name = 'Predicted Ordinal Rxn Descriptor'
 
     objects = DescriptorManager()
+    valueModel = OrdRxnDescriptorValue
 
     def summarize(self):
         """Return the accuracy of the predicted reaction descriptor."""
@@ -166,7 +248,7 @@ class PredOrdRxnDescriptor(OrdRxnDescriptor, PredictedDescriptor):
                 total += count
         return correct / total
 
-    def getConfusionMatrix(self):
+    def getConfusionMatrix(self, reactions=None):
         """
         Return a confusion matrix.
 
@@ -187,13 +269,14 @@ class PredOrdRxnDescriptor(OrdRxnDescriptor, PredictedDescriptor):
             }
            }
         """
-        matrix = {
-            true: {guess: 0 for guess in xrange(self.minimum, self.maximum + 1)}
-            for true in xrange(self.minimum, self.maximum + 1)
+        return confusionMatrices([self], reactions)[self.pk]
+
+    def _emptyConfusionMatrix(self):
+        """Return a confusion matrix with no counts."""
+        return {
+            true: {guess: 0 for guess in range(self.minimum, self.maximum + 1)}
+            for true in range(self.minimum, self.maximum + 1)
         }
-        for true, guess in self.getPredictionTuples():
-            matrix[true][guess] += 1
-        return matrix
 
     def getPredictionTuples(self):
         """
@@ -260,3 +343,18 @@ class PredCatRxnDescriptor(CatRxnDescriptor, PredictedDescriptor):
         verbose_name = 'Predicted Categorical Rxn Descriptor'
 
     objects = DescriptorManager()
+    valueModel = CatRxnDescriptorValue
+
+    def getConfusionMatrix(self, reactions=None):
+        """
+        Return a confusion matrix.
+
+        As for PredBoolRxnDescriptor.getConfusionMatrix, with the values of the
+        predicted descriptor's permitted values as keys.
+        """
+        return confusionMatrices([self], reactions)[self.pk]
+
+    def _emptyConfusionMatrix(self):
+        """Return a confusion matrix with no counts."""
+        permittedValues = list(self.predictionOf.permittedValues.values_list('value', flat=True))
+        return {true: {guess: 0 for guess in permittedValues} for true in permittedValues}
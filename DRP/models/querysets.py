@@ -5,6 +5,18 @@ from django.db import models
 import abc
 from collections import OrderedDict
 from itertools import islice, chain
+import io
+
+EXPORT_CHUNK_SIZE = 1000
+"""The default number of rows in each chunk generated by iterCsv and iterArff."""
+
+
+def _drain(buf):
+    """Return the contents of a StringIO buffer and empty it."""
+    value = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return value
 
 
 class MultiQuerySet(object):
@@ -109,17 +121,34 @@ class CsvQuerySet(models.query.QuerySet):
         'expandedValues', which should be a dictionary like object of values, using fieldNames as keys as output
         by fetchExpandedHeaders.
         """
+        for chunk in self.iterCsv(expanded, whitelistHeaders, missing):
+            writeable.write(chunk)
+
+    def iterCsv(self, expanded=False, whitelistHeaders=None, missing="?", chunksize=EXPORT_CHUNK_SIZE):
+        """
+        Generate the csv data as a series of strings, each holding up to chunksize rows.
+
+        The header row is yielded on its own before any rows are fetched, so this is suitable
+        for passing to a StreamingHttpResponse. Arguments are as for toCsv.
+        """
         if expanded:
             headers = self.expandedCsvHeaders(whitelistHeaders)
         else:
             headers = self.csvHeaders(whitelistHeaders)
 
-        writer = csv.DictWriter(writeable, fieldnames=headers, restval=missing)
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=headers, restval=missing)
 
         writer.writeheader()
-        for row in self.rows(expanded):
+        yield _drain(buf)
+        for i, row in enumerate(self.rows(expanded), 1):
             writer.writerow({k: row.get(k, missing)
                              for k in row.keys() if k in headers})
+            if i % chunksize == 0:
+                yield _drain(buf)
+        chunk = _drain(buf)
+        if chunk:
+            yield chunk
 
     def rows(self, expanded):
         """Generate a dictionary, representative of a row in the csv module's dictwriter."""
@@ -172,21 +201,39 @@ class ArffQuerySet(models.query.QuerySet):
 
     def toArff(self, writeable, expanded=False, relationName='relation', whitelistHeaders=None, missing="?"):
         """Output to an arff file-like object."""
-        writeable.write(
-            '%arff file generated by the Dark Reactions Project provided by Haverford College\n'.encode())
-        writeable.write('\n@relation {}\n'.format(relationName).encode())
+        for chunk in self.iterArff(expanded, relationName, whitelistHeaders, missing):
+            writeable.write(chunk)
+
+    def iterArff(self, expanded=False, relationName='relation', whitelistHeaders=None, missing="?", chunksize=EXPORT_CHUNK_SIZE):
+        """
+        Generate the arff file as a series of encoded byte strings, each holding up to chunksize rows.
+
+        The header section is yielded on its own before any rows are fetched, so this is suitable
+        for passing to a StreamingHttpResponse. Arguments are as for toArff.
+        """
         if expanded:
             headers = self.expandedArffHeaders(whitelistHeaders)
         else:
             headers = self.arffHeaders(whitelistHeaders)
 
-        writeable.write('\n'.join(headers.values()).encode())
+        yield ''.join((
+            '%arff file generated by the Dark Reactions Project provided by Haverford College\n',
+            '\n@relation {}\n'.format(relationName),
+            '\n'.join(headers.values()),
+            '\n\n@data\n'
+        )).encode()
 
-        writeable.write('\n\n@data\n'.encode())
+        lines = []
         for row in self.rows(expanded, whitelistHeaders):
-            writeable.write(','.join(('"' + str(row.get(key)) + '"' if (row.get(key)
-                                                                        is not None) else missing) for key in headers.keys()).encode())
-            writeable.write('\n'.encode())
+            lines.append(','.join(('"' + str(row.get(key)) + '"' if (row.get(key)
+                                                                     is not None) else missing) for key in headers.keys()))
+            if len(lines) == chunksize:
+                lines.append('')
+                yield '\n'.join(lines).encode()
+                lines = []
+        if lines:
+            lines.append('')
+            yield '\n'.join(lines).encode()
 
     def toNPArray(self, expanded=False, whitelistHeaders=None, missing=np.nan):
         """Return a numpy array."""
@@ -2,17 +2,22 @@
 from django.db import models
 from .labGroup import LabGroup
 from .compound import Compound
-from .querysets import CsvQuerySet, ArffQuerySet, MultiQuerySet
+from .querysets import CsvQuerySet, ArffQuerySet, MultiQuerySet, EXPORT_CHUNK_SIZE
 from .descriptors import BooleanDescriptor, NumericDescriptor, CategoricalDescriptor, OrdinalDescriptor
 from .rxnDescriptorValues import BoolRxnDescriptorValue, NumRxnDescriptorValue, OrdRxnDescriptorValue, CatRxnDescriptorValue
 from .rxnDescriptors import BoolRxnDescriptor, NumRxnDescriptor, OrdRxnDescriptor, CatRxnDescriptor
-from itertools import chain
+from .descriptorMatrixCache import descriptorMatrixCache, cacheEnabled, reactionDescriptors, pivotValues, decodeColumn, KINDS
+from .descriptorDataset import DescriptorDataset
+from .descriptors import CategoricalDescriptorPermittedValue
+from itertools import chain, islice
 from .compoundRole import CompoundRole
+from .rxnDescriptorChange import ALL
 from collections import OrderedDict
 import DRP
 import importlib
 from django.conf import settings
 import gc
+import numpy as np
 from django.db.models.functions import Concat
 import logging
 
@@ -22,6 +27,9 @@ logger = logging.getLogger()
 class ReactionQuerySet(CsvQuerySet, ArffQuerySet):
     """Custom queryset for representing additional functionality for multiple reactions."""
 
+    ROW_BATCH_SIZE = 1000
+    """The number of reactions whose cached descriptor values are decoded at once by rows()."""
+
     def __init__(self, model=None, **kwargs):
         """Initialise the queryset."""
         model = Reaction if model is None else model
@@ -98,74 +106,97 @@ class ReactionQuerySet(CsvQuerySet, ArffQuerySet):
                              CatRxnDescriptor.objects.all()
                              )
 
+    def _prefetchDescriptorValues(self, reactions, whitelist=None):
+        """Prefetch the descriptor values for reactions straight from the database, bypassing the descriptor matrix cache."""
+        if whitelist is not None:
+            # This whole nonsense just grabs the descriptor values we actually want. Let's break it down
+            # First we annotate each descriptor value with its descriptor's csvHeader using the Concat operation
+            # Then we filter on the csvHeader so it's in the whitelist
+            # Then we prefetch descriptor values matching this queryset for each reaction and assign this to filtered __vals
+            # Then we can just iterate through these values to get what we
+            # actually want!
+            qs = BoolRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
+                '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
+            reactions = reactions.prefetch_related(models.Prefetch(
+                'boolrxndescriptorvalue_set', queryset=qs, to_attr='filtered_boolvals'))
+
+            qs = NumRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
+                '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
+            reactions = reactions.prefetch_related(models.Prefetch(
+                'numrxndescriptorvalue_set', queryset=qs, to_attr='filtered_numvals'))
+
+            qs = OrdRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
+                '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
+            reactions = reactions.prefetch_related(models.Prefetch(
+                'ordrxndescriptorvalue_set', queryset=qs, to_attr='filtered_ordvals'))
+
+            qs = CatRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
+                '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
+            reactions = reactions.prefetch_related(models.Prefetch(
+                'catrxndescriptorvalue_set', queryset=qs, to_attr='filtered_catvals'))
+        else:
+            reactions = reactions.prefetch_related(
+                'boolrxndescriptorvalue_set__descriptor')
+            reactions = reactions.prefetch_related(
+                'catrxndescriptorvalue_set__descriptor')
+            reactions = reactions.prefetch_related(
+                'ordrxndescriptorvalue_set__descriptor')
+            reactions = reactions.prefetch_related(
+                'numrxndescriptorvalue_set__descriptor')
+        return reactions
+
     def rows(self, expanded, whitelist=None):
-        """Return the 'rows' of information in a format suitable for a python dictwriter."""
+        """
+        Return the 'rows' of information in a format suitable for a python dictwriter.
+
+        Expanded rows read their descriptor values from the descriptor matrix cache
+        unless settings.DESCRIPTOR_MATRIX_CACHE is False.
+        """
         if expanded:
+            useCache = cacheEnabled()
             reactions = self
-            if whitelist is not None:
-                # This whole nonsense just grabs the descriptor values we actually want. Let's break it down
-                # First we annotate each descriptor value with its descriptor's csvHeader using the Concat operation
-                # Then we filter on the csvHeader so it's in the whitelist
-                # Then we prefetch descriptor values matching this queryset for each reaction and assign this to filtered __vals
-                # Then we can just iterate through these values to get what we
-                # actually want!
-                qs = BoolRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
-                    '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
-                reactions = reactions.prefetch_related(models.Prefetch(
-                    'boolrxndescriptorvalue_set', queryset=qs, to_attr='filtered_boolvals'))
-
-                qs = NumRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
-                    '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
-                reactions = reactions.prefetch_related(models.Prefetch(
-                    'numrxndescriptorvalue_set', queryset=qs, to_attr='filtered_numvals'))
-
-                qs = OrdRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
-                    '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
-                reactions = reactions.prefetch_related(models.Prefetch(
-                    'ordrxndescriptorvalue_set', queryset=qs, to_attr='filtered_ordvals'))
-
-                qs = CatRxnDescriptorValue.objects.annotate(descCsvHeader=Concat('descriptor__heading', models.Value(
-                    '_'), 'descriptor__calculatorSoftware', models.Value('_'), 'descriptor__calculatorSoftwareVersion')).filter(descCsvHeader__in=whitelist)
-                reactions = reactions.prefetch_related(models.Prefetch(
-                    'catrxndescriptorvalue_set', queryset=qs, to_attr='filtered_catvals'))
+            if useCache:
+                index, cachedColumns = descriptorMatrixCache.columns(
+                    self, None if whitelist is None else list(whitelist))
             else:
-                reactions = reactions.prefetch_related(
-                    'boolrxndescriptorvalue_set__descriptor')
-                reactions = reactions.prefetch_related(
-                    'catrxndescriptorvalue_set__descriptor')
-                reactions = reactions.prefetch_related(
-                    'ordrxndescriptorvalue_set__descriptor')
-                reactions = reactions.prefetch_related(
-                    'numrxndescriptorvalue_set__descriptor')
+                reactions = self._prefetchDescriptorValues(reactions, whitelist)
             reactions = reactions.prefetch_related('compounds')
 
-            for item in reactions.batch_iterator():
-                row = {field.name: getattr(item, field.name)
-                       for field in self.model._meta.fields}
-                if whitelist is not None:
-                    row.update(
-                        {dv.descCsvHeader: dv.value for dv in item.filtered_boolvals})
-                    row.update(
-                        {dv.descCsvHeader: dv.value for dv in item.filtered_numvals})
-                    row.update(
-                        {dv.descCsvHeader: dv.value for dv in item.filtered_ordvals})
-                    row.update(
-                        {dv.descCsvHeader: dv.value for dv in item.filtered_catvals})
+            items = reactions.batch_iterator()
+            batch = list(islice(items, self.ROW_BATCH_SIZE))
+            while batch:
+                if useCache:
+                    # decode only this batch's slice of each column, so memory use
+                    # doesn't grow with the size of the export.
+                    positions = np.searchsorted(index, [item.pk for item in batch])
+                    decoded = [(header, decodeColumn(kind, column[positions]))
+                               for header, (kind, column) in cachedColumns.items()]
+                for j, item in enumerate(batch):
+                    row = {field.name: getattr(item, field.name)
+                           for field in self.model._meta.fields}
+                    if useCache:
+                        row.update((header, values[j]) for header, values in decoded
+                                   if values[j] is not None)
+                    elif whitelist is not None:
+                        row.update(
+                            {dv.descCsvHeader: dv.value for dv in item.filtered_boolvals})
+                        row.update(
+                            {dv.descCsvHeader: dv.value for dv in item.filtered_numvals})
+                        row.update(
+                            {dv.descCsvHeader: dv.value for dv in item.filtered_ordvals})
+                        row.update(
+                            {dv.descCsvHeader: dv.value for dv in item.filtered_catvals})
+                    else:
+                        row.update(
+                            {dv.descriptor.csvHeader: dv.value for dv in item.descriptorValues})
                     i = 0
                     for compound in item.compounds.all():
                         compound_num = 'compound_{}'.format(i)
-                        if compound_num in whitelist:
+                        if whitelist is None or compound_num in whitelist:
                             row[compound_num] = compound.name
                         i += 1
                     yield row
-                else:
-                    row.update(
-                        {dv.descriptor.csvHeader: dv.value for dv in item.descriptorValues})
-                    i = 0
-                    for compound in item.compounds.all():
-                        row['compound_{}'.format(i)] = compound.name
-                        i += 1
-                    yield row
+                batch = list(islice(items, self.ROW_BATCH_SIZE))
         else:
             for item in self.batch_iterator():
                 row = {field.name: getattr(item, field.name)
@@ -178,6 +209,123 @@ class ReactionQuerySet(CsvQuerySet, ArffQuerySet):
                     i += 1
                 yield row
 
+    def toDescriptorMatrix(self, whitelistHeaders=None, missing=np.nan):
+        """
+        Return a tuple of (matrix, headers, pks) holding the descriptor values of these reactions.
+
+        The matrix is a float array with one row per reaction, in the order of the pks array
+        (sorted by primary key), and one column per reaction descriptor csvHeader, in the order of the
+        headers array (the order of whitelistHeaders if given, otherwise sorted).
+        Values are fetched with one query per descriptor value table and scattered straight into the
+        matrix, so no model instances are created. Booleans are 1.0 or 0.0, and categorical values are
+        the position of the value amongst its descriptor's permitted values ordered by primary key.
+        """
+        pks = np.array(sorted(self.values_list('pk', flat=True)), dtype=np.int64)
+        descriptors = reactionDescriptors(whitelistHeaders)
+        headers = np.array(list(descriptors.keys()), dtype=object)
+        matrix = np.full((len(pks), len(headers)), np.nan)
+
+        for kind in KINDS:
+            positions = np.array([i for i, (k, d) in enumerate(descriptors.values()) if k == kind], dtype=np.int64)
+            if len(positions) == 0:
+                continue
+            descriptorPks = np.array([descriptors[headers[i]][1].pk for i in positions], dtype=np.int64)
+            if kind == 'cat':
+                permitted = list(CategoricalDescriptorPermittedValue.objects.filter(
+                    descriptor__in=descriptorPks.tolist()).order_by('descriptor', 'pk').values_list('pk', 'descriptor_id'))
+                permittedPks = np.array([pk for pk, _ in permitted], dtype=np.int64)
+                permittedDescriptors = np.array([d for _, d in permitted], dtype=np.int64)
+                # the position of each permitted value within its descriptor's group
+                groupStarts = np.r_[True, permittedDescriptors[1:] != permittedDescriptors[:-1]] if len(permitted) else np.array([], dtype=bool)
+                ranks = np.arange(len(permitted))
+                codes = ranks - np.maximum.accumulate(np.where(groupStarts, ranks, 0))
+                order = np.argsort(permittedPks)
+                permittedPks, codes = permittedPks[order], codes[order]
+            for rows, cols, values in pivotValues(kind, descriptorPks, pks, pks):
+                values = values.astype(np.float64)
+                if kind == 'bool':
+                    values[values < 0] = np.nan
+                elif kind == 'cat':
+                    present = ~np.isnan(values)
+                    values[present] = codes[np.searchsorted(permittedPks, values[present].astype(np.int64))]
+                matrix[rows, positions[cols]] = values
+
+        if not (isinstance(missing, float) and np.isnan(missing)):
+            matrix[np.isnan(matrix)] = missing
+        return matrix, headers, pks
+
+    def toNPArray(self, expanded=False, whitelistHeaders=None, missing=np.nan):
+        """
+        Return a numpy array.
+
+        When every requested column is a reaction descriptor the values are fetched with one
+        query per descriptor value table rather than row by row. The array is the same either
+        way: rows are in primary key order and values are those given by rows() (so booleans
+        are bools and categorical values are strings), converted to an array by numpy.
+        For a float matrix with categorical values encoded as codes, use toDescriptorMatrix.
+        """
+        if expanded and whitelistHeaders is not None:
+            headers = list(self.expandedArffHeaders(whitelistHeaders).keys())
+            descriptors = reactionDescriptors(headers)
+            if headers and len(descriptors) == len(headers):
+                return self._descriptorArray(descriptors, missing)
+        return super(ReactionQuerySet, self).toNPArray(expanded, whitelistHeaders, missing)
+
+    def _descriptorArray(self, descriptors, missing):
+        """
+        Return the array toNPArray would build from rows() for an ordered dictionary of csvHeader: (kind, descriptor).
+
+        The values are read by toDescriptorMatrix and converted a column at a time to the type numpy
+        would give the rows: the common type of their bools, ints and floats, or strings if there are
+        any categorical values or missing is not a number.
+        """
+        matrix, headers, pks = self.toDescriptorMatrix(whitelistHeaders=list(descriptors.keys()))
+        if not len(pks):
+            return np.array([])
+        kinds = [descriptors[header][0] for header in headers]
+        absent = np.isnan(matrix)
+        if 'cat' not in kinds and isinstance(missing, (int, float)):
+            types = [{'bool': np.bool_, 'ord': np.int64, 'num': np.float64}[kind] for kind in kinds]
+            if absent.any():
+                types.append(np.asarray(missing).dtype)
+            array = matrix.astype(np.result_type(*types))
+            array[absent] = missing
+            return array
+
+        columns = []
+        for j, kind in enumerate(kinds):
+            present = ~absent[:, j]
+            values = matrix[present, j]
+            column = np.empty(len(pks), dtype=object)
+            column[:] = str(missing)
+            if kind == 'bool':
+                column[present] = np.where(values > 0, 'True', 'False')
+            elif kind == 'ord':
+                column[present] = values.astype(np.int64).astype(str)
+            elif kind == 'num':
+                column[present] = values.astype(str)
+            else:
+                # toDescriptorMatrix gives categories by their position amongst the permitted values.
+                permitted = np.array(list(descriptors[headers[j]][1].permittedValues.order_by(
+                    'pk').values_list('value', flat=True)), dtype=object)
+                column[present] = permitted[values.astype(np.int64)]
+            columns.append(column)
+        return np.array(np.column_stack(columns), dtype=str)
+
+    def iterArff(self, expanded=False, relationName='relation', whitelistHeaders=None, missing="?", chunksize=EXPORT_CHUNK_SIZE):
+        """
+        Generate the arff file as a series of encoded byte strings, each holding up to chunksize rows.
+
+        When every requested column is a reaction descriptor the file is exported from a
+        DescriptorDataset rather than written row by row.
+        """
+        if expanded and whitelistHeaders is not None:
+            headers = list(self.expandedArffHeaders(whitelistHeaders).keys())
+            if len(reactionDescriptors(headers)) == len(headers):
+                return DescriptorDataset.fromReactions(self, headers).iterArff(
+                    headers, relationName, missing, chunksize)
+        return super(ReactionQuerySet, self).iterArff(expanded, relationName, whitelistHeaders, missing, chunksize)
+
     # From https://djangosnippets.org/snippets/1949/
     def batch_iterator(self, chunksize=5000):
         """
@@ -191,7 +339,10 @@ class ReactionQuerySet(CsvQuerySet, ArffQuerySet):
         Note that the implementation of the iterator does not support ordered query sets.
         """
         pk = 0
-        last_pk = self.order_by('-pk')[0].pk
+        last = self.order_by('-pk').first()
+        if last is None:
+            return
+        last_pk = last.pk
         queryset = self.order_by('pk')
         while pk < last_pk:
             for row in queryset.filter(pk__gt=pk)[:chunksize]:
@@ -230,6 +381,9 @@ class Reaction(models.Model):
     dirty = models.BooleanField(default=True)
     calculating = models.BooleanField(default=False)
     recalculate = models.BooleanField(default=False)
+    # failed calculations by the descriptor worker since the last success, and when to try again
+    calculationFailures = models.PositiveIntegerField(default=0)
+    calculationRetry = models.DateTimeField(null=True, blank=True)
     # this is to cope with a hideous problem in xml serialization in the
     # management commands
     calcDescriptors = True
@@ -239,6 +393,13 @@ class Reaction(models.Model):
         """Return all the descriptor values for this reaction. This should be turned into a multiqueryset."""
         return MultiQuerySet(self.boolrxndescriptorvalue_set.all(), self.numrxndescriptorvalue_set.all(), self.ordrxndescriptorvalue_set.all(), self.catrxndescriptorvalue_set.all())
 
+    def save(self, *args, **kwargs):
+        """Save the reaction, recording that a new one needs all of its descriptors calculated."""
+        created = self.pk is None
+        super(Reaction, self).save(*args, **kwargs)
+        if created:
+            DRP.models.RxnDescriptorChange.objects.record([(self.pk, ALL)])
+
     def __str__(self):
         """Return the unicode representation of the reaction."""
         return "Reaction_{}".format(self.id)
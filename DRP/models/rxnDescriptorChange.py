@@ -0,0 +1,121 @@
+"""
+A module containing only the RxnDescriptorChange class.
+
+Reaction descriptors are calculated from a few kinds of data, each named by a source string:
+
+    'quantity:<role>'          the compound quantities of a reaction in a compound role
+    'mol:<role>:<heading>'     the values of a molecular descriptor for the compounds in a role,
+                               or of any molecular descriptor if heading is '*'
+    'formula'                  the formulae of a reaction's compounds
+    'rxn:<heading>'            the value of a (manual) reaction descriptor
+    '*'                        everything, recorded when a reaction is created so that its
+                               first calculation is of every descriptor
+
+Changes to these are recorded against each reaction they affect, so that calculate_descriptors
+only needs to recalculate the reaction descriptors which depend on them. Recording a change
+which is already recorded counts it again, so that a calculation which started before it only
+deletes the changes as they were when it started.
+"""
+from django.db import models
+from django.db.models import F
+import DRP
+
+FORMULA = 'formula'
+ALL = '*'
+
+
+def quantitySource(roleLabel):
+    """Return the source name for the compound quantities in a role."""
+    return 'quantity:{}'.format(roleLabel)
+
+
+def molSource(roleLabel, heading='*'):
+    """Return the source name for a molecular descriptor of the compounds in a role."""
+    return 'mol:{}:{}'.format(roleLabel, heading)
+
+
+def rxnSource(heading):
+    """Return the source name for a reaction descriptor."""
+    return 'rxn:{}'.format(heading)
+
+
+class RxnDescriptorChangeManager(models.Manager):
+    """A manager for recording changes."""
+
+    def record(self, changes):
+        """
+        Record changes, given as an iterable of (reaction pk, source) pairs.
+
+        The reactions are marked dirty. Changes already recorded are not duplicated, but their
+        count is increased.
+        """
+        changes = set(changes)
+        if not changes:
+            return
+        reactionPks = set(reaction_id for reaction_id, source in changes)
+        existing = set(self.filter(reaction__in=reactionPks).values_list('reaction_id', 'source'))
+        repeated = changes & existing
+        if repeated:
+            # this may count a few other changes of these reactions again too, which only costs a recalculation.
+            self.filter(reaction__in=set(reaction_id for reaction_id, source in repeated),
+                        source__in=set(source for reaction_id, source in repeated)).update(recorded=F('recorded') + 1)
+        self.bulk_create(RxnDescriptorChange(reaction_id=reaction_id, source=source)
+                         for reaction_id, source in changes - existing)
+        DRP.models.Reaction.objects.filter(pk__in=reactionPks).update(dirty=True)
+
+    def markOutstanding(self, reactions):
+        """
+        Mark those of a queryset of reactions which still have changes recorded as dirty.
+
+        This is for after their calculation has finished: the soil_reaction trigger clears
+        dirty when calculating is cleared, even if changes were recorded in the meantime.
+        """
+        DRP.models.Reaction.objects.filter(
+            pk__in=set(self.filter(reaction__in=reactions).values_list('reaction_id', flat=True))).update(dirty=True)
+
+    def deleteCalculated(self, recorded):
+        """
+        Delete changes whose descriptors have been calculated.
+
+        recorded is a list of (pk, recorded count) pairs read before the calculation started.
+        Changes recorded again since then are kept.
+        """
+        pksByCount = {}
+        for pk, count in recorded:
+            pksByCount.setdefault(count, []).append(pk)
+        for count, pks in pksByCount.items():
+            self.filter(pk__in=pks, recorded=count).delete()
+
+    def recordCompounds(self, compounds, headings=None):
+        """
+        Record that the molecular descriptors of compounds have been recalculated.
+
+        If headings is None, all of their descriptors (and their formulae) may have changed.
+        """
+        changes = []
+        for reaction_id, label in DRP.models.CompoundQuantity.objects.filter(
+                compound__in=compounds).values_list('reaction_id', 'role__label'):
+            if headings is None:
+                changes.append((reaction_id, molSource(label)))
+                changes.append((reaction_id, FORMULA))
+            else:
+                changes += [(reaction_id, molSource(label, heading)) for heading in headings]
+        self.record(changes)
+
+
+class RxnDescriptorChange(models.Model):
+    """A change to the data a reaction's descriptors are calculated from, kept until they are recalculated."""
+
+    class Meta:
+        app_label = 'DRP'
+        unique_together = ('reaction', 'source')
+
+    reaction = models.ForeignKey('DRP.Reaction')
+    source = models.CharField(max_length=255)
+    recorded = models.PositiveIntegerField(default=0)
+
+    objects = RxnDescriptorChangeManager()
+
+    def __str__(self):
+        """Return the source and reaction as the unicode representation."""
+        return '{} changed for {}'.format(self.source, self.reaction_id)
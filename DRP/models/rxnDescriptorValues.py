@@ -1,7 +1,9 @@
 """A module containign only the DescriptorValue class."""
-from django.db import models
+from django.db import models, transaction
 from .descriptorValues import CategoricalDescriptorValue, OrdinalDescriptorValue, BooleanDescriptorValue, NumericDescriptorValue
 from .rxnDescriptors import CatRxnDescriptor, NumRxnDescriptor, BoolRxnDescriptor, OrdRxnDescriptor
+from .rxnDescriptorChange import rxnSource
+from . import descriptorValueVersions
 # Needed to allow for circular dependency.
 import DRP.models
 import DRP.models.performedReaction
@@ -11,7 +13,30 @@ import uuid
 class RxnDescriptorValueQuerySet(models.query.QuerySet):
     """A queryset which represents a collection of concrete values of a Reaction Descriptor."""
 
-    pass
+    def bulk_create(self, objs, *args, **kwargs):
+        """Create the values, marking their reactions as stale in the descriptor matrix cache."""
+        objs = list(objs)
+        with transaction.atomic():
+            created = super(RxnDescriptorValueQuerySet, self).bulk_create(objs, *args, **kwargs)
+            _invalidateVersions(set((obj.reaction_id, obj.descriptor_id) for obj in objs))
+        return created
+
+    def delete(self):
+        """Delete the values, marking their reactions as stale in the descriptor matrix cache."""
+        with transaction.atomic():
+            pairs = set(self.values_list('reaction_id', 'descriptor_id'))
+            deleted = super(RxnDescriptorValueQuerySet, self).delete()
+            _invalidateVersions(pairs)
+        return deleted
+
+    def update(self, **kwargs):
+        """Update the values, marking their reactions as stale in the descriptor matrix cache."""
+        with transaction.atomic():
+            pairs = set(self.values_list('reaction_id', 'descriptor_id'))
+            updated = super(RxnDescriptorValueQuerySet, self).update(**kwargs)
+            _invalidateVersions(pairs)
+        return updated
+
     # def delete(self):
     # trainingModels = DRP.models.StatsModel.objects.filter(descriptors=self.descriptor, testset__in=dataSets.TestSet.objects.filter(reactions__in=set(v.reaction.performedreaction for v in self)))
     # testModels = DRP.models.StatsModel.objects.filter(descriptors=self.descriptor, trainingset__in=dataSets.TrainingSet.objects.filter(reaction__in=set(v.reaction.performedreaction for v in self)))
@@ -19,6 +44,14 @@ class RxnDescriptorValueQuerySet(models.query.QuerySet):
     # model.invalidate()
 
 
+def _invalidateVersions(pairs):
+    """Change the versions of the reactions and descriptors of values, given as (reaction, descriptor) pairs, after writing them."""
+    descriptorValueVersions.invalidate(
+        set(descriptor_id for reaction_id, descriptor_id in pairs))
+    descriptorValueVersions.invalidateReactions(
+        set(reaction_id for reaction_id, descriptor_id in pairs))
+
+
 class RxnDescriptorValueManager(models.Manager):
     """A manager which returns the custom queryset class for Reaction Descriptor Values."""
 
@@ -26,6 +59,25 @@ class RxnDescriptorValueManager(models.Manager):
         """Return the correct queryset class."""
         return RxnDescriptorValueQuerySet(self.model, using=self._db)
 
+    def replaceValues(self, descriptor, reactionPks, values, batch_size=1000):
+        """
+        Set the values of descriptor for the reactions with reactionPks to values, in a handful of queries.
+
+        Any values the reactions already have for the descriptor are replaced. For categorical
+        descriptors, values are the pks of the permitted values. Return the created value objects.
+        """
+        reactionPks = [int(pk) for pk in reactionPks]
+        valueField = self.model._meta.get_field('value').attname
+        # rxnUid checks every value table for each uid, which is far too slow for this many values;
+        # a collision between uuid4s is not a realistic concern.
+        objs = [self.model(**{'uid': str(uuid.uuid4()), 'descriptor': descriptor, 'reaction_id': pk, valueField: value})
+                for pk, value in zip(reactionPks, values)]
+        with transaction.atomic():
+            for i in range(0, len(reactionPks), batch_size):
+                self.filter(descriptor=descriptor, reaction_id__in=reactionPks[i:i + batch_size]).delete()
+            self.bulk_create(objs, batch_size=batch_size)
+        return objs
+
 
 def rxnUid():
     """Return a unique identifier for a reaction descriptor value."""
@@ -46,6 +98,27 @@ class RxnDescriptorValue(models.Model):
     objects = RxnDescriptorValueManager()
     reaction = models.ForeignKey("DRP.Reaction", unique=False)
 
+    def save(self, *args, **kwargs):
+        """Save the value, marking the reaction as stale in the descriptor matrix cache."""
+        with transaction.atomic():
+            super(RxnDescriptorValue, self).save(*args, **kwargs)
+            _invalidateVersions([(self.reaction_id, self.descriptor_id)])
+        self._recordChange()
+
+    def delete(self, *args, **kwargs):
+        """Delete the value, marking the reaction as stale in the descriptor matrix cache."""
+        self._recordChange()
+        with transaction.atomic():
+            super(RxnDescriptorValue, self).delete(*args, **kwargs)
+            _invalidateVersions([(self.reaction_id, self.descriptor_id)])
+
+    def _recordChange(self):
+        """Record a change to a manual value, which calculated reaction descriptors may depend on."""
+        # values calculated by plugins are not recorded, or they would never stop being recalculated.
+        if self.descriptor.calculatorSoftware == 'manual':
+            DRP.models.RxnDescriptorChange.objects.record(
+                [(self.reaction_id, rxnSource(self.descriptor.heading))])
+
     # def save(self, *args, **kwargs):
     # if self.pk is not None:
     # pass
@@ -0,0 +1,127 @@
+"""
+A content-addressed cache of the DescriptorDatasets used to train models.
+
+Model, feature selection and metric containers built on the same reactions and
+descriptors previously each read the same values from the database and wrote
+their own input files. This cache stores each prepared dataset once, in a file
+named by a hash of:
+
+    the primary keys of the reactions in it,
+    the sorted csvHeaders of its descriptors,
+    the current version of each descriptor's values (see descriptorValueVersions),
+    and the dataset format version,
+
+so any container asking for the same data gets the same file, and a change to any
+of the values means the data is prepared afresh under a new name.
+
+Datasets with the same reactions and headers share a slot, named by a hash of just
+those. A small file for each slot holds the key of its latest dataset, and when a
+new dataset is stored in the slot the one it supersedes is deleted.
+"""
+from django.conf import settings
+from DRP.utils import atomicWrite
+from .descriptorMatrixCache import reactionDescriptors
+from .descriptorDataset import DescriptorDataset, FILE_EXTENSION, FORMAT_VERSION
+from .descriptorValueVersions import versions
+from .dataSets import fingerprint
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def membershipHash(reactions):
+    """Return a hash of the primary keys of a queryset of reactions."""
+    return fingerprint(reactions.values_list('pk', flat=True))
+
+
+class TrainingDatasetCache(object):
+    """A directory of DescriptorDataset files, each named by a hash of its contents."""
+
+    def __init__(self, directory=None):
+        """Use the given directory, or the TRAINING_DATASET_CACHE_DIR setting, defaulting to a folder in TMP_DIR."""
+        if directory is None:
+            directory = getattr(settings, 'TRAINING_DATASET_CACHE_DIR', os.path.join(
+                settings.TMP_DIR, 'training_datasets'))
+        self.directory = directory
+
+    def key(self, reactions, headers):
+        """Return the key of the dataset for the reactions and the descriptors with headers."""
+        return self._key(membershipHash(reactions), headers)
+
+    def _key(self, membership, headers):
+        descriptors = reactionDescriptors(sorted(set(headers)))
+        descriptorVersions = versions([descriptor.pk for kind, descriptor in descriptors.values()])
+        content = {
+            'format': FORMAT_VERSION,
+            'reactions': membership,
+            'descriptors': [(header, descriptor.pk, descriptorVersions[descriptor.pk])
+                            for header, (kind, descriptor) in descriptors.items()],
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        """Return the path of the file for a key."""
+        return os.path.join(self.directory, key + FILE_EXTENSION)
+
+    def _slotPath(self, membership, headers):
+        """Return the path of the file holding the latest key for the reactions and headers."""
+        content = {'reactions': membership, 'headers': sorted(set(headers))}
+        return os.path.join(self.directory, hashlib.sha1(
+            json.dumps(content, sort_keys=True).encode()).hexdigest() + '.current')
+
+    def _supersede(self, slotPath, key):
+        """Record key as the latest of its slot, deleting the dataset it supersedes."""
+        try:
+            with open(slotPath) as f:
+                previous = f.read().strip()
+        except IOError:
+            previous = None
+        with atomicWrite(slotPath, 'w') as f:
+            f.write(key)
+        if previous and previous != key:
+            try:
+                os.remove(self.path(previous))
+            except OSError:
+                # it was already deleted by another process.
+                pass
+
+    def get(self, reactions, headers, verbose=False):
+        """
+        Return a tuple of (dataset, path) for the reactions and the descriptors with headers.
+
+        The dataset is read from the cache if it is there, and otherwise prepared from the
+        database and stored. Its columns are in sorted header order.
+        """
+        membership = membershipHash(reactions)
+        key = self._key(membership, headers)
+        path = self.path(key)
+        if os.path.isfile(path):
+            if verbose:
+                logger.info("Using cached training dataset {}".format(path))
+            try:
+                return DescriptorDataset.load(path), path
+            except IOError:
+                # it was superseded and deleted since we looked.
+                pass
+
+        dataset = DescriptorDataset.fromReactions(reactions, sorted(set(headers)))
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        with atomicWrite(path) as f:
+            dataset.save(f)
+        self._supersede(self._slotPath(membership, headers), key)
+        if verbose:
+            logger.info("Stored training dataset {}".format(path))
+        return dataset, path
+
+    def clear(self):
+        """Remove every file belonging to the cache."""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+
+trainingDatasetCache = TrainingDatasetCache()
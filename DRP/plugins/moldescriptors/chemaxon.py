@@ -9,7 +9,11 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from collections import OrderedDict
 from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
+import tempfile
+import shutil
+import os
 import logging
 logger = logging.getLogger("DRP")
 
@@ -40,6 +44,10 @@ if CHEMAXON_VERSION is None:
 calculatorSoftware = 'ChemAxon_cxcalc'
 # number of values to create at a time. Should probably be <= 5000
 create_threshold = 5000
+# number of compounds to pass to each cxcalc call by calculate_many
+chunk_size = getattr(settings, 'CHEMAXON_CHUNK_SIZE', 100)
+# maximum number of cxcalc processes to run at once in calculate_many
+max_processes = getattr(settings, 'CHEMAXON_MAX_PROCESSES', 4)
 
 
 # The descriptor versions correspond to either the first ChemAxon version in which they were used
@@ -261,6 +269,23 @@ def delete_descriptors(compound_set, descriptorDict):
                                                      compound__in=compound_set).delete()
 
 
+def _createThreshold(num_to_create, ord_to_create, verbose=False):
+    """Create the values waiting to be created if there are more than create_threshold of them."""
+    if len(num_to_create) > create_threshold:
+        if verbose:
+            logger.info('Creating {} numeric values'.format(
+                len(num_to_create)))
+        DRP.models.NumMolDescriptorValue.objects.bulk_create(num_to_create)
+        num_to_create = []
+    if len(ord_to_create) > create_threshold:
+        if verbose:
+            logger.info('Creating {} ordinal values'.format(
+                len(ord_to_create)))
+        DRP.models.OrdMolDescriptorValue.objects.bulk_create(ord_to_create)
+        ord_to_create = []
+    return num_to_create, ord_to_create
+
+
 def calculate_many(compound_set, verbose=False, whitelist=None):
     """Bulk calculation of descriptors."""
     if verbose:
@@ -279,24 +304,35 @@ def calculate_many(compound_set, verbose=False, whitelist=None):
     ord_to_create = []
     filtered_cxcalcCommands = {
         k: v for k, v in cxcalcCommands.items() if k in descriptorDict.keys()}
-    for i, compound in enumerate(compound_set):
+    commandKeys = tuple(filtered_cxcalcCommands.keys())
+
+    # Compounds with SMILES are calculated in chunks, with at most max_processes
+    # chunks being run by cxcalc at once. Anything which cannot be done this way
+    # falls back to being calculated one compound at a time.
+    compounds = list(compound_set)
+    individual = [compound for compound in compounds if not compound.smiles]
+    batched = [compound for compound in compounds if compound.smiles]
+    chunks = [batched[i:i + chunk_size] for i in range(0, len(batched), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_processes) as executor:
+        for i, (results, failed) in enumerate(executor.map(lambda chunk: _calculateChunk(chunk, filtered_cxcalcCommands), chunks)):
+            if verbose:
+                logger.info("Chunk {}/{}: {} compounds calculated, {} to be calculated individually".format(
+                    i + 1, len(chunks), len(results), len(failed)))
+            for compound, resList in results:
+                if len(resList) != len(commandKeys):
+                    raise RuntimeError("Number of cxcalc commands ({}) does not match number of results ({})".format(
+                        len(commandKeys), len(resList)))
+                _createValues(compound, resList, descriptorDict, commandKeys, num_to_create, ord_to_create)
+            individual.extend(failed)
+            num_to_create, ord_to_create = _createThreshold(num_to_create, ord_to_create, verbose)
+
+    for i, compound in enumerate(individual):
         if verbose:
             logger.info("{}; Compound {} ({}/{})".format(compound,
-                                                         compound.pk, i + 1, len(compound_set)))
+                                                         compound.pk, i + 1, len(individual)))
         num_to_create, ord_to_create = _calculate(
             compound, descriptorDict, filtered_cxcalcCommands, verbose=verbose, num_to_create=num_to_create, ord_to_create=ord_to_create)
-        if len(num_to_create) > create_threshold:
-            if verbose:
-                logger.info('Creating {} numeric values'.format(
-                    len(num_to_create)))
-            DRP.models.NumMolDescriptorValue.objects.bulk_create(num_to_create)
-            num_to_create = []
-        if len(ord_to_create) > create_threshold:
-            if verbose:
-                logger.info('Creating {} ordinal values'.format(
-                    len(Ord_to_create)))
-            DRP.models.OrdMolDescriptorValue.objects.bulk_create(ord_to_create)
-            ord_to_create = []
+        num_to_create, ord_to_create = _createThreshold(num_to_create, ord_to_create, verbose)
 
     if verbose:
         logger.info('Creating {} numeric values'.format(len(num_to_create)))
@@ -364,49 +400,8 @@ def _calculate(compound, descriptorDict, cxcalcCommands, verbose=False, num_to_c
                     commandKeys = tuple(cxcalcCommands.keys())
 
                     if len(resList) == len(commandKeys):
-                        for i in range(len(resList)):
-                            if _descriptorDict[commandKeys[i]]['type'] == 'num':
-                                n = DRP.models.NumMolDescriptorValue(descriptor=descriptorDict[commandKeys[
-                                                                     i]], compound=compound, value=float(resList[i]))
-                                # I hate this special case, but this might not
-                                # stick around so I'm leaving it for now
-                                if commandKeys[i] == 'vanderwaals' and 'N' in compound.elements.keys():
-                                    n2 = DRP.models.NumMolDescriptorValue(descriptor=descriptorDict['vdw_area_N_ratio'], compound=compound,
-                                                                          value=float(resList[i]) / compound.elements['N']['stoichiometry'])
-                                else:
-                                    n2 = None
-                                try:
-                                    n.full_clean()
-                                    if n2 is not None:
-                                        n2.full_clean()
-                                except ValidationError as e:
-                                    logger.warning('Value {} for compound {} and descriptor {} failed validation. Value set to None. Validation error message: {}'.format(
-                                        n.value, n.compound, n.descriptor, e))
-                                    n.value = None
-                                num_to_create.append(n)
-                                if n2 is not None:
-                                    num_to_create.append(n2)
-                            elif _descriptorDict[commandKeys[i]]['type'] == 'ord':
-                                o = DRP.models.OrdMolDescriptorValue(descriptor=descriptorDict[commandKeys[
-                                                                     i]], compound=compound, value=int(resList[i]))
-                                try:
-                                    o.full_clean()
-                                except ValidationError as e:
-                                    logger.warning('Value {} for compound {} and descriptor {} failed validation. Value set to None. Validation error message: {}'.format(
-                                        o.value, o.compound, o.descriptor, e))
-                                    o.value = None
-                                ord_to_create.append(o)
-                            else:
-                                return ValueError('Descriptor has unrecognized type {}'.format(_descriptorDict[commandKeys[i]]['type']))
-                            # elif _descriptorDict[commandKeys[i]]['type'] == 'bool':
-                                # Not sure whether cxcalc even returns any boolean values, but if it does I don't know how it notates them and they should be coerced correctly
-                                # commenting out this bit since it should be double checked before anyone uses it
-                                # bool_to_create.append(DRP.models.BoolMolDescriptorValue(descriptor=descriptorDict[commandKeys[i]], compound=compound, bool(int(value=resList[i])))
-                            # NOTE: No categorical descriptors are included yet, and since they are more complicated to code I've left it for the moment.
-                            # NOTE: Calculation failure values are not included in the documentation, so I've assumed that it doesn't happen, since we have no way of identifying
-                            # for it other than for the database to push it out
-                            # as a part of validation procedures.
-
+                        _createValues(compound, resList, descriptorDict, commandKeys,
+                                      num_to_create, ord_to_create)
                     else:
                         raise RuntimeError("Number of cxcalc commands ({}) does not match number of results ({})".format(
                             len(commandKeys), len(resList)))
@@ -419,3 +414,103 @@ def _calculate(compound, descriptorDict, cxcalcCommands, verbose=False, num_to_c
         logger.warning("Compound not found")
 
     return num_to_create, ord_to_create
+
+
+def _createValues(compound, resList, descriptorDict, commandKeys, num_to_create, ord_to_create):
+    """Create descriptor values for a compound from a row of cxcalc output, one entry per command."""
+    for i in range(len(resList)):
+        if _descriptorDict[commandKeys[i]]['type'] == 'num':
+            n = DRP.models.NumMolDescriptorValue(descriptor=descriptorDict[commandKeys[
+                                                 i]], compound=compound, value=float(resList[i]))
+            # I hate this special case, but this might not
+            # stick around so I'm leaving it for now
+            if commandKeys[i] == 'vanderwaals' and 'N' in compound.elements.keys():
+                n2 = DRP.models.NumMolDescriptorValue(descriptor=descriptorDict['vdw_area_N_ratio'], compound=compound,
+                                                      value=float(resList[i]) / compound.elements['N']['stoichiometry'])
+            else:
+                n2 = None
+            try:
+                n.full_clean()
+                if n2 is not None:
+                    n2.full_clean()
+            except ValidationError as e:
+                logger.warning('Value {} for compound {} and descriptor {} failed validation. Value set to None. Validation error message: {}'.format(
+                    n.value, n.compound, n.descriptor, e))
+                n.value = None
+            num_to_create.append(n)
+            if n2 is not None:
+                num_to_create.append(n2)
+        elif _descriptorDict[commandKeys[i]]['type'] == 'ord':
+            o = DRP.models.OrdMolDescriptorValue(descriptor=descriptorDict[commandKeys[
+                                                 i]], compound=compound, value=int(resList[i]))
+            try:
+                o.full_clean()
+            except ValidationError as e:
+                logger.warning('Value {} for compound {} and descriptor {} failed validation. Value set to None. Validation error message: {}'.format(
+                    o.value, o.compound, o.descriptor, e))
+                o.value = None
+            ord_to_create.append(o)
+        else:
+            raise ValueError('Descriptor has unrecognized type {}'.format(_descriptorDict[commandKeys[i]]['type']))
+        # elif _descriptorDict[commandKeys[i]]['type'] == 'bool':
+            # Not sure whether cxcalc even returns any boolean values, but if it does I don't know how it notates them and they should be coerced correctly
+            # commenting out this bit since it should be double checked before anyone uses it
+            # bool_to_create.append(DRP.models.BoolMolDescriptorValue(descriptor=descriptorDict[commandKeys[i]], compound=compound, bool(int(value=resList[i])))
+        # NOTE: No categorical descriptors are included yet, and since they are more complicated to code I've left it for the moment.
+        # NOTE: Calculation failure values are not included in the documentation, so I've assumed that it doesn't happen, since we have no way of identifying
+        # for it other than for the database to push it out
+        # as a part of validation procedures.
+
+
+def _runCxcalc(args):
+    """Run cxcalc with the given arguments, returning a tuple of (return code, stdout, stderr)."""
+    proc = Popen([settings.CHEMAXON_DIR[CHEMAXON_VERSION] + 'cxcalc'] + args,
+                 stdout=PIPE, stderr=PIPE, close_fds=True)
+    out, err = proc.communicate()
+    return proc.returncode, out.decode('UTF-8'), err.decode('UTF-8')
+
+
+def _calculateChunk(compounds, cxcalcCommands):
+    """
+    Calculate the cxcalc results for a chunk of compounds with one leconformer and one cxcalc call.
+
+    Compounds are passed to cxcalc by SMILES, named by their primary key so that the lowest energy
+    conformers (which come back as an sdf) can be matched up with their compounds.
+    Return a tuple of (results, failed), where results is a list of (compound, result list) tuples
+    and failed is a list of compounds which must be calculated individually.
+    """
+    directory = tempfile.mkdtemp(dir=settings.TMP_DIR)
+    try:
+        smilesPath = os.path.join(directory, 'compounds.smiles')
+        with open(smilesPath, 'w') as f:
+            for compound in compounds:
+                f.write('{} {}\n'.format(compound.smiles, compound.pk))
+        returncode, lec, lecErr = _runCxcalc([smilesPath, 'leconformer'])  # lec = lowest energy conformer
+        if returncode != 0:
+            logger.warning("cxcalc leconformer exited with nonzero return code {} for a chunk of {} compounds".format(
+                returncode, len(compounds)))
+            return [], compounds
+        conformers = {}
+        for record in lec.split('$$$$\n'):
+            if record.strip():
+                conformers[record.split('\n', 1)[0].strip()] = record + '$$$$\n'
+        found = [compound for compound in compounds if str(compound.pk) in conformers]
+        failed = [compound for compound in compounds if str(compound.pk) not in conformers]
+        if not found:
+            return [], compounds
+
+        lecPath = os.path.join(directory, 'conformers.sdf')
+        with open(lecPath, 'w') as f:
+            for compound in found:
+                f.write(conformers[str(compound.pk)])
+        # -N ih means leave off the header row and id column
+        returncode, res, resErr = _runCxcalc(['-N', 'ih', lecPath] + [x for x in chain(
+            *(command.split(' ') for command in cxcalcCommands.values()))])
+        resLines = res.split('\n')[:-1]  # last line is blank
+        if returncode != 0 or resErr or len(resLines) != len(found):
+            logger.warning("cxcalc failed for a chunk of {} compounds; calculating them individually".format(
+                len(compounds)))
+            return [], compounds
+        return [(compound, line.split('\t')) for compound, line in zip(found, resLines)], failed
+    finally:
+        shutil.rmtree(directory)
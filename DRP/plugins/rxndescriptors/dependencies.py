@@ -0,0 +1,42 @@
+"""
+The dependencies of reaction descriptors on the data they are calculated from.
+
+A reaction descriptor plugin may define dependencies(), which returns a dictionary
+from each of its descriptor headings to the set of sources (see
+DRP.models.rxnDescriptorChange) that descriptor is calculated from. Plugins
+without it are always recalculated in full.
+"""
+from DRP.models.rxnDescriptorChange import ALL
+from collections import defaultdict
+
+
+class DependencyGraph(object):
+    """The descriptor headings of a set of plugins which depend on each source."""
+
+    def __init__(self, plugins):
+        """Build the graph from the plugins' dependencies."""
+        self.dependents = {}
+        for plugin in plugins:
+            if hasattr(plugin, 'dependencies'):
+                dependents = defaultdict(set)
+                for heading, sources in plugin.dependencies().items():
+                    for source in sources:
+                        dependents[source].add(heading)
+                        if source.startswith('mol:'):
+                            # a change to every molecular descriptor of a role is recorded with '*'
+                            dependents[source.rsplit(':', 1)[0] + ':*'].add(heading)
+                self.dependents[plugin.__name__] = dependents
+
+    def whitelist(self, plugin, sources):
+        """
+        Return the set of the plugin's headings which need recalculating after changes to sources.
+
+        None means that all of them do.
+        """
+        if plugin.__name__ not in self.dependents or ALL in sources:
+            return None
+        dependents = self.dependents[plugin.__name__]
+        headings = set()
+        for source in sources:
+            headings |= dependents.get(source, set())
+        return headings
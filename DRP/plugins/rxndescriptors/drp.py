@@ -1,8 +1,10 @@
 """Basic reaction descriptors calculation module."""
 import logging
 from itertools import chain
+from decimal import Decimal
 
 import xxhash
+import numpy as np
 from numpy import mean, average as wmean
 from scipy.stats import gmean
 from django.db.models import Sum
@@ -11,12 +13,16 @@ import DRP
 from DRP.plugins.moldescriptors.chemaxon import _pHDependentDescriptors
 from .utils import setup
 from DRP.chemical_data import elements
+from DRP.models.rxnDescriptorChange import quantitySource, molSource, rxnSource, FORMULA
 
 logger = logging.getLogger(__name__)
 
 calculatorSoftware = 'DRP'
 # number of values to create at a time. Should probably be <= 5000
 create_threshold = 5000
+# number of reactions calculated together by calculate_many. All of the values
+# for a chunk are held in memory before they are created.
+calculate_chunk_size = 200
 
 _descriptorDict = {}
 
@@ -162,6 +168,52 @@ def make_dict():
     descriptorDict = setup(_descriptorDict)
     return descriptorDict, _reaction_pH_Descriptors
 
+
+def dependencies():
+    """Return the sources (see DRP.models.rxnDescriptorChange) that each descriptor is calculated from, by heading."""
+    weightings = ('molarity', 'count')
+    roles = list(DRP.models.CompoundRole.objects.all())
+    allQuantities = set(quantitySource(role.label) for role in roles)
+    deps = {'boolean_crystallisation_outcome': {rxnSource('crystallisation_outcome')}}
+    for element in elements:
+        deps[element + '_mols'] = allQuantities | {FORMULA}
+
+    for compoundRole in roles:
+        quantities = quantitySource(compoundRole.label)
+        for w in weightings:
+            deps['{}_amount_{}'.format(compoundRole.label, w)] = {quantities}
+        for descriptor in DRP.models.CatMolDescriptor.objects.all():
+            sources = {quantities, molSource(compoundRole.label, descriptor.heading)}
+            for w in weightings:
+                for permValue in descriptor.permittedValues.all():
+                    deps['{}_{}_{}_{}'.format(compoundRole.label, descriptor.csvHeader, permValue.value, w)] = sources
+        for descriptor in DRP.models.OrdMolDescriptor.objects.all():
+            sources = {quantities, molSource(compoundRole.label, descriptor.heading)}
+            for w in weightings:
+                for i in range(descriptor.minimum, descriptor.maximum + 1):
+                    deps['{}_{}_{}_{}'.format(compoundRole.label, descriptor.csvHeader, i, w)] = sources
+        for descriptor in DRP.models.BoolMolDescriptor.objects.all():
+            sources = {quantities, molSource(compoundRole.label, descriptor.heading)}
+            for w in weightings:
+                for value in ('True', 'False'):
+                    deps['{}_{}_{}_{}'.format(compoundRole.label, descriptor.csvHeader, value, w)] = sources
+            deps['{}_{}_any'.format(compoundRole.label, descriptor.csvHeader)] = sources
+        numDescriptors = list(DRP.models.NumMolDescriptor.objects.all())
+        for descriptor in numDescriptors:
+            sources = {quantities, molSource(compoundRole.label, descriptor.heading)}
+            for aggregate in ('Max', 'Range', 'gmean_molarity', 'gmean_count'):
+                deps['{}_{}_{}'.format(compoundRole.label, descriptor.csvHeader, aggregate)] = sources
+
+        # the reaction pH descriptors are copied from those for the reaction's pH.
+        for heading, d in _pHDependentDescriptors.items():
+            sources = {quantities, rxnSource('reaction_pH')} | set(
+                molSource(compoundRole.label, descriptor.heading) for descriptor in numDescriptors
+                if descriptor.heading.startswith(heading + '_pH'))
+            prefix = '{}_{}_pHreaction_{}_{}'.format(compoundRole.label, heading, d['calculatorSoftware'], d['calculatorSoftwareVersion'])
+            for aggregate in ('Max', 'Range', 'gmean_molarity', 'gmean_count'):
+                deps['{}_{}'.format(prefix, aggregate)] = sources
+    return deps
+
 # There's a lot of DRY violation here because I was playing with a few different methods.
 # We should decide which method we want for deletion and work on
 # variations of that. -GMN
@@ -332,7 +384,74 @@ def _delete_values(reaction_set, descriptors_to_delete):
 
 
 def calculate_many(reaction_set, verbose=False, bulk_delete=False, whitelist=None):
-    """Calculate descriptors for this plugin for an entire set of reactions."""
+    """
+    Calculate descriptors for this plugin for an entire set of reactions.
+
+    The reactions are calculated calculate_chunk_size at a time by _calculateBulk,
+    giving exactly the values that _calculateManyPerReaction would.
+    """
+    if verbose:
+        logger.info("Creating descriptor dictionary")
+    descriptorDict, _reaction_pH_Descriptors = make_dict()
+    # We're about to use it and leaving it lazy obscures where time is being
+    # spent
+    descriptorDict.initialise(descriptorDict.descDict)
+
+    if whitelist is None:
+        descs_to_delete = descriptorDict.values()
+    else:
+        descs_to_delete = [descriptorDict[k]
+                           for k in descriptorDict.keys() if k in whitelist]
+
+    reactions = list(reaction_set)
+    if bulk_delete:
+        if verbose:
+            logger.info("Deleting all old descriptor values")
+        _delete_values(reactions, descs_to_delete)
+
+    molDescriptors = _molDescriptors()
+    for start in range(0, len(reactions), calculate_chunk_size):
+        chunk = reactions[start:start + calculate_chunk_size]
+        if verbose:
+            logger.info("Reactions {}-{} of {}".format(start + 1,
+                                                      start + len(chunk), len(reactions)))
+        if not bulk_delete:
+            if verbose:
+                logger.info("Deleting old descriptor values")
+            _delete_values(chunk, descs_to_delete)
+
+        if verbose:
+            logger.info("Calculating new values.")
+        num_vals_to_create, bool_vals_to_create = _calculateBulk(
+            chunk, descriptorDict, molDescriptors, whitelist=whitelist)
+
+        if verbose:
+            logger.info("Creating {} Numeric values".format(
+                len(num_vals_to_create)))
+        DRP.models.NumRxnDescriptorValue.objects.bulk_create(
+            num_vals_to_create, batch_size=create_threshold)
+        if verbose:
+            logger.info("Creating {} Boolean values".format(
+                len(bool_vals_to_create)))
+        DRP.models.BoolRxnDescriptorValue.objects.bulk_create(
+            bool_vals_to_create, batch_size=create_threshold)
+
+        # the reaction pH descriptors are copied from values created above.
+        num_vals_to_create = _calculateRxnpHBulk(
+            chunk, descriptorDict, _reaction_pH_Descriptors, whitelist=whitelist)
+        if verbose:
+            logger.info("Creating {} reaction pH values".format(
+                len(num_vals_to_create)))
+        DRP.models.NumRxnDescriptorValue.objects.bulk_create(
+            num_vals_to_create, batch_size=create_threshold)
+
+
+def _calculateManyPerReaction(reaction_set, verbose=False, bulk_delete=False, whitelist=None):
+    """
+    Calculate descriptors for an entire set of reactions, one reaction at a time.
+
+    This is much slower than calculate_many, but is kept as the reference implementation.
+    """
     if verbose:
         logger.info("Creating descriptor dictionary")
     descriptorDict, _reaction_pH_Descriptors = make_dict()
@@ -757,3 +876,380 @@ def _calculateRxnpH(reaction, descriptorDict, _reaction_pH_Descriptors, verbose=
                             descriptor=d, reaction=reaction, value=pH_descriptor_value)
                         vals_to_create.append(reaction_pH_dv)
     return vals_to_create
+
+
+def _molDescriptors():
+    """Return the compound roles and molecular descriptors which reaction descriptors aggregate over."""
+    return {
+        'roles': list(DRP.models.CompoundRole.objects.all()),
+        'num': list(DRP.models.NumMolDescriptor.objects.all()),
+        'ord': list(DRP.models.OrdMolDescriptor.objects.all()),
+        'bool': list(DRP.models.BoolMolDescriptor.objects.all()),
+        'cat': [(descriptor, list(descriptor.permittedValues.all())) for descriptor in DRP.models.CatMolDescriptor.objects.all()],
+    }
+
+
+def _reduceat(ufunc, values, starts):
+    """Reduce runs of rows of values beginning at starts with ufunc, allowing there to be no runs."""
+    if len(starts) == 0:
+        return np.zeros((0,) + values.shape[1:], dtype=values.dtype)
+    return ufunc.reduceat(values, starts, axis=0)
+
+
+def _runStarts(keys):
+    """Return the indices at which runs of equal values begin in keys."""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.intp)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _molValueMatrix(valueModel, descriptors, compoundIndex, dtype):
+    """
+    Return arrays of (values, valid) indexed by [compound, descriptor].
+
+    valid is False where the compound has no value for the descriptor or the value is NULL.
+    """
+    values = np.zeros((len(compoundIndex), len(descriptors)), dtype=dtype)
+    valid = np.zeros(values.shape, dtype=bool)
+    descriptorIndex = {descriptor.pk: j for j, descriptor in enumerate(descriptors)}
+    if descriptorIndex and compoundIndex:
+        for compound_id, descriptor_id, value in valueModel.objects.filter(
+                compound__in=list(compoundIndex), descriptor__in=list(descriptorIndex)).values_list('compound_id', 'descriptor_id', 'value'):
+            if value is not None:
+                values[compoundIndex[compound_id], descriptorIndex[descriptor_id]] = value
+                valid[compoundIndex[compound_id], descriptorIndex[descriptor_id]] = True
+    return values, valid
+
+
+def _calculateBulk(reactions, descriptorDict, molDescriptors, whitelist=None):
+    """
+    Calculate the values of _calculate for a list of reactions at once.
+
+    The compound quantities and molecular descriptor values of all of the reactions are
+    read in a few queries, and aggregated as arrays grouped by reaction and compound role.
+    Sums of amounts are done on integer multiples of the amount field's precision, and
+    sums of element mols in primary key order, so the values are exactly those of _calculate.
+    """
+    num = DRP.models.NumRxnDescriptorValue
+    boolean = DRP.models.BoolRxnDescriptorValue
+    roles = molDescriptors['roles']
+    num_vals_to_create = []
+    bool_vals_to_create = []
+
+    rxnIndex = {reaction.pk: r for r, reaction in enumerate(reactions)}
+    roleIndex = {role.pk: k for k, role in enumerate(roles)}
+    quantities = list(DRP.models.CompoundQuantity.objects.filter(reaction__in=list(rxnIndex)).order_by(
+        'reaction', 'pk').values_list('reaction_id', 'role_id', 'compound_id', 'amount'))
+    compoundIndex = {}
+    for quantity in quantities:
+        compoundIndex.setdefault(quantity[2], len(compoundIndex))
+
+    qRxn = np.array([rxnIndex[quantity[0]] for quantity in quantities], dtype=np.intp)
+    qRole = np.array([roleIndex[quantity[1]] for quantity in quantities], dtype=np.intp)
+    qCompound = np.array([compoundIndex[quantity[2]] for quantity in quantities], dtype=np.intp)
+    amounts = [quantity[3] for quantity in quantities]
+    qNone = np.array([amount is None for amount in amounts], dtype=bool)
+    qAmount = np.array([np.nan if amount is None else float(amount) for amount in amounts], dtype=np.float64)
+    places = DRP.models.CompoundQuantity._meta.get_field('amount').decimal_places
+    qUnits = np.array([0 if amount is None else int(amount.scaleb(places)) for amount in amounts], dtype=np.int64)
+
+    def molarity(units):
+        return float(Decimal(int(units)).scaleb(-places))
+
+    # Mols of each element, adding each reaction's quantities one at a time in
+    # primary key order, as the python sum in _calculate does.
+    elementList = list(elements)
+    elementIndex = {element: k for k, element in enumerate(elementList)}
+    stoichiometry = np.zeros((len(compoundIndex), len(elementList)))
+    for compound in DRP.models.Compound.objects.filter(pk__in=list(compoundIndex)):
+        for element, d in compound.elements.items():
+            if element in elementIndex:
+                stoichiometry[compoundIndex[compound.pk], elementIndex[element]] = float(d['stoichiometry'])
+    rxnStarts = _runStarts(qRxn)
+    position = np.arange(len(quantities)) - np.repeat(rxnStarts, np.diff(np.r_[rxnStarts, len(quantities)]))
+    elementMols = np.zeros((len(reactions), len(elementList)))
+    for p in range(position.max() + 1 if len(position) else 0):
+        at = (position == p)
+        elementMols[qRxn[at]] += stoichiometry[qCompound[at]] * qAmount[at, np.newaxis]
+    rxnNone = np.bincount(qRxn[qNone], minlength=len(reactions)) > 0
+
+    # Group the quantities by reaction and role, keeping primary key order within groups.
+    order = np.lexsort((np.arange(len(quantities)), qRole, qRxn))
+    gCompound = qCompound[order]
+    gNoneQ = qNone[order]
+    gUnitsQ = qUnits[order]
+    gStart = _runStarts(qRxn[order] * len(roles) + qRole[order])
+    gSize = np.diff(np.r_[gStart, len(quantities)])
+    groups = {(int(qRxn[order[s]]), int(qRole[order[s]])): g for g, s in enumerate(gStart)}
+    roleNone = _reduceat(np.logical_or, gNoneQ, gStart)
+    roleUnits = _reduceat(np.add, gUnitsQ, gStart)
+    # _calculate counts descriptor values per compound, so groups with a compound
+    # repeated never have the right number of values.
+    distinct = np.ones(len(gStart), dtype=bool)
+    if len(quantities):
+        pairs = np.sort(np.repeat(np.arange(len(gStart)), gSize) * len(compoundIndex) + gCompound)
+        distinct[pairs[1:][pairs[1:] == pairs[:-1]] // len(compoundIndex)] = False
+
+    def aggregate(values, valid):
+        """Return whether each group has a full set of values, and those values in group order."""
+        groupValues = values[gCompound]
+        return distinct[:, np.newaxis] & _reduceat(np.logical_and, valid[gCompound], gStart), groupValues
+
+    def matching(matches):
+        """Return the count, whether any amount is NULL, and the summed amount of the matching quantities of each group."""
+        return (_reduceat(np.add, matches.astype(np.int64), gStart),
+                _reduceat(np.logical_or, matches & gNoneQ[:, np.newaxis], gStart),
+                _reduceat(np.add, np.where(matches, gUnitsQ[:, np.newaxis], 0), gStart))
+
+    numOk, numValues = aggregate(*_molValueMatrix(DRP.models.NumMolDescriptorValue,
+                                                  molDescriptors['num'], compoundIndex, np.float64))
+    numMax = _reduceat(np.maximum, numValues, gStart)
+    numMin = _reduceat(np.minimum, numValues, gStart)
+
+    ordOk, ordValues = aggregate(*_molValueMatrix(DRP.models.OrdMolDescriptorValue,
+                                                  molDescriptors['ord'], compoundIndex, np.int64))
+    ordMatching = [matching(ordValues[:, [j]] == np.arange(descriptor.minimum, descriptor.maximum + 1))
+                   for j, descriptor in enumerate(molDescriptors['ord'])]
+
+    boolOk, boolValues = aggregate(*_molValueMatrix(DRP.models.BoolMolDescriptorValue,
+                                                    molDescriptors['bool'], compoundIndex, bool))
+    boolMatching = [matching(boolValues[:, [j]] == np.array([True, False]))
+                    for j in range(len(molDescriptors['bool']))]
+
+    catOk, catValues = aggregate(*_molValueMatrix(DRP.models.CatMolDescriptorValue,
+                                                  [descriptor for descriptor, permValues in molDescriptors['cat']], compoundIndex, np.int64))
+    catMatching = [matching(catValues[:, [j]] == np.array([permValue.pk for permValue in permValues], dtype=np.int64))
+                   for j, (descriptor, permValues) in enumerate(molDescriptors['cat'])]
+
+    heading = 'boolean_crystallisation_outcome'
+    if whitelist is None or heading in whitelist:
+        outcomes = dict(DRP.models.OrdRxnDescriptorValue.objects.filter(
+            descriptor__heading='crystallisation_outcome', descriptor__calculatorSoftware='manual',
+            reaction__in=list(rxnIndex)).values_list('reaction_id', 'value'))
+
+    for r, reaction in enumerate(reactions):
+        heading = 'boolean_crystallisation_outcome'
+        if whitelist is None or heading in whitelist:
+            four_class = outcomes.get(reaction.pk)
+            bool_vals_to_create.append(boolean(
+                reaction=reaction,
+                descriptor=descriptorDict[heading],
+                value=None if four_class is None else (four_class > 2),
+            ))
+
+        for k, element in enumerate(elementList):
+            heading = element + '_mols'
+            if whitelist is None or heading in whitelist:
+                num_vals_to_create.append(num(
+                    reaction=reaction,
+                    descriptor=descriptorDict[heading],
+                    value=None if rxnNone[r] else float(elementMols[r, k]),
+                ))
+
+        for k, compoundRole in enumerate(roles):
+            g = groups.get((r, k))
+            heading = '{}_amount_count'.format(compoundRole.label)
+            if whitelist is None or heading in whitelist:
+                num_vals_to_create.append(num(
+                    reaction=reaction,
+                    descriptor=descriptorDict[heading],
+                    value=0 if g is None else int(gSize[g]),
+                ))
+
+            if g is None:
+                roleMoles = 0
+            elif roleNone[g]:
+                roleMoles = None
+            else:
+                roleMoles = Decimal(int(roleUnits[g])).scaleb(-places)
+            heading = '{}_amount_molarity'.format(compoundRole.label)
+            if whitelist is None or heading in whitelist:
+                num_vals_to_create.append(num(
+                    reaction=reaction,
+                    descriptor=descriptorDict[heading],
+                    value=None if roleMoles is None else float(roleMoles),
+                ))
+
+            if g is None:
+                continue
+            s, e = gStart[g], gStart[g] + gSize[g]
+            fractions = None
+
+            for j, descriptor in enumerate(molDescriptors['num']):
+                if not numOk[g, j]:
+                    continue
+                heading = '{}_{}_{}'.format(
+                    compoundRole.label, descriptor.csvHeader, 'Max')
+                if whitelist is None or heading in whitelist:
+                    num_vals_to_create.append(num(
+                        reaction=reaction,
+                        descriptor=descriptorDict[heading],
+                        value=float(numMax[g, j]),
+                    ))
+                heading = '{}_{}_{}'.format(
+                    compoundRole.label, descriptor.csvHeader, 'Range')
+                if whitelist is None or heading in whitelist:
+                    num_vals_to_create.append(num(
+                        reaction=reaction,
+                        descriptor=descriptorDict[heading],
+                        value=float(numMax[g, j] - numMin[g, j]),
+                    ))
+                values = numValues[s:e, j]
+                for weighting in ('molarity', 'count'):
+                    heading = '{}_{}_{}_{}'.format(
+                        compoundRole.label, descriptor.csvHeader, 'gmean', weighting)
+                    if whitelist is None or heading in whitelist:
+                        n = num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                        )
+                        if roleMoles == 0 or roleMoles is None:
+                            n.value = None
+                        elif (values == 0).any():
+                            n.value = 0
+                        elif (values < 0).any():
+                            raise ValueError(
+                                'Cannot take geometric mean of negative values. This descriptor ({}) should not use a geometric mean.'.format(descriptor))
+                        elif weighting == 'molarity':
+                            if fractions is None:
+                                fractions = np.array([float(amounts[q] / roleMoles) for q in order[s:e]])
+                            n.value = gmean(values * fractions)
+                        else:
+                            n.value = gmean(values)
+                        num_vals_to_create.append(n)
+
+            for j, descriptor in enumerate(molDescriptors['ord']):
+                if not ordOk[g, j]:
+                    continue
+                counts, anyNone, units = ordMatching[j]
+                for v, i in enumerate(range(descriptor.minimum, descriptor.maximum + 1)):
+                    heading = '{}_{}_{}_count'.format(
+                        compoundRole.label, descriptor.csvHeader, i)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=int(counts[g, v]),
+                        ))
+                    heading = '{}_{}_{}_molarity'.format(
+                        compoundRole.label, descriptor.csvHeader, i)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=None if anyNone[g, v] else molarity(units[g, v]),
+                        ))
+
+            for j, descriptor in enumerate(molDescriptors['bool']):
+                if not boolOk[g, j]:
+                    continue
+                counts, anyNone, units = boolMatching[j]
+                for v, i in enumerate((True, False)):
+                    heading = '{}_{}_{}_count'.format(
+                        compoundRole.label, descriptor.csvHeader, i)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=int(counts[g, v]),
+                        ))
+                    heading = '{}_{}_{}_molarity'.format(
+                        compoundRole.label, descriptor.csvHeader, i)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=None if anyNone[g, v] else molarity(units[g, v]),
+                        ))
+                heading = '{}_{}_any'.format(
+                    compoundRole.label, descriptor.csvHeader)
+                if whitelist is None or heading in whitelist:
+                    # _calculate takes any() of the value objects themselves, which
+                    # is True whenever there are any.
+                    bool_vals_to_create.append(boolean(
+                        reaction=reaction,
+                        descriptor=descriptorDict[heading],
+                        value=True,
+                    ))
+
+            for j, (descriptor, permValues) in enumerate(molDescriptors['cat']):
+                if not catOk[g, j]:
+                    continue
+                counts, anyNone, units = catMatching[j]
+                for v, permValue in enumerate(permValues):
+                    heading = '{}_{}_{}_count'.format(
+                        compoundRole.label, descriptor.csvHeader, permValue.value)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=int(counts[g, v]),
+                        ))
+                    heading = '{}_{}_{}_molarity'.format(
+                        compoundRole.label, descriptor.csvHeader, permValue.value)
+                    if whitelist is None or heading in whitelist:
+                        num_vals_to_create.append(num(
+                            reaction=reaction,
+                            descriptor=descriptorDict[heading],
+                            value=None if anyNone[g, v] else molarity(units[g, v]),
+                        ))
+    return num_vals_to_create, bool_vals_to_create
+
+
+def _uniqueValues(pairs):
+    """
+    Return a dictionary of (key, value) pairs, where a key is a reaction pk or a (reaction pk, heading) pair.
+
+    As the get() calls of _calculateRxnpH did, raise MultipleObjectsReturned if a key has more
+    than one value, rather than choosing one of them.
+    """
+    values = {}
+    for key, value in pairs:
+        if key in values:
+            raise DRP.models.NumRxnDescriptorValue.MultipleObjectsReturned(
+                'Found more than one value for {} when calculating reaction pH descriptors'.format(key))
+        values[key] = value
+    return values
+
+
+def _calculateRxnpHBulk(reactions, descriptorDict, _reaction_pH_Descriptors, whitelist=None):
+    """Calculate the values of _calculateRxnpH for a list of reactions at once."""
+    headings = [heading for heading in _reaction_pH_Descriptors.keys()
+                if whitelist is None or heading in whitelist]
+    pks = [reaction.pk for reaction in reactions]
+    reaction_pHs = _uniqueValues(DRP.models.NumRxnDescriptorValue.objects.filter(
+        reaction__in=pks, descriptor__heading='reaction_pH').values_list('reaction_id', 'value'))
+
+    sources = {}
+    for reaction in reactions:
+        reaction_pH = reaction_pHs.get(reaction.pk)
+        if reaction_pH is not None:
+            reaction_pH_string = str(reaction_pH).replace(
+                '.', '_')  # R compatibility
+            for heading in headings:
+                sources[reaction.pk, heading] = descriptorDict[heading].heading.replace(
+                    '_pHreaction_', '_pH{}_'.format(reaction_pH_string))
+    found = {}
+    if sources:
+        found = _uniqueValues(((reaction_id, heading), value) for reaction_id, heading, value in DRP.models.NumRxnDescriptorValue.objects.filter(
+            reaction__in=pks, descriptor__heading__in=set(sources.values())).values_list('reaction_id', 'descriptor__heading', 'value'))
+
+    vals_to_create = []
+    for reaction in reactions:
+        if reaction.pk not in reaction_pHs:
+            logger.warning(
+                'Reaction {} has no pH value. Cannot create reaction pH descriptors'.format(reaction))
+        elif reaction_pHs[reaction.pk] is not None:
+            for heading in headings:
+                reaction_pH_descriptor_heading = sources[reaction.pk, heading]
+                if (reaction.pk, reaction_pH_descriptor_heading) in found:
+                    vals_to_create.append(DRP.models.NumRxnDescriptorValue(
+                        descriptor=descriptorDict[heading], reaction=reaction,
+                        value=found[reaction.pk, reaction_pH_descriptor_heading]))
+                elif heading.startswith('pH_') or heading.startswith('Ox_'):
+                    logger.warning(
+                        'Could not find descriptor value for a pH or Ox role descriptor.')
+                else:
+                    logger.warning('Could not find descriptor value for descriptor {} and reaction {}'.format(
+                        reaction_pH_descriptor_heading, reaction))
+    return vals_to_create
@@ -6,6 +6,7 @@ import xxhash
 
 import DRP
 from DRP.chemical_data import elements
+from DRP.models.rxnDescriptorChange import quantitySource
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,11 @@ _descriptorDict = {
 descriptorDict = setup(_descriptorDict)
 
 
+def dependencies():
+    """Return the sources (see DRP.models.rxnDescriptorChange) that each descriptor is calculated from, by heading."""
+    return {'rxnSpaceHash1': set(quantitySource(role.label) for role in DRP.models.CompoundRole.objects.all())}
+
+
 def calculate_many(reaction_set, verbose=False, whitelist=None):
     """Calculate descriptors for this plugin for an entire set of reactions."""
     if verbose:
@@ -0,0 +1,245 @@
+"""
+Recommend reactions by scoring a grid of candidates built around a seed reaction.
+
+recommend.py built candidate reactions one row at a time in nested loops over the
+masses, pH, time and temperature, and scored each reactant combination separately.
+Here the candidates for a seed reaction are the Cartesian product of:
+
+    the substitutes for each of its compounds, from a similarity map,
+    a range of amounts for each of its compounds,
+    and a range of levels for each reaction condition,
+
+and are numbered in C order over those axes. They are made as arrays a batch at a time,
+their role-aggregated descriptors (as calculated by the DRP reaction descriptor plugin)
+are computed with array operations, each batch is scored in one call to the model and
+only the best k candidates are kept, in a heap.
+"""
+from DRP.models import CompoundQuantity, CompoundSimilarity, CompoundRole, NumMolDescriptor, NumMolDescriptorValue
+from DRP.plugins.rxndescriptors.drp import calculatorSoftware
+from collections import namedtuple, OrderedDict
+import heapq
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+aggregateVersion = '0_02'
+"""The calculatorSoftwareVersion of the role-aggregated descriptors of the DRP plugin."""
+
+Candidate = namedtuple('Candidate', ('score', 'number', 'compounds', 'amounts', 'conditions'))
+"""A recommended reaction: its score, its number in the grid, and its compound pks, amounts and condition values."""
+
+
+def levels(low, high, steps, integer=False):
+    """
+    Return steps evenly spaced values from low up to, but not including, high.
+
+    These are the values of recommend.frange, rounded to five places, or truncated to
+    integers if integer is True.
+    """
+    values = np.round(low + (high - low) * np.arange(steps) / float(steps), 5)
+    return np.trunc(values) if integer else values
+
+
+def rxnHeader(heading):
+    """Return the csvHeader of a reaction descriptor calculated by the DRP plugin."""
+    return '{}_{}_{}'.format(heading, calculatorSoftware, aggregateVersion)
+
+
+def _gmean(values):
+    """Return the geometric means of the rows of a matrix of non-negative values, which are 0 if any value is."""
+    with np.errstate(divide='ignore'):
+        return np.exp(np.log(values).mean(axis=1))
+
+
+def roleDescriptors(compounds, amounts, roles, compoundValues, molHeaders, allRoles=()):
+    """
+    Return a tuple of (matrix, headers) of the role-aggregated descriptors of candidate reactions.
+
+    compounds and amounts have a row for each candidate and a column for each compound slot,
+    holding the index of the compound in compoundValues and its amount in mols. roles gives the
+    compound role label of each slot. compoundValues has a row for each compound and a column
+    for each numeric molecular descriptor, with csvHeaders molHeaders, and is NaN for missing values.
+    allRoles are the labels of any other roles, which the candidates have no compounds in; as
+    in the plugin, their counts and amounts are 0 and their other descriptors are missing.
+
+    As in the plugin, a role's Max, Range and geometric means are missing if any of its compounds
+    lacks a value, its compounds are not distinct or (for the geometric means) its amount is zero.
+    """
+    numCandidates = len(compounds)
+    columns = []
+    headers = []
+    for role in sorted(set(roles)):
+        slots = [s for s, r in enumerate(roles) if r == role]
+        roleCompounds = compounds[:, slots]
+        roleAmounts = amounts[:, slots]
+        roleMoles = roleAmounts.sum(axis=1)
+        columns += [np.full(numCandidates, float(len(slots))), roleMoles]
+        headers += [rxnHeader('{}_amount_count'.format(role)), rxnHeader('{}_amount_molarity'.format(role))]
+
+        ordered = np.sort(roleCompounds, axis=1)
+        distinct = (ordered[:, 1:] != ordered[:, :-1]).all(axis=1)
+        fractions = roleAmounts / np.where(roleMoles == 0, np.nan, roleMoles)[:, np.newaxis]
+        for j, molHeader in enumerate(molHeaders):
+            values = compoundValues[roleCompounds, j]
+            if (values < 0).any():
+                raise ValueError(
+                    'Cannot take geometric mean of negative values. This descriptor ({}) should not use a geometric mean.'.format(molHeader))
+            valid = distinct & ~np.isnan(values).any(axis=1)
+            maximum = np.where(valid, values.max(axis=1), np.nan)
+            columns += [maximum, maximum - values.min(axis=1),
+                        np.where(valid, _gmean(values * fractions), np.nan),
+                        np.where(valid & (roleMoles != 0), _gmean(values), np.nan)]
+            headers += [rxnHeader('{}_{}_{}'.format(role, molHeader, aggregate))
+                        for aggregate in ('Max', 'Range', 'gmean_molarity', 'gmean_count')]
+    for role in sorted(set(allRoles) - set(roles)):
+        columns += [np.zeros(numCandidates), np.zeros(numCandidates)]
+        headers += [rxnHeader('{}_amount_count'.format(role)), rxnHeader('{}_amount_molarity'.format(role))]
+    matrix = np.column_stack(columns) if columns else np.zeros((numCandidates, 0))
+    return matrix, headers
+
+
+def _uniqueRows(matrix):
+    """Return a tuple of (the distinct rows of a matrix in sorted order, the index of each row among them)."""
+    order = np.lexsort(matrix.T[::-1]) if matrix.shape[1] else np.arange(len(matrix))
+    ordered = matrix[order]
+    first = np.ones(len(matrix), dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    inverse = np.empty(len(matrix), dtype=np.intp)
+    inverse[order] = np.cumsum(first) - 1
+    return ordered[first], inverse
+
+
+class CandidateGrid(object):
+    """The grid of candidate reactions around a seed reaction."""
+
+    def __init__(self, substitutes, amounts, roles, conditions=None, allRoles=None):
+        """
+        Describe the grid.
+
+        substitutes and amounts give, for each compound slot of the seed reaction, an array of
+        the pks of the compounds which may fill it and an array of the amounts (in mols) to try;
+        roles gives the compound role label of each slot. conditions is an ordered dictionary
+        from the csvHeader of each reaction condition descriptor to an array of its levels.
+        allRoles are the labels of every compound role, by default those in the database, so that
+        the candidates have descriptors for the roles which the seed has no compounds in too.
+        """
+        self.substitutes = [np.asarray(s, dtype=np.int64) for s in substitutes]
+        self.amounts = [np.asarray(a, dtype=np.float64) for a in amounts]
+        self.roles = list(roles)
+        if allRoles is None:
+            allRoles = CompoundRole.objects.values_list('label', flat=True)
+        self.allRoles = list(allRoles)
+        self.conditions = OrderedDict((header, np.asarray(values, dtype=np.float64))
+                                      for header, values in (conditions or {}).items())
+        self.shape = tuple(len(a) for a in self.substitutes + self.amounts + list(self.conditions.values()))
+        self.size = int(np.prod(self.shape, dtype=np.int64))
+
+    @classmethod
+    def fromSeed(cls, reaction, similarityMap=None, conditions=None, amountSteps=4, radius=0.25, numSubstitutes=None):
+        """
+        Return the grid around a seed reaction.
+
+        similarityMap is a dictionary from a compound pk to a list of (pk, similarity) pairs of
+        the compounds which may replace it; each compound is always tried as itself. By default,
+        the numSubstitutes (or all) compounds kept by the compound similarity index are used. Each amount
+        ranges over amountSteps levels from (1 - radius) to (1 + radius) times the seed's amount.
+        conditions is as for the constructor.
+        """
+        quantities = list(CompoundQuantity.objects.filter(reaction=reaction).order_by('pk').select_related('role'))
+        if any(quantity.amount is None for quantity in quantities):
+            raise ValueError('Reaction {} has a compound with no amount'.format(reaction.pk))
+        if similarityMap is None:
+            similarityMap = CompoundSimilarity.objects.similarityMap(
+                [quantity.compound_id for quantity in quantities], k=numSubstitutes)
+        substitutes = []
+        for quantity in quantities:
+            pks = [quantity.compound_id] + [pk for pk, similarity in similarityMap.get(quantity.compound_id, ())]
+            substitutes.append(list(OrderedDict.fromkeys(pks)))
+        amounts = [levels(float(quantity.amount) * (1 - radius), float(quantity.amount) * (1 + radius), amountSteps)
+                   for quantity in quantities]
+        return cls(substitutes, amounts, [quantity.role.label for quantity in quantities], conditions)
+
+    def candidates(self, numbers):
+        """Return arrays of (compound pks, amounts, condition values) of the candidates with the given numbers."""
+        indices = np.unravel_index(np.asarray(numbers, dtype=np.int64), self.shape)
+        numSlots = len(self.substitutes)
+        compounds = np.column_stack([s[i] for s, i in zip(self.substitutes, indices[:numSlots])]) \
+            if numSlots else np.zeros((len(numbers), 0), dtype=np.int64)
+        amounts = np.column_stack([a[i] for a, i in zip(self.amounts, indices[numSlots:2 * numSlots])]) \
+            if numSlots else np.zeros((len(numbers), 0))
+        conditions = np.column_stack([c[i] for c, i in zip(self.conditions.values(), indices[2 * numSlots:])]) \
+            if self.conditions else np.zeros((len(numbers), 0))
+        return compounds, amounts, conditions
+
+    def compoundValues(self, molDescriptors=None):
+        """
+        Return a tuple of (compound pks, values, csvHeaders) of the numeric molecular descriptors of the compounds in the grid.
+
+        values has a row for each compound pk and a column for each descriptor, NaN where there is no value.
+        """
+        if molDescriptors is None:
+            molDescriptors = list(NumMolDescriptor.objects.all())
+        pks = np.unique(np.concatenate(self.substitutes)) if self.substitutes else np.zeros(0, dtype=np.int64)
+        descriptorIndex = {descriptor.pk: j for j, descriptor in enumerate(molDescriptors)}
+        values = np.full((len(pks), len(molDescriptors)), np.nan)
+        for compound_id, descriptor_id, value in NumMolDescriptorValue.objects.filter(
+                compound__in=pks.tolist(), descriptor__in=list(descriptorIndex)).values_list('compound_id', 'descriptor_id', 'value'):
+            if value is not None:
+                values[np.searchsorted(pks, compound_id), descriptorIndex[descriptor_id]] = value
+        return pks, values, [descriptor.csvHeader for descriptor in molDescriptors]
+
+    def features(self, compounds, amounts, conditions, compoundPks, compoundValues, molHeaders):
+        """Return a tuple of (matrix, headers) of the descriptors of candidates given as by the candidates method."""
+        matrix, headers = roleDescriptors(np.searchsorted(compoundPks, compounds), amounts, self.roles,
+                                          compoundValues, molHeaders, self.allRoles)
+        return np.hstack((matrix, conditions)), headers + list(self.conditions.keys())
+
+    def recommend(self, score, k=10, batchSize=20000, exclude=(), molDescriptors=None, neighbourIndex=None,
+                  minDistance=0.0, verbose=False):
+        """
+        Return the k best candidates, as a list of Candidates in descending order of score.
+
+        score is called with a matrix of descriptor values and its headers, such as a built
+        ModelContainer's scoreMatrix, and returns a score for each row. The candidates are scored
+        batchSize at a time, bounding the memory used, or all at once if batchSize is None.
+        Candidates whose set of compounds is in exclude (an iterable of tuples of compound pks),
+        such as those already tried, are skipped, as are those with a NaN score. If a ReactionNeighbourIndex of the reactions already tried
+        is given, candidates no further than minDistance from the nearest of them are skipped too.
+        Ties go to the candidate earlier in the grid.
+        """
+        if k < 1:
+            return []
+        compoundPks, compoundValues, molHeaders = self.compoundValues(molDescriptors)
+        excluded = set(tuple(sorted(pks)) for pks in exclude)
+        batchSize = batchSize or max(self.size, 1)
+        heap = []
+        for start in range(0, self.size, batchSize):
+            numbers = np.arange(start, min(start + batchSize, self.size), dtype=np.int64)
+            compounds, amounts, conditions = self.candidates(numbers)
+            matrix, headers = self.features(compounds, amounts, conditions, compoundPks, compoundValues, molHeaders)
+            scores = np.asarray(score(matrix, headers), dtype=np.float64)
+            keep = ~np.isnan(scores)
+            if neighbourIndex is not None and len(neighbourIndex):
+                nearestDistances = neighbourIndex.query(matrix, k=1, headers=headers)[0][:, 0]
+                keep &= nearestDistances > minDistance
+            if excluded:
+                combinations, inverse = _uniqueRows(np.sort(compounds, axis=1))
+                keep &= ~np.array([tuple(c) in excluded for c in combinations.tolist()], dtype=bool)[inverse.ravel()]
+            keep = np.flatnonzero(keep)
+            if len(keep) > k:
+                # a stable order, so that of tied candidates the earlier ones are kept.
+                keep = keep[np.lexsort((numbers[keep], -scores[keep]))[:k]]
+            for i in keep.tolist():
+                item = (scores[i], -int(numbers[i]))
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            if verbose:
+                logger.info("Scored candidates {}-{} of {}".format(start + 1, numbers[-1] + 1, self.size))
+
+        best = sorted(heap, reverse=True)
+        compounds, amounts, conditions = self.candidates([-number for s, number in best])
+        return [Candidate(float(s), -number, compounds[i].tolist(), amounts[i].tolist(), conditions[i].tolist())
+                for i, (s, number) in enumerate(best)]
@@ -0,0 +1,176 @@
+"""
+A nearest-neighbour index of reactions, shared by the recommender and the visualisation.
+
+vis.kdtree built a tree of python objects for every query and found k neighbours by removing
+each one found and building the tree again. Here the reactions' descriptor values are embedded
+once by a ReactionMetric (so Euclidean distance is reaction distance) and held in an array,
+most of which is indexed by a scipy cKDTree. Reactions added since the tree was built are
+searched by brute force until there are enough of them to be worth building the tree again, so
+newly performed reactions can be added as they come. Queries are of many points at once, and
+are exact.
+
+The index is kept in a single .npz file, by default settings.REACTION_NEIGHBOUR_INDEX_FILE,
+by the update_neighbour_index command.
+"""
+from django.conf import settings
+from DRP.utils import atomicWrite
+from scipy.spatial import cKDTree
+from .reactionMetric import ReactionMetric
+import numpy as np
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def defaultPath():
+    """Return the path of the shared index file."""
+    return getattr(settings, 'REACTION_NEIGHBOUR_INDEX_FILE', os.path.join(settings.MODEL_DIR, 'reaction_neighbours.npz'))
+
+
+class ReactionNeighbourIndex(object):
+    """The embedded descriptor values of a set of reactions, for finding the nearest reactions to others."""
+
+    def __init__(self, metric, pks=None, points=None, rebuildFraction=0.1):
+        """
+        Make an index of points (already embedded by metric) of the reactions with the given pks.
+
+        The tree is built again once the reactions added since it was built are more than
+        rebuildFraction of those in it.
+        """
+        self.metric = metric
+        self.pks = np.zeros(0, dtype=np.int64) if pks is None else np.asarray(pks, dtype=np.int64)
+        self.points = np.zeros((len(self.pks), 0)) if points is None else np.asarray(points, dtype=np.float64)
+        self.rebuildFraction = rebuildFraction
+        self._build()
+
+    @classmethod
+    def build(cls, reactions, headers=None, metric=None, **kwargs):
+        """
+        Return an index of a queryset of reactions.
+
+        Unless a metric is given, one is fitted to the reactions' values of the descriptors with
+        the given csvHeaders (by default, all reaction descriptors).
+        """
+        matrix, headers, pks = reactions.toDescriptorMatrix(
+            whitelistHeaders=headers if metric is None else metric.headers)
+        if metric is None:
+            metric = ReactionMetric.fromReactions(reactions, list(headers))
+        return cls(metric, pks, metric.embed(matrix), **kwargs)
+
+    def _build(self):
+        """Build the tree over every point."""
+        self.tree = cKDTree(self.points) if len(self.pks) else None
+        self.treeSize = len(self.pks)
+
+    def __len__(self):
+        """Return the number of reactions in the index."""
+        return len(self.pks)
+
+    def __contains__(self, pk):
+        """Return whether the reaction with a pk is in the index."""
+        return pk in self.positions()
+
+    def positions(self):
+        """Return a dictionary from each reaction pk to its row of points."""
+        return {pk: i for i, pk in enumerate(self.pks.tolist())}
+
+    def addPoints(self, pks, points):
+        """Add embedded points for the reactions with pks, replacing the points of any already in the index."""
+        pks = np.asarray(pks, dtype=np.int64)
+        if not len(pks):
+            return
+        points = np.asarray(points, dtype=np.float64).reshape(len(pks), -1)
+        positions = self.positions()
+        existing = np.array([pk in positions for pk in pks.tolist()], dtype=bool)
+        if existing.any():
+            rows = np.array([positions[pk] for pk in pks[existing].tolist()], dtype=np.intp)
+            self.points[rows] = points[existing]
+            pks, points = pks[~existing], points[~existing]
+        self.pks = np.concatenate((self.pks, pks))
+        self.points = np.vstack((self.points, points)) if len(self.points) else points
+        if existing.any() or len(self.pks) - self.treeSize > self.rebuildFraction * self.treeSize:
+            self._build()
+
+    def add(self, reactions):
+        """Add a queryset of reactions (such as those newly performed) to the index."""
+        matrix, headers, pks = reactions.toDescriptorMatrix(whitelistHeaders=self.metric.headers)
+        if list(headers) != self.metric.headers:
+            raise RuntimeError('Could not find the descriptors {}'.format(set(self.metric.headers) - set(headers)))
+        self.addPoints(pks, self.metric.embed(matrix))
+
+    def queryPoints(self, points, k=1, exclude=None):
+        """
+        Return arrays of (distances, pks) of the k nearest reactions to each of some embedded points.
+
+        Both have a row for each point, in ascending order of distance, and fewer than k columns if
+        there are fewer reactions. If exclude is given, it is the pk of a reaction to leave out for
+        each point (such as the reaction the point belongs to).
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        extra = 0 if exclude is None else 1
+        distances = []
+        rows = []
+        if self.treeSize:
+            found = min(k + extra, self.treeSize)
+            treeDistances, treeRows = self.tree.query(points, k=found)
+            distances.append(np.reshape(treeDistances, (len(points), found)))
+            rows.append(np.reshape(treeRows, (len(points), found)))
+        if len(self.pks) > self.treeSize:
+            pending = self.points[self.treeSize:]
+            squared = (points ** 2).sum(axis=1)[:, np.newaxis] + (pending ** 2).sum(axis=1)[np.newaxis, :] - 2 * points.dot(pending.T)
+            distances.append(np.sqrt(np.clip(squared, 0, None)))
+            rows.append(np.tile(np.arange(self.treeSize, len(self.pks)), (len(points), 1)))
+        if not distances:
+            return np.zeros((len(points), 0)), np.zeros((len(points), 0), dtype=np.int64)
+
+        distances = np.hstack(distances)
+        pks = self.pks[np.hstack(rows)]
+        if exclude is not None:
+            distances = np.where(pks == np.asarray(exclude, dtype=np.int64)[:, np.newaxis], np.inf, distances)
+        order = np.argsort(distances, axis=1, kind='mergesort')[:, :min(k, len(self.pks) - extra)]
+        chosen = np.arange(len(points))[:, np.newaxis]
+        return distances[chosen, order], pks[chosen, order]
+
+    def query(self, matrix, k=1, exclude=None, headers=None):
+        """
+        Return arrays of (distances, pks) of the k nearest reactions to each row of a matrix of descriptor values, as queryPoints.
+
+        If headers are given, they are the csvHeaders of the columns of matrix, which need not be those
+        of the metric; descriptors missing from them are treated as missing values.
+        """
+        if headers is not None:
+            columns = {header: j for j, header in enumerate(headers)}
+            aligned = np.full((len(matrix), len(self.metric.headers)), np.nan)
+            for j, header in enumerate(self.metric.headers):
+                if header in columns:
+                    aligned[:, j] = matrix[:, columns[header]]
+            matrix = aligned
+        return self.queryPoints(self.metric.embed(matrix), k=k, exclude=exclude)
+
+    def queryReactions(self, reactions, k=1):
+        """
+        Return arrays of (pks, distances, neighbour pks) of the k nearest other reactions to each of a queryset of reactions.
+
+        The reactions are in primary key order.
+        """
+        matrix, headers, pks = reactions.toDescriptorMatrix(whitelistHeaders=self.metric.headers)
+        distances, neighbours = self.query(matrix, k=k, exclude=pks)
+        return pks, distances, neighbours
+
+    def save(self, path=None):
+        """Save the index to a file (by default, the shared one)."""
+        path = defaultPath() if path is None else path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with atomicWrite(path) as f:
+            np.savez(f, pks=self.pks, points=self.points, metric=np.array(json.dumps(self.metric.state())))
+
+    @classmethod
+    def load(cls, path=None, **kwargs):
+        """Return the index saved in a file (by default, the shared one)."""
+        path = defaultPath() if path is None else path
+        with np.load(path) as saved:
+            return cls(ReactionMetric.fromState(json.loads(str(saved['metric']))), saved['pks'], saved['points'], **kwargs)
@@ -0,0 +1,175 @@
+"""
+Distances between reactions, computed over whole descriptor matrices at once.
+
+metrics.Euclidean standardised both rows of every pair it compared, one header at a time.
+A ReactionMetric is fitted to a matrix of reaction descriptor values once, and embeds any
+matrix with the same columns into a space in which the Euclidean distance is the distance
+between the reactions:
+
+    numeric and ordinal columns are standardised by the mean and standard deviation of the fitted matrix,
+    boolean columns are left as 0 and 1, so a mismatch adds 1 to the squared distance as in metrics.Euclidean,
+    categorical columns are one-hot encoded, scaled so that a mismatch also adds 1,
+    and missing values are given the column mean (for categorical columns, an equal share of each category).
+
+Alternatively, the linear transform learned by a MetricContainer (such as ITML or LMNN) may be applied
+to its unstandardised descriptors, giving the distance of the learned metric.
+"""
+from DRP.models.descriptorMatrixCache import reactionDescriptors
+import numpy as np
+
+
+def _sigmoid(x):
+    """Return the logistic function of an array."""
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class ReactionMetric(object):
+    """A fitted embedding of reaction descriptor matrices, with batched distance calculations."""
+
+    def __init__(self, headers, means, scales, kinds=None, categories=None, transform=None):
+        """
+        Describe the metric.
+
+        headers are the csvHeaders of the columns, with the means and scales used to standardise
+        them. kinds maps a header to 'bool' or 'cat' for columns which are not standardised, and
+        categories gives the number of categories of each 'cat' column. transform, if given, is
+        a matrix applied to the embedded rows.
+        """
+        self.headers = list(headers)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.kinds = dict(kinds or {})
+        self.categories = dict(categories or {})
+        self.transform = None if transform is None else np.asarray(transform, dtype=np.float64)
+
+    def state(self):
+        """Return a dictionary of the parameters of the metric, of lists and numbers, suitable for serialising as json."""
+        return {
+            'headers': self.headers,
+            'means': self.means.tolist(),
+            'scales': self.scales.tolist(),
+            'kinds': self.kinds,
+            'categories': self.categories,
+            'transform': None if self.transform is None else self.transform.tolist(),
+        }
+
+    @classmethod
+    def fromState(cls, state):
+        """Return the metric with the parameters given by state."""
+        return cls(state['headers'], state['means'], state['scales'], state['kinds'], state['categories'], state['transform'])
+
+    @classmethod
+    def fit(cls, matrix, headers, kinds=None, transform=None, standardise=True):
+        """
+        Return the metric fitted to a matrix of descriptor values, whose columns have the given csvHeaders.
+
+        kinds maps the headers of boolean and categorical columns to 'bool' and 'cat'; categorical
+        values are the codes given by ReactionQuerySet.toDescriptorMatrix. If standardise is False,
+        numeric columns are only centred.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        kinds = {header: kind for header, kind in (kinds or {}).items() if kind in ('bool', 'cat')}
+        present = ~np.isnan(matrix)
+        counts = present.sum(axis=0)
+        means = np.where(present, matrix, 0).sum(axis=0) / np.maximum(counts, 1)
+        scales = np.ones(len(headers))
+        if standardise and len(matrix):
+            deviations = np.where(present, matrix - means, 0)
+            scales = np.sqrt((deviations ** 2).sum(axis=0) / np.maximum(counts, 1))
+            scales[~(scales > 1e-4 * np.maximum(np.abs(means), 1))] = 1.0
+        categories = {}
+        for j, header in enumerate(headers):
+            if kinds.get(header) == 'cat':
+                categories[header] = int(np.nanmax(matrix[:, j])) + 1 if counts[j] else 0
+        return cls(headers, means, scales, kinds, categories, transform)
+
+    @classmethod
+    def fromReactions(cls, reactions, headers=None, **kwargs):
+        """Return the metric fitted to the descriptor values of a queryset of reactions (by default, of every reaction descriptor)."""
+        matrix, headers, pks = reactions.toDescriptorMatrix(whitelistHeaders=headers)
+        descriptors = reactionDescriptors(list(headers))
+        kinds = {header: kind for header, (kind, descriptor) in descriptors.items()}
+        return cls.fit(matrix, list(headers), kinds=kinds, **kwargs)
+
+    @classmethod
+    def fromMetricContainer(cls, container, reactions):
+        """
+        Return the metric learned by a built MetricContainer, centred on a queryset of reactions.
+
+        The container's Mahalanobis matrix M is factorised as L'L, and rows (with missing values
+        given the mean, as in training) are embedded by L, so Euclidean distances are those of M.
+        """
+        from DRP.models.metricContainer import metricVisitors
+        if not container.built:
+            raise RuntimeError('Cannot use a metric that has not been built.')
+        visitor = metricVisitors[container.metricVisitor].MetricVisitor(0)
+        visitor.recover(str(container.fileName))
+        eigenvalues, eigenvectors = np.linalg.eigh(np.asarray(visitor.metric(), dtype=np.float64))
+        transform = (eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))).T
+        headers = [d.csvHeader for d in container.descriptors]
+        matrix, headers, pks = reactions.toDescriptorMatrix(whitelistHeaders=headers)
+        return cls.fit(matrix, list(headers), transform=transform, standardise=False)
+
+    def embed(self, matrix):
+        """Return the rows of a matrix of descriptor values, in the columns of headers, embedded in the metric space."""
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+        filled = np.where(np.isnan(matrix), self.means, matrix)
+        columns = []
+        for j, header in enumerate(self.headers):
+            kind = self.kinds.get(header)
+            if kind == 'bool':
+                columns.append(filled[:, [j]])
+            elif kind == 'cat':
+                codes = matrix[:, j]
+                encoded = (codes[:, np.newaxis] == np.arange(self.categories[header])) / np.sqrt(2)
+                # a missing value is the average category
+                frequencies = np.full(self.categories[header], 1.0 / max(self.categories[header], 1)) / np.sqrt(2)
+                columns.append(np.where(np.isnan(codes)[:, np.newaxis], frequencies, encoded))
+            else:
+                columns.append(((filled[:, j] - self.means[j]) / self.scales[j])[:, np.newaxis])
+        embedded = np.hstack(columns) if columns else np.zeros((len(matrix), 0))
+        if self.transform is not None:
+            embedded = embedded.dot(self.transform.T)
+        return embedded
+
+    def pairwise(self, a, b=None, embedded=False):
+        """
+        Return the matrix of distances between the rows of a and those of b (by default, a again).
+
+        If embedded is True, the rows are already embedded.
+        """
+        a = a if embedded else self.embed(a)
+        same = b is None
+        b = a if same else (b if embedded else self.embed(b))
+        squared = (a ** 2).sum(axis=1)[:, np.newaxis] + (b ** 2).sum(axis=1)[np.newaxis, :] - 2 * a.dot(b.T)
+        if same:
+            # rounding would leave small distances of rows from themselves.
+            np.fill_diagonal(squared, 0)
+        return np.sqrt(np.clip(squared, 0, None))
+
+    def distances(self, query, matrix, embedded=False):
+        """Return the distance of a single row, query, to each row of a matrix."""
+        query = np.atleast_2d(query if embedded else self.embed(query))
+        matrix = matrix if embedded else self.embed(matrix)
+        return np.sqrt(((matrix - query) ** 2).sum(axis=1))
+
+    def diversify(self, scores, matrix, count=None, embedded=False):
+        """
+        Return arrays of (indices, scores) of the rows chosen in turn for diversity, and their scores when chosen.
+
+        As in recommend.dissimilarity_weighting, the best remaining row is chosen, and each remaining
+        score is multiplied by the logistic function of its distance from the one chosen, so rows near
+        chosen ones are passed over. count rows are chosen (by default, all of them).
+        """
+        points = matrix if embedded else self.embed(matrix)
+        weighted = np.asarray(scores, dtype=np.float64).copy()
+        remaining = np.ones(len(weighted), dtype=bool)
+        count = len(weighted) if count is None else min(count, len(weighted))
+        chosen = np.empty(count, dtype=np.intp)
+        chosenScores = np.empty(count)
+        for c in range(count):
+            i = np.flatnonzero(remaining)[np.argmax(weighted[remaining])]
+            chosen[c], chosenScores[c] = i, weighted[i]
+            remaining[i] = False
+            weighted[remaining] *= _sigmoid(self.distances(points[i], points[remaining], embedded=True))
+        return chosen, chosenScores
@@ -1,17 +1,27 @@
 from DRP.research.geoffrey.distance_learning.AbstractDistanceLearner import AbstractDistanceLearner, logger
 import numpy as np
 from sklearn.preprocessing import Imputer
+from DRP.models.trainingDatasetCache import trainingDatasetCache
 from cPickle import dump, load
 
 
 class AbstractMetricLearnDistanceLearner(AbstractDistanceLearner):
     maxResponseCount = 1
 
-    def _prepareArrays(self, reactions, predictor_headers, response_headers):
-        data = reactions.toNPArray(
-            expanded=True, whitelistHeaders=predictor_headers, missing=np.nan)
-        labels = reactions.toNPArray(
-            expanded=True, whitelistHeaders=response_headers).flatten()
+    def _prepareArrays(self, reactions, predictor_headers, response_headers, training=True):
+        if training:
+            # the same training reactions and descriptors are used over and over by parameter sweeps.
+            dataset = trainingDatasetCache.get(
+                reactions, list(predictor_headers) + list(response_headers))[0]
+            data = dataset.matrix(
+                [h for h in predictor_headers if h in dataset.columns])
+            labels = dataset.matrix(
+                [h for h in response_headers if h in dataset.columns]).flatten()
+        else:
+            # other reactions are only transformed once, so are not worth caching.
+            data = reactions.toDescriptorMatrix(
+                whitelistHeaders=predictor_headers, missing=np.nan)[0]
+            labels = np.array([])
 
         data = Imputer(copy=False).fit_transform(data)
 
@@ -23,7 +33,7 @@ class AbstractMetricLearnDistanceLearner(AbstractDistanceLearner):
         return data, labels
 
     def transform(self, reactions, predictor_headers):
-        data = self._prepareArrays(reactions, predictor_headers, [])[0]
+        data = self._prepareArrays(reactions, predictor_headers, [], training=False)[0]
         transformed = self.metric_object.transform(data)
         return transformed
 
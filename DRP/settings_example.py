@@ -42,11 +42,18 @@ RESEARCH_DIR = os.path.join(BASE_DIR + "research")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 
+# compounds per cxcalc call, and cxcalc processes run at once, when calculating descriptors in bulk
+CHEMAXON_CHUNK_SIZE = 100
+CHEMAXON_MAX_PROCESSES = 4
 CHEMAXON_DIR = {
 }
 # {version: directory}
 WEKA_PATH = {
     '3.6': '/usr/share/java/weka.jar'}  # default path on Ubuntu
+# Run weka jobs on a pool of long-lived java processes rather than starting java
+# for every command (needs a JDK to compile the server). See DRP.ml_models.wekaServer
+WEKA_SERVER = False
+WEKA_SERVER_WORKERS = 2
 
 if TESTING:
     MOL_DESCRIPTOR_PLUGINS = ('DRP.plugins.moldescriptors.example',)
@@ -285,10 +292,21 @@ CACHES = {
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 STATS_MODEL_LIBS_DIR = "DRP.ml_models.model_visitors"
-STATS_MODEL_LIBS = ("weka",)
+STATS_MODEL_LIBS = ("weka", "sklearn")
+# The number of processes used to train the component models of a ModelContainer in parallel.
+MODEL_BUILD_WORKERS = 1
+# The most queued model build jobs run at once by all model_build_worker processes together.
+MODEL_BUILD_CONCURRENCY = 1
+# Seconds after its worker last renewed the lease of a running build job before
+# the job is assumed abandoned and queued again.
+MODEL_BUILD_LEASE = 600
+# The most trained models each process keeps loaded in memory for ModelContainer.predict and vote.
+LOADED_MODEL_CACHE_SIZE = 32
+# The number of most similar compounds kept for each compound by update_similarity_index.
+SIMILARITY_INDEX_SIZE = 50
 REACTION_DATASET_SPLITTERS_DIR = "DRP.ml_models.splitters"
 REACTION_DATASET_SPLITTERS = (
-    "kFoldSplitter", "exploratorySplitter", "noSplitter", "randomSplitter")
+    "kFoldSplitter", "exploratorySplitter", "noSplitter", "randomSplitter", "stratifiedKFoldSplitter")
 FEATURE_SELECTION_LIBS_DIR = "DRP.ml_models.feature_visitors"
 FEATURE_SELECTION_LIBS = ("weka",)
 METRIC_VISITORS = tuple()
@@ -302,3 +320,19 @@ LAB_GROUP_HASH_SALT = ''
 FILE_UPLOAD_HANDLERS = (
     "django.core.files.uploadhandler.TemporaryFileUploadHandler",
 )
+
+# Persistent columnar cache of reaction descriptor values used for expanded
+# csv/arff/numpy exports. Set DESCRIPTOR_MATRIX_CACHE to False to always read
+# descriptor values straight from the database.
+DESCRIPTOR_MATRIX_CACHE = True
+DESCRIPTOR_MATRIX_CACHE_DIR = os.path.join(TMP_DIR, 'descriptor_matrix_cache')
+
+# Content-addressed store of the prepared training data of model, feature
+# selection and metric containers, shared by all containers with the same inputs.
+TRAINING_DATASET_CACHE_DIR = os.path.join(TMP_DIR, 'training_datasets')
+
+# The nearest-neighbour index of performed reactions kept by update_neighbour_index.
+REACTION_NEIGHBOUR_INDEX_FILE = os.path.join(MODEL_DIR, 'reaction_neighbours.npz')
+
+# The hierarchical clustering of performed reactions kept by update_reaction_hierarchy.
+REACTION_HIERARCHY_FILE = os.path.join(MODEL_DIR, 'reaction_hierarchy.npz')
@@ -9,6 +9,24 @@ from . import decorators
 from . import compoundDescriptor
 from . import compoundToCsv
 from . import compoundToArff
+from . import descriptorMatrixCache
+from . import descriptorDependencies
+from . import descriptorWorker
+from . import ensemblePredictions
+from . import confusionMatrices
+from . import descriptorDataset
+from . import trainingDatasetCache
+from . import exploratorySplitter
+from . import dataSets
+from . import stratifiedKFoldSplitter
+from . import modelBuildJobs
+from . import loadedModelCache
+from . import candidateGrid
+from . import compoundSimilarity
+from . import reactionMetric
+from . import neighbourIndex
+from . import reactionHierarchy
+from . import sklearnModels
 # import modelBuildingTests
 # import DataImport
 from . import modelValidators
@@ -25,6 +43,24 @@ suite = unittest.TestSuite([
     compoundDescriptor.suite,
     compoundToCsv.suite,
     compoundToArff.suite,
+    descriptorMatrixCache.suite,
+    descriptorDependencies.suite,
+    descriptorWorker.suite,
+    ensemblePredictions.suite,
+    confusionMatrices.suite,
+    descriptorDataset.suite,
+    trainingDatasetCache.suite,
+    exploratorySplitter.suite,
+    dataSets.suite,
+    stratifiedKFoldSplitter.suite,
+    modelBuildJobs.suite,
+    loadedModelCache.suite,
+    candidateGrid.suite,
+    compoundSimilarity.suite,
+    reactionMetric.suite,
+    neighbourIndex.suite,
+    reactionHierarchy.suite,
+    sklearnModels.suite,
     modelValidators.suite,
     # splitters.suite,
     fileTests.suite,
@@ -42,6 +78,24 @@ modules = [
     "compoundDescriptor",
     "compoundToCsv",
     "compoundToArff",
+    "descriptorMatrixCache",
+    "descriptorDependencies",
+    "descriptorWorker",
+    "ensemblePredictions",
+    "confusionMatrices",
+    "descriptorDataset",
+    "trainingDatasetCache",
+    "exploratorySplitter",
+    "dataSets",
+    "stratifiedKFoldSplitter",
+    "modelBuildJobs",
+    "loadedModelCache",
+    "candidateGrid",
+    "compoundSimilarity",
+    "reactionMetric",
+    "neighbourIndex",
+    "reactionHierarchy",
+    "sklearnModels",
     "fileTests",
     "modelValidators",
 ]
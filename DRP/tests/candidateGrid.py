@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Tests for the recommendation candidate grid."""
+
+import unittest
+from itertools import product
+import numpy as np
+from scipy.stats import gmean
+from .drpTestCase import DRPTestCase, runTests
+from DRP.recommendation.candidateGrid import CandidateGrid, levels, roleDescriptors, rxnHeader, _uniqueRows
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class Levels(DRPTestCase):
+    """Check that levels gives the values of the old frange."""
+
+    def test_levels(self):
+        """Levels start at low and stop short of high."""
+        self.assertEqual(levels(0.1, 0.5, 4).tolist(), [0.1, 0.2, 0.3, 0.4])
+        self.assertEqual(levels(1, 7, 3, integer=True).tolist(), [1, 3, 5])
+
+
+class RoleDescriptors(DRPTestCase):
+    """Check the role-aggregated descriptors against a row at a time calculation."""
+
+    def test_values(self):
+        """Max, Range and the geometric means match those of the plugin."""
+        compoundValues = np.array([[1.0, 2.0], [4.0, np.nan], [3.0, 0.0]])
+        compounds = np.array([[0, 2, 1], [0, 0, 1], [1, 2, 0]])
+        amounts = np.array([[0.1, 0.3, 0.2], [0.1, 0.2, 0.4], [0.0, 0.0, 0.5]])
+        matrix, headers = roleDescriptors(compounds, amounts, ['org', 'org', 'inorg'], compoundValues, ['a', 'b'])
+        column = {header: matrix[:, j] for j, header in enumerate(headers)}
+
+        self.assertEqual(column[rxnHeader('org_amount_count')].tolist(), [2, 2, 2])
+        np.testing.assert_allclose(column[rxnHeader('org_amount_molarity')], [0.4, 0.3, 0.0])
+        np.testing.assert_allclose(column[rxnHeader('org_a_Max')][0], 3.0)
+        np.testing.assert_allclose(column[rxnHeader('org_a_Range')][0], 2.0)
+        np.testing.assert_allclose(column[rxnHeader('org_a_gmean_molarity')][0], gmean([1.0 * 0.25, 3.0 * 0.75]))
+        np.testing.assert_allclose(column[rxnHeader('org_a_gmean_count')][0], gmean([1.0, 3.0]))
+        self.assertEqual(column[rxnHeader('org_b_gmean_count')][0], 0)
+        # the same compound twice in a role, and a missing value
+        self.assertTrue(np.isnan(column[rxnHeader('org_a_Max')][1]))
+        self.assertTrue(np.isnan(column[rxnHeader('inorg_b_Max')][0]))
+        # no amount of the role
+        self.assertTrue(np.isnan(column[rxnHeader('org_a_gmean_molarity')][2]))
+        self.assertTrue(np.isnan(column[rxnHeader('org_a_gmean_count')][2]))
+        np.testing.assert_allclose(column[rxnHeader('org_a_Max')][2], 4.0)
+
+    def test_absentRoles(self):
+        """Roles without compounds have counts and amounts of zero, and no other descriptors."""
+        matrix, headers = roleDescriptors(np.array([[0]]), np.array([[0.1]]), ['org'], np.array([[1.0]]), ['a'],
+                                          allRoles=['org', 'water'])
+        column = {header: matrix[:, j] for j, header in enumerate(headers)}
+        self.assertEqual(column[rxnHeader('water_amount_count')].tolist(), [0])
+        self.assertEqual(column[rxnHeader('water_amount_molarity')].tolist(), [0])
+        self.assertNotIn(rxnHeader('water_a_Max'), headers)
+        self.assertEqual(headers.count(rxnHeader('org_amount_count')), 1)
+
+
+class Recommend(DRPTestCase):
+    """Check that the best candidates are those found by scoring every candidate separately."""
+
+    def setUp(self):
+        """Make a grid of two compound slots and one condition."""
+        self.grid = CandidateGrid([[11, 12, 13], [21, 22]], [[0.1, 0.2], [0.3, 0.4, 0.5]], ['org', 'inorg'],
+                                  {'reaction_temperature_manual_0': [90, 120, 150]})
+
+    def score(self, matrix, headers):
+        """Score candidates by amounts and temperature, so that there are ties between compounds."""
+        column = {header: matrix[:, j] for j, header in enumerate(headers)}
+        return (column[rxnHeader('org_amount_molarity')] * column[rxnHeader('inorg_amount_molarity')] -
+                np.abs(column['reaction_temperature_manual_0'] - 120))
+
+    def expected(self, k, exclude=()):
+        """Return the numbers of the k best candidates, scored one at a time."""
+        scored = []
+        for number, (c1, c2, a1, a2, t) in enumerate(product(*(self.grid.substitutes + self.grid.amounts + list(self.grid.conditions.values())))):
+            if tuple(sorted((c1, c2))) not in exclude:
+                scored.append((a1 * a2 - abs(t - 120), -number))
+        return [-number for score, number in sorted(scored, reverse=True)[:k]]
+
+    def test_size(self):
+        """The grid has a candidate for each combination."""
+        self.assertEqual(self.grid.size, 3 * 2 * 2 * 3 * 3)
+
+    def test_top(self):
+        """The heap keeps the best candidates, whatever the batch size."""
+        for batchSize in (None, 7, 1000):
+            best = self.grid.recommend(self.score, k=5, batchSize=batchSize, molDescriptors=[])
+            self.assertEqual([candidate.number for candidate in best], self.expected(5))
+        top = best[0]
+        self.assertEqual(top.amounts, [0.2, 0.5])
+        self.assertEqual(top.conditions, [120])
+
+    def test_exclude(self):
+        """Candidates with excluded sets of compounds are not recommended."""
+        exclude = [(21, 11), (12, 21)]
+        excluded = set(tuple(sorted(compounds)) for compounds in exclude)
+        best = self.grid.recommend(self.score, k=8, batchSize=10, exclude=exclude, molDescriptors=[])
+        self.assertEqual([candidate.number for candidate in best], self.expected(8, exclude=excluded))
+        self.assertFalse(any(tuple(sorted(candidate.compounds)) in excluded for candidate in best))
+
+    def test_ties(self):
+        """Of candidates with equal scores, the earliest in the grid are recommended, whatever the batch size."""
+        for batchSize in (None, 7):
+            best = self.grid.recommend(lambda matrix, headers: np.zeros(len(matrix)), k=4, batchSize=batchSize,
+                                       molDescriptors=[])
+            self.assertEqual([candidate.number for candidate in best], [0, 1, 2, 3])
+
+    def test_uniqueRows(self):
+        """Rows are grouped as np.unique groups them along an axis."""
+        matrix = np.array([[3, 1], [1, 2], [3, 1], [1, 0]])
+        rows, inverse = _uniqueRows(matrix)
+        self.assertEqual(rows.tolist(), [[1, 0], [1, 2], [3, 1]])
+        self.assertEqual(inverse.tolist(), [2, 1, 2, 0])
+
+
+suite = unittest.TestSuite([
+    loadTests(Levels),
+    loadTests(RoleDescriptors),
+    loadTests(Recommend),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
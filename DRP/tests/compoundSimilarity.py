@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Tests for the compound similarity index."""
+
+import unittest
+import numpy as np
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import Compound, CompoundSimilarity, CompoundFingerprint
+from DRP.models.compoundSimilarity import packBits, popcount, tanimoto, nearest
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+# stand-in fingerprints, keyed by the SMILES of the test compounds.
+bitSets = {
+    'a': [1, 2, 3, 64, 100],
+    'b': [1, 2, 3, 64],
+    'c': [1, 2, 700, 1500, 2047],
+    'd': [700, 1500, 2047],
+    'e': [5, 6, 7],
+}
+
+
+def fingerprinter(smiles):
+    """Return the on bits of a test compound, or None if unknown."""
+    return bitSets.get(smiles)
+
+
+def jaccard(a, b):
+    """Return the Tanimoto similarity of two sets of bits."""
+    union = set(a) | set(b)
+    return len(set(a) & set(b)) / len(union) if union else 0.0
+
+
+class Bits(DRPTestCase):
+    """Check the packed fingerprints against sets of bits."""
+
+    def test_popcount(self):
+        """The bits of packed fingerprints are counted."""
+        words = np.array([packBits(bits) for bits in bitSets.values()])
+        self.assertEqual(popcount(words).tolist(), [len(bits) for bits in bitSets.values()])
+
+    def test_tanimoto(self):
+        """Similarities match those of sets, whatever the block size."""
+        words = np.array([packBits(bits) for bits in bitSets.values()] + [packBits([])])
+        sets = list(bitSets.values()) + [[]]
+        expected = [[jaccard(a, b) for b in sets] for a in sets]
+        for blockWords in (1, 100, 1 << 22):
+            np.testing.assert_allclose(tanimoto(words, words, blockWords=blockWords), expected)
+
+    def test_nearest(self):
+        """Rows leave themselves out and ties go to the lower primary key."""
+        similarities = np.array([[1.0, 0.5, 0.5, 0.2], [0.5, 1.0, 0.1, 0.1]])
+        indices, values = nearest(similarities, np.array([10, 11]), np.array([10, 11, 12, 13]), 2)
+        self.assertEqual(indices.tolist(), [[1, 2], [0, 2]])
+        self.assertEqual(values.tolist(), [[0.5, 0.5], [0.5, 0.1]])
+
+
+class Refresh(DRPTestCase):
+    """Check that the index is kept up to date as compounds change."""
+
+    def setUp(self):
+        """Create a compound for each stand-in fingerprint, and one which cannot be fingerprinted."""
+        self.compounds = {smiles: Compound.objects.create(name='similarity test {}'.format(smiles), custom=True, smiles=smiles)
+                          for smiles in list(bitSets) + ['unknown']}
+
+    def tearDown(self):
+        """Delete the compounds, and with them the index."""
+        Compound.objects.filter(pk__in=[compound.pk for compound in self.compounds.values()]).delete()
+
+    def assertIndexed(self, k):
+        """Assert that the index holds the k most similar compounds of each compound."""
+        smilesOf = dict(Compound.objects.filter(pk__in=[c.pk for c in self.compounds.values()]).values_list('pk', 'smiles'))
+        similarityMap = CompoundSimilarity.objects.similarityMap(list(smilesOf), minimum=-1)
+        for pk, smiles in smilesOf.items():
+            others = sorted((-jaccard(bitSets.get(smiles, []), bitSets.get(otherSmiles, [])), otherPk)
+                            for otherPk, otherSmiles in smilesOf.items() if otherPk != pk)[:k]
+            self.assertEqual([similarPk for similarPk, similarity in similarityMap[pk]], [otherPk for s, otherPk in others])
+            np.testing.assert_allclose([similarity for similarPk, similarity in similarityMap[pk]], [-s for s, otherPk in others])
+
+    def test_build(self):
+        """Every compound is fingerprinted and given its neighbours."""
+        self.assertEqual(CompoundSimilarity.objects.refresh(k=2, fingerprinter=fingerprinter), len(self.compounds))
+        self.assertFalse(CompoundFingerprint.objects.get(compound=self.compounds['unknown']).valid)
+        self.assertIndexed(2)
+        self.assertEqual(CompoundSimilarity.objects.refresh(k=2, fingerprinter=fingerprinter), 0)
+
+    def test_changes(self):
+        """Only compounds which are affected are updated, and the index is as if built afresh."""
+        CompoundSimilarity.objects.refresh(k=2, fingerprinter=fingerprinter)
+        changed = self.compounds['e']
+        changed.smiles = 'a'
+        changed.save()
+        self.assertLess(CompoundSimilarity.objects.refresh(k=2, fingerprinter=fingerprinter), len(self.compounds))
+        self.assertIndexed(2)
+        self.compounds.pop('d').delete()
+        CompoundSimilarity.objects.refresh(k=2, fingerprinter=fingerprinter)
+        self.assertIndexed(2)
+
+    def test_similarityMap(self):
+        """Compounds with no similarity are not given as substitutes."""
+        CompoundSimilarity.objects.refresh(k=4, fingerprinter=fingerprinter)
+        similarityMap = CompoundSimilarity.objects.similarityMap([self.compounds['e'].pk, self.compounds['a'].pk], k=1)
+        self.assertEqual(similarityMap[self.compounds['e'].pk], [])
+        self.assertEqual([pk for pk, similarity in similarityMap[self.compounds['a'].pk]], [self.compounds['b'].pk])
+
+
+suite = unittest.TestSuite([
+    loadTests(Bits),
+    loadTests(Refresh),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
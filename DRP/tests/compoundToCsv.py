@@ -63,6 +63,13 @@ class CsvOutput(DRPTestCase):
                     len(headerRow), headerRow, len(row), row))
             self.assertEqual(rowCount, 3)
 
+    def test_chunked(self):
+        """Test that a CSV streamed in small chunks matches the one written in one go."""
+        chunks = list(Compound.objects.all().iterCsv(expanded=True, chunksize=1))
+        self.assertEqual(len(chunks), 4)
+        whole = ''.join(Compound.objects.all().iterCsv(expanded=True))
+        self.assertEqual(''.join(chunks), whole)
+
 suite = unittest.TestSuite([
     loadTests(CsvOutput)
 ])
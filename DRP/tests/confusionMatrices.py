@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Tests for counting the confusion matrices of predicted descriptors."""
+
+import unittest
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, BoolRxnDescriptor, BoolRxnDescriptorValue, ModelContainer, StatsModel, DataSet
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsPerformedReaction('Narnia', 'Aslan', 'R03')
+class ConfusionMatrices(DRPTestCase):
+    """Check the matrices counted for the predictions of a container and its component models."""
+
+    def setUp(self):
+        """Create a container with a component model, and their predictions of an outcome."""
+        self.outcome = BoolRxnDescriptor.objects.create(
+            heading='outcome', name='outcome', calculatorSoftware='manual', calculatorSoftwareVersion='0')
+        self.container = ModelContainer.objects.create(modelVisitorLibrary='weka', modelVisitorTool='SVM_PUK')
+        self.trainingSet = DataSet.objects.create(name='confusionTraining')
+        statsModel = StatsModel.objects.create(container=self.container, trainingSet=self.trainingSet)
+        self.overall = self.outcome.createPredictionDescriptor(self.container)
+        self.overall.save()
+        self.component = self.outcome.createPredictionDescriptor(self.container, statsModel)
+        self.component.save()
+        reactions = [PerformedReaction.objects.get(reference=ref) for ref in ('r01', 'r02', 'r03')]
+        values = []
+        for reaction, actual, overall, component in zip(reactions, (True, True, False), (True, False, False), (True, True, True)):
+            values += [BoolRxnDescriptorValue(descriptor=self.outcome, reaction=reaction, value=actual),
+                       BoolRxnDescriptorValue(descriptor=self.overall, reaction=reaction, value=overall),
+                       BoolRxnDescriptorValue(descriptor=self.component, reaction=reaction, value=component)]
+        BoolRxnDescriptorValue.objects.bulk_create(values)
+
+    def tearDown(self):
+        """Remove the container and descriptors."""
+        BoolRxnDescriptorValue.objects.filter(descriptor__in=(self.outcome, self.overall, self.component)).delete()
+        self.overall.delete()
+        self.component.delete()
+        self.container.statsmodel_set.all().delete()
+        self.container.delete()
+        self.trainingSet.delete()
+        self.outcome.delete()
+
+    def test_matrices(self):
+        """The overall and component matrices count the pairs of actual and predicted values."""
+        self.assertEqual(self.container.getOverallConfusionMatrices(),
+                         [(self.overall.csvHeader, {True: {True: 1, False: 1}, False: {True: 0, False: 1}})])
+        self.assertEqual(self.container.getComponentConfusionMatrices(),
+                         [[(self.component.csvHeader, {True: {True: 2, False: 0}, False: {True: 1, False: 0}})]])
+        reactions = PerformedReaction.objects.filter(reference='r03')
+        self.assertEqual(self.overall.getConfusionMatrix(reactions),
+                         {True: {True: 0, False: 0}, False: {True: 0, False: 1}})
+
+    def test_invalidation(self):
+        """Changing a prediction changes the matrix, rather than leaving a stale one cached."""
+        self.assertEqual(self.overall.getConfusionMatrix()[True][True], 1)
+        BoolRxnDescriptorValue.objects.filter(descriptor=self.overall, value=False).update(value=True)
+        self.assertEqual(self.overall.getConfusionMatrix()[True][True], 2)
+
+
+suite = unittest.TestSuite([
+    loadTests(ConfusionMatrices)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
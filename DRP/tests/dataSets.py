@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""Tests for creating sets of reactions in bulk."""
+
+import unittest
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction, deletesDataSets
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, DataSet, DataSetRelation
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@deletesDataSets
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+class CreateMany(DRPTestCase):
+    """Check that datasets are created together and reused when asked."""
+
+    def test_create(self):
+        """Each dataset holds its reactions, in the order given."""
+        pks = sorted(PerformedReaction.objects.values_list('pk', flat=True))
+        first, second = DataSet.createMany([('first', pks), ('second', pks[:1])])
+        self.assertEqual((first.name, second.name), ('first', 'second'))
+        self.assertEqual(sorted(first.reactions.values_list('pk', flat=True)), pks)
+        self.assertEqual(DataSet.objects.get(name='second').pks.tolist(), pks[:1])
+
+    def test_reuse(self):
+        """With reuse, sets of the same reactions share one dataset."""
+        pks = sorted(PerformedReaction.objects.values_list('pk', flat=True))
+        original = DataSet.createMany([('original', pks)])[0]
+        reused, repeated, new = DataSet.createMany(
+            [('reused', reversed(pks)), ('repeated', pks[:1]), ('new', pks[:1])], reuse=True)
+        self.assertEqual(reused, original)
+        self.assertEqual(repeated, new)
+        self.assertEqual(DataSet.objects.count(), 2)
+        self.assertEqual(DataSetRelation.objects.count(), 3)
+
+
+suite = unittest.TestSuite([
+    loadTests(CreateMany)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
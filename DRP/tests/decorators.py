@@ -189,6 +189,23 @@ def createsPerformedReaction(labTitle, username, reference, valid=True, image=No
     return _createsPerformedReaction
 
 
+def deletesDataSets(c):
+    """
+    A class decorator that deletes every dataset after each test.
+
+    Datasets protect their reactions from deletion, so this must be applied outside
+    (above) the decorators which create those reactions, their users and lab groups.
+    """
+    _oldTearDown = c.tearDown
+
+    def tearDown(self):
+        DataSet.objects.all().delete()
+        _oldTearDown(self)
+
+    c.tearDown = tearDown
+    return c
+
+
 # def createsPerformedReaction(labTitle, username, reference, compoundAbbrevs=[], compoundRoles=[], compoundAmounts=[], descriptorDict={}, duplicateRef=None):
 #    """A class decorator that creates a reaction using pre-existing compounds
 #          with pre-existing compoundRoles."""
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Tests for the binary dataset format of reaction descriptor values."""
+
+import unittest
+import io
+import numpy as np
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction
+from .decorators import createsOrdRxnDescriptor, createsOrdRxnDescriptorValue
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, NumRxnDescriptor, NumRxnDescriptorValue
+from DRP.models.descriptorDataset import DescriptorDataset
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsOrdRxnDescriptor('outcome', 1, 4)
+@createsOrdRxnDescriptorValue('Narnia', 'r01', 'outcome', 3)
+class Dataset(DRPTestCase):
+    """Check that datasets keep their values through saving, loading and arff export."""
+
+    def setUp(self):
+        """Give one reaction a numeric value."""
+        self.number = NumRxnDescriptor.objects.create(
+            heading='number', name='number', calculatorSoftware='manual', calculatorSoftwareVersion='0')
+        NumRxnDescriptorValue.objects.create(
+            descriptor=self.number, reaction=PerformedReaction.objects.get(reference='r02'), value=0.25)
+
+    def tearDown(self):
+        """Remove the numeric descriptor."""
+        NumRxnDescriptorValue.objects.filter(descriptor=self.number).delete()
+        self.number.delete()
+
+    def test_roundTrip(self):
+        """A saved and loaded dataset has the values and missing values of the database."""
+        reactions = PerformedReaction.objects.all()
+        dataset = DescriptorDataset.fromReactions(reactions, ['outcome', 'number'])
+        f = io.BytesIO()
+        dataset.save(f)
+        f.seek(0)
+        loaded = DescriptorDataset.load(f)
+        self.assertEqual(loaded.headers, ['outcome', 'number'])
+        expected = reactions.toDescriptorMatrix(whitelistHeaders=['outcome', 'number'])[0]
+        np.testing.assert_array_equal(loaded.matrix(), expected)
+        self.assertEqual(loaded.columns['outcome'].values.dtype, np.int64)
+
+    def test_arff(self):
+        """The arff export writes missing values as ? and numbers unquoted."""
+        dataset = DescriptorDataset.fromReactions(PerformedReaction.objects.all(), ['outcome', 'number'])
+        f = io.BytesIO()
+        dataset.toArff(f, headers=['number', 'outcome'])
+        data = f.getvalue().decode().split('@data\n')[1].splitlines()
+        self.assertEqual(data, ['?,3', '0.25,?'])
+
+
+suite = unittest.TestSuite([
+    loadTests(Dataset)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Tests for recording changes to reactions and recalculating only the affected descriptors."""
+
+import unittest
+from .decorators import createsUser, joinsLabGroup, createsChemicalClass, createsCompound
+from .decorators import createsCompoundRole, createsPerformedReaction, createsCompoundQuantity
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, Reaction, CompoundQuantity, CompoundRole, NumRxnDescriptorValue, RxnDescriptorChange
+from DRP.models.rxnDescriptorChange import quantitySource, molSource, ALL
+from DRP.plugins.rxndescriptors import drp
+from DRP.plugins.rxndescriptors.dependencies import DependencyGraph
+from DRP.management.commands.calculate_descriptors import calculate_reaction_descriptors
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsChemicalClass('org', 'Organic')
+@createsCompound('EtOH', 682, 'org', 'Narnia')
+@createsCompoundRole('Org', 'Organic')
+@createsCompoundRole('Inorg', 'Inorganic')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsCompoundQuantity('R01', 'EtOH', 'Org', '0.5')
+class RecordsChanges(DRPTestCase):
+    """Check that changes to compound quantities are recorded."""
+
+    def test_quantity(self):
+        """Saving a quantity records a change for its role, and the old role if it moved."""
+        reaction = PerformedReaction.objects.get(reference='r01')
+        self.assertEqual(set(RxnDescriptorChange.objects.filter(reaction=reaction).values_list('source', flat=True)),
+                         {ALL, quantitySource('Org')})
+        RxnDescriptorChange.objects.all().delete()
+        quantity = CompoundQuantity.objects.get(reaction=reaction)
+        quantity.role = CompoundRole.objects.get(label='Inorg')
+        quantity.save()
+        self.assertEqual(set(RxnDescriptorChange.objects.filter(reaction=reaction).values_list('source', flat=True)),
+                         {quantitySource('Org'), quantitySource('Inorg')})
+        self.assertTrue(Reaction.objects.get(pk=reaction.pk).dirty)
+        quantity.role = CompoundRole.objects.get(label='Org')
+        quantity.save()
+
+    def test_noDuplicates(self):
+        """Recording a change twice keeps one record of it."""
+        reaction = PerformedReaction.objects.get(reference='r01')
+        RxnDescriptorChange.objects.record([(reaction.pk, quantitySource('Org'))])
+        self.assertEqual(RxnDescriptorChange.objects.filter(reaction=reaction, source=quantitySource('Org')).count(), 1)
+
+    def test_recordedAgain(self):
+        """A change recorded again while its reaction is calculated is kept, and the reaction left dirty."""
+        reaction = PerformedReaction.objects.get(reference='r01')
+        reactions = Reaction.objects.filter(pk=reaction.pk)
+        reactions.update(calculating=True)
+        recorded = list(RxnDescriptorChange.objects.filter(reaction=reaction).values_list('pk', 'recorded'))
+        RxnDescriptorChange.objects.record([(reaction.pk, quantitySource('Org'))])
+        RxnDescriptorChange.objects.deleteCalculated(recorded)
+        reactions.update(dirty=False, calculating=False)
+        RxnDescriptorChange.objects.markOutstanding(reactions)
+        self.assertEqual(list(RxnDescriptorChange.objects.filter(reaction=reaction).values_list('source', flat=True)),
+                         [quantitySource('Org')])
+        self.assertTrue(Reaction.objects.get(pk=reaction.pk).dirty)
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsChemicalClass('org', 'Organic')
+@createsCompound('EtOH', 682, 'org', 'Narnia')
+@createsCompoundRole('Org', 'Organic')
+@createsCompoundRole('Inorg', 'Inorganic')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsCompoundQuantity('R01', 'EtOH', 'Org', '0.5')
+class IncrementalCalculation(DRPTestCase):
+    """Check that only the descriptors depending on a change are recalculated."""
+
+    deleteDescriptors = False
+
+    def test_graph(self):
+        """The drp plugin's descriptors depend on the quantities and molecular descriptors of their role."""
+        graph = DependencyGraph([drp])
+        affected = graph.whitelist(drp, [quantitySource('Org')])
+        self.assertIn('Org_amount_count', affected)
+        self.assertIn('C_mols', affected)
+        self.assertNotIn('Inorg_amount_count', affected)
+        self.assertNotIn('boolean_crystallisation_outcome', affected)
+        affected = graph.whitelist(drp, [molSource('Inorg')])
+        self.assertNotIn('Org_amount_count', affected)
+        self.assertNotIn('Inorg_amount_count', affected)
+        self.assertIsNone(graph.whitelist(drp, [ALL, quantitySource('Org')]))
+
+    def test_newReaction(self):
+        """A new reaction has every descriptor calculated, including those of roles it has no compounds in."""
+        reactions = Reaction.objects.filter(performedreaction__reference='r01')
+        self.assertTrue(RxnDescriptorChange.objects.filter(reaction__in=reactions, source=ALL).exists())
+        calculate_reaction_descriptors(reactions, plugins=[drp.__name__])
+        self.assertEqual(NumRxnDescriptorValue.objects.get(reaction__in=reactions, descriptor__heading='Inorg_amount_count').value, 0)
+        self.assertFalse(RxnDescriptorChange.objects.filter(reaction__in=reactions).exists())
+
+    def test_recalculation(self):
+        """Values which do not depend on the recorded change are left alone."""
+        reactions = Reaction.objects.filter(performedreaction__reference='r01')
+        drp.calculate_many(reactions)
+        before = dict(NumRxnDescriptorValue.objects.filter(reaction__in=reactions).values_list(
+            'descriptor__heading', 'uid'))
+        RxnDescriptorChange.objects.all().delete()
+        RxnDescriptorChange.objects.record([(reactions[0].pk, quantitySource('Inorg'))])
+        calculate_reaction_descriptors(reactions, plugins=[drp.__name__])
+        after = dict(NumRxnDescriptorValue.objects.filter(reaction__in=reactions).values_list(
+            'descriptor__heading', 'uid'))
+        self.assertEqual(set(before), set(after))
+        self.assertEqual(before['Org_amount_count'], after['Org_amount_count'])
+        self.assertNotEqual(before['Inorg_amount_count'], after['Inorg_amount_count'])
+        self.assertFalse(RxnDescriptorChange.objects.filter(reaction__in=reactions).exists())
+
+
+suite = unittest.TestSuite([
+    loadTests(RecordsChanges),
+    loadTests(IncrementalCalculation)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
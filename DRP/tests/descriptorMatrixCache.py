@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Tests for the columnar descriptor matrix cache and the bulk descriptor matrix."""
+
+import unittest
+import tempfile
+import shutil
+import os
+from django.test.utils import override_settings
+from .decorators import createsPerformedReactionSetOrd
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, NumRxnDescriptor, OrdRxnDescriptorValue, NumRxnDescriptorValue
+from DRP.models.descriptorMatrixCache import DescriptorMatrixCache
+from DRP.models.querysets import ArffQuerySet
+import numpy as np
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsPerformedReactionSetOrd
+class CacheMatchesDatabase(DRPTestCase):
+    """Check that cached columns agree with the database and follow updates."""
+
+    def setUp(self):
+        """Use a scratch directory for the cache."""
+        self.directory = tempfile.mkdtemp()
+        self.cache = DescriptorMatrixCache(self.directory)
+        self.headers = ['outcome_manual_0', 'testNumber_manual_0']
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.directory)
+
+    def assertMatches(self, reactions):
+        """Compare every cached value with the values in the database."""
+        rowLookup, columns = self.cache.pythonColumns(reactions, self.headers)
+        for reaction in reactions:
+            row = rowLookup[reaction.pk]
+            self.assertEqual(columns['outcome_manual_0'][row], OrdRxnDescriptorValue.objects.get(
+                reaction=reaction, descriptor__heading='outcome').value)
+            self.assertEqual(columns['testNumber_manual_0'][row], NumRxnDescriptorValue.objects.get(
+                reaction=reaction, descriptor__heading='testNumber').value)
+
+    def test_cold(self):
+        """A freshly built cache matches the database."""
+        self.assertMatches(PerformedReaction.objects.all())
+
+    def test_warm(self):
+        """A second read is served from disk and still matches."""
+        reactions = PerformedReaction.objects.all()
+        self.assertMatches(reactions)
+        self.assertMatches(reactions)
+
+    def test_invalidation(self):
+        """Saving a value invalidates the cached row for that reaction."""
+        reactions = PerformedReaction.objects.all()
+        self.assertMatches(reactions)
+        value = NumRxnDescriptorValue.objects.filter(
+            descriptor=NumRxnDescriptor.objects.get(heading='testNumber'))[0]
+        value.value = 42.0
+        value.save()
+        self.assertMatches(reactions)
+
+    def test_untouchedColumns(self):
+        """Changing a single value rewrites only the column file holding it."""
+        reactions = PerformedReaction.objects.all()
+        self.assertMatches(reactions)
+        paths = dict((header, os.path.join(self.directory, DescriptorMatrixCache._columnFile(header)))
+                     for header in self.headers)
+        before = dict((header, (os.stat(path).st_ino, os.stat(path).st_mtime, open(path, 'rb').read()))
+                      for header, path in paths.items())
+        value = NumRxnDescriptorValue.objects.filter(
+            descriptor=NumRxnDescriptor.objects.get(heading='testNumber'))[0]
+        value.value = 42.0
+        value.save()
+        self.assertMatches(reactions)
+        outcome = paths['outcome_manual_0']
+        self.assertEqual(before['outcome_manual_0'],
+                         (os.stat(outcome).st_ino, os.stat(outcome).st_mtime, open(outcome, 'rb').read()))
+        self.assertNotEqual(before['testNumber_manual_0'][2], open(paths['testNumber_manual_0'], 'rb').read())
+
+    def test_rows(self):
+        """Expanded rows from the cache match those built from the database."""
+        reactions = PerformedReaction.objects.all()
+        cached = list(reactions.rows(True, self.headers))
+        with override_settings(DESCRIPTOR_MATRIX_CACHE=False):
+            uncached = list(reactions.rows(True, self.headers))
+        for c, u in zip(cached, uncached):
+            for header in self.headers:
+                self.assertEqual(c.get(header), u.get(header))
+
+
+@createsPerformedReactionSetOrd
+class DescriptorMatrixPivot(DRPTestCase):
+    """Check that the bulk descriptor matrix agrees with the row-by-row export."""
+
+    def runTest(self):
+        """Compare the pivoted matrix with expanded rows."""
+        headers = ['outcome_manual_0', 'testNumber_manual_0']
+        reactions = PerformedReaction.objects.all()
+        matrix, matrixHeaders, pks = reactions.toDescriptorMatrix(headers)
+        self.assertEqual(list(matrixHeaders), headers)
+        self.assertEqual(list(pks), sorted(r.pk for r in reactions))
+        with override_settings(DESCRIPTOR_MATRIX_CACHE=False):
+            for i, row in enumerate(reactions.rows(True, headers)):
+                self.assertEqual(row['id'], pks[i])
+                for j, header in enumerate(headers):
+                    self.assertEqual(matrix[i, j], row[header])
+
+
+@createsPerformedReactionSetOrd
+class NPArrayMatchesRows(DRPTestCase):
+    """Check that toNPArray gives the same array whether or not it is built row by row."""
+
+    def runTest(self):
+        """Compare the array built from pivoted values with the one built from rows()."""
+        headers = ['outcome_manual_0', 'testNumber_manual_0']
+        reactions = PerformedReaction.objects.all()
+        for missing in (np.nan, -1, '?'):
+            fast = reactions.toNPArray(expanded=True, whitelistHeaders=headers, missing=missing)
+            slow = ArffQuerySet.toNPArray(reactions, expanded=True, whitelistHeaders=headers, missing=missing)
+            self.assertEqual(fast.dtype, slow.dtype)
+            np.testing.assert_array_equal(fast, slow)
+
+
+suite = unittest.TestSuite([
+    loadTests(CacheMatchesDatabase),
+    loadTests(DescriptorMatrixPivot),
+    loadTests(NPArrayMatchesRows),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
+    # Runs the test- a good way to check that this particular test set works
+    # without having to run all the tests.
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Tests for the background descriptor calculation worker."""
+
+import unittest
+from .decorators import createsUser, joinsLabGroup, createsChemicalClass, createsCompound
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import Compound
+from DRP.management.commands.descriptor_worker import claim, work, calculateBatch
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsChemicalClass('org', 'Organic')
+@createsCompound('EtOH', 682, 'org', 'Narnia')
+@createsCompound('dmed', 67600, 'org', 'Narnia')
+class Worker(DRPTestCase):
+    """Check that workers claim objects once each and clear their flags."""
+
+    def test_claim(self):
+        """Each claim takes objects which have not already been claimed."""
+        first = claim(Compound.objects.all(), 1)
+        second = claim(Compound.objects.all(), 1)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)
+        self.assertEqual(claim(Compound.objects.all(), 1), [])
+        self.assertEqual(Compound.objects.filter(calculating=True).count(), 2)
+        Compound.objects.update(calculating=False)
+
+    def test_work(self):
+        """Running until there is nothing left leaves no dirty or calculating objects."""
+        work(batchSize=1, once=True, plugins=[])
+        self.assertFalse(Compound.objects.filter(dirty=True).exists())
+        self.assertFalse(Compound.objects.filter(calculating=True).exists())
+
+    def test_failure(self):
+        """An object whose calculation fails is held back, and the rest of its batch is calculated."""
+        bad = Compound.objects.order_by('pk')[0].pk
+
+        def calculate(compounds):
+            if compounds.filter(pk=bad).exists():
+                raise RuntimeError('Cannot calculate')
+
+        pks = claim(Compound.objects.all(), 2)
+        calculateBatch(Compound, pks, calculate, retryDelay=600)
+        failed = Compound.objects.get(pk=bad)
+        self.assertEqual(failed.calculationFailures, 1)
+        self.assertTrue(failed.dirty)
+        self.assertFalse(failed.calculating)
+        self.assertFalse(Compound.objects.exclude(pk=bad).filter(dirty=True).exists())
+        self.assertEqual(claim(Compound.objects.all(), 2), [])
+        Compound.objects.filter(pk=bad).update(calculationRetry=None)
+        self.assertEqual(claim(Compound.objects.all(), 2), [bad])
+        calculateBatch(Compound, [bad], calculate, retryDelay=600)
+        self.assertEqual(Compound.objects.get(pk=bad).calculationFailures, 2)
+        Compound.objects.update(calculationFailures=0, calculationRetry=None)
+
+
+suite = unittest.TestSuite([
+    loadTests(Worker)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Tests for combining the predictions of the component models of a model container."""
+
+import unittest
+import numpy as np
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models.modelContainer import ensemblePredictions, alignPredictions
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+def components(*predictions):
+    """Return component predictions as (reaction pks, values) array pairs from dictionaries of pk to value."""
+    pairs = []
+    for prediction in predictions:
+        pks = sorted(prediction)
+        values = np.empty(len(pks), dtype=object)
+        values[:] = [prediction[pk] for pk in pks]
+        pairs.append((np.array(pks, dtype=int), values))
+    return pairs
+
+
+class Ensemble(DRPTestCase):
+    """Check the vote and average over a matrix of component predictions."""
+
+    def test_vote(self):
+        """The value most models predict wins, over the models which predicted each reaction."""
+        pks, values = ensemblePredictions(components(
+            {1: True, 2: False, 3: True},
+            {1: True, 2: False},
+            {1: False, 2: True, 4: False}))
+        self.assertEqual(pks.tolist(), [1, 2, 3, 4])
+        self.assertEqual(values.tolist(), [True, False, True, False])
+
+    def test_tie(self):
+        """Tied votes are won by one of the tied values."""
+        pks, values = ensemblePredictions(components({1: 'a'}, {1: 'b'}, {1: 'b'}, {1: 'a'}))
+        self.assertIn(values[0], ('a', 'b'))
+
+    def test_average(self):
+        """Numeric predictions are averaged, ignoring missing predictions."""
+        pks, values = ensemblePredictions(components(
+            {1: 1.0, 2: 2.0, 3: None},
+            {1: 3.0, 3: None},
+            {2: 4.0}), numeric=True)
+        self.assertEqual(pks.tolist(), [1, 2, 3])
+        self.assertEqual(values.tolist(), [2.0, 3.0, None])
+
+    def test_empty(self):
+        """No reactions, or no component models, give empty predictions."""
+        for componentPredictions in ([], components({}, {})):
+            for numeric in (False, True):
+                pks, values = ensemblePredictions(componentPredictions, numeric=numeric)
+                self.assertEqual(pks.tolist(), [])
+                self.assertEqual(values.tolist(), [])
+
+    def test_align(self):
+        """Predictions are put in the order of the reactions given, with None for those not predicted."""
+        (pks, values), = components({1: 'a', 3: 'c', 4: 'd'})
+        aligned = alignPredictions(np.array([4, 2, 1, 5]), pks, values)
+        self.assertEqual(aligned.tolist(), ['d', None, 'a', None])
+
+
+suite = unittest.TestSuite([
+    loadTests(Ensemble)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
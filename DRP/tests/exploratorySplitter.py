@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Tests for the splitter which keeps reactions of the same chemistry together."""
+
+import unittest
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction, createsCatRxnDescriptor, deletesDataSets
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, CatRxnDescriptor, CatRxnDescriptorValue, CategoricalDescriptorPermittedValue
+from DRP.ml_models.splitters.exploratorySplitter import Splitter
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+references = ['r01', 'r02', 'r03', 'r04', 'r05', 'r06']
+
+
+@deletesDataSets
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsPerformedReaction('Narnia', 'Aslan', 'R03')
+@createsPerformedReaction('Narnia', 'Aslan', 'R04')
+@createsPerformedReaction('Narnia', 'Aslan', 'R05')
+@createsPerformedReaction('Narnia', 'Aslan', 'R06')
+@createsCatRxnDescriptor('rxnSpaceHash1')
+class Exploratory(DRPTestCase):
+    """Check that the reactions of each compound set fall wholly in the training or test set."""
+
+    def setUp(self):
+        """Put the reactions into three compound sets of two."""
+        descriptor = CatRxnDescriptor.objects.get(heading='rxnSpaceHash1')
+        self.hashes = [CategoricalDescriptorPermittedValue.objects.create(descriptor=descriptor, value=value)
+                       for value in ('a', 'b', 'c')]
+        CatRxnDescriptorValue.objects.bulk_create([
+            CatRxnDescriptorValue(descriptor=descriptor, value=self.hashes[i // 2],
+                                  reaction=PerformedReaction.objects.get(reference=ref))
+            for i, ref in enumerate(references)])
+
+    def tearDown(self):
+        """Remove the hash values."""
+        CatRxnDescriptorValue.objects.all().delete()
+        CategoricalDescriptorPermittedValue.objects.filter(pk__in=[h.pk for h in self.hashes]).delete()
+
+    def test_split(self):
+        """Each split divides the compound sets between training and test sets."""
+        reactions = PerformedReaction.objects.all()
+        splits = Splitter('exploratory', num_splits=3, margin_percent=0.2).split(reactions)
+        self.assertEqual(len(splits), 3)
+        groups = [set(references[i:i + 2]) for i in range(0, len(references), 2)]
+        for train, test in splits:
+            trainRefs = set(train.reactions.values_list('reference', flat=True))
+            testRefs = set(test.reactions.values_list('reference', flat=True))
+            self.assertEqual(len(testRefs), 2)
+            self.assertEqual(trainRefs | testRefs, set(references))
+            self.assertIn(testRefs, groups)
+
+
+suite = unittest.TestSuite([
+    loadTests(Exploratory)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Tests for the cache of loaded model visitors."""
+
+import unittest
+import tempfile
+import shutil
+import os
+from .drpTestCase import DRPTestCase, runTests
+from DRP.ml_models.loadedModelCache import LoadedModelCache
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class FakeFile(object):
+    """Stands in for the outputFile of a statsModel."""
+
+    def __init__(self, name):
+        """Name the file."""
+        self.name = name
+
+
+class FakeStatsModel(object):
+    """Stands in for a statsModel, having only a pk and an outputFile."""
+
+    def __init__(self, pk, fileName):
+        """Set the pk and output file name."""
+        self.pk = pk
+        self.outputFile = FakeFile(fileName)
+
+
+class Cache(DRPTestCase):
+    """Check that loaded visitors are reused, reloaded when their file changes and evicted when too many."""
+
+    def setUp(self):
+        """Write a model file for each of three statsModels."""
+        self.directory = tempfile.mkdtemp()
+        self.statsModels = []
+        for pk in range(3):
+            fileName = os.path.join(self.directory, '{}.model'.format(pk))
+            with open(fileName, 'w') as f:
+                f.write('model')
+            self.statsModels.append(FakeStatsModel(pk, fileName))
+        self.loads = []
+
+    def tearDown(self):
+        """Remove the model files."""
+        shutil.rmtree(self.directory)
+
+    def load(self, statsModel):
+        """Return a loader which records its calls."""
+        def _load():
+            self.loads.append(statsModel.pk)
+            return object()
+        return _load
+
+    def test_reuse(self):
+        """A visitor is loaded once, and again after its model file changes."""
+        cache = LoadedModelCache(2)
+        statsModel = self.statsModels[0]
+        first = cache.get(statsModel, self.load(statsModel))
+        self.assertIs(cache.get(statsModel, self.load(statsModel)), first)
+        mtime = os.path.getmtime(statsModel.outputFile.name)
+        os.utime(statsModel.outputFile.name, (mtime + 10, mtime + 10))
+        self.assertIsNot(cache.get(statsModel, self.load(statsModel)), first)
+        self.assertEqual(self.loads, [0, 0])
+        self.assertEqual(len(cache), 1)
+
+    def test_eviction(self):
+        """The least recently used visitor is dropped when the cache is full."""
+        cache = LoadedModelCache(2)
+        for statsModel in self.statsModels[:2]:
+            cache.get(statsModel, self.load(statsModel))
+        cache.get(self.statsModels[0], self.load(self.statsModels[0]))
+        cache.get(self.statsModels[2], self.load(self.statsModels[2]))
+        cache.get(self.statsModels[0], self.load(self.statsModels[0]))
+        cache.get(self.statsModels[1], self.load(self.statsModels[1]))
+        self.assertEqual(self.loads, [0, 1, 2, 1])
+
+
+suite = unittest.TestSuite([
+    loadTests(Cache)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Tests for queueing, claiming and cancelling model build jobs."""
+
+import unittest
+from django.utils import timezone
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import ModelContainer, ModelBuildJob
+from DRP.models.modelBuildJob import BuildCancelled, LeaseLost, leaseDuration
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class Jobs(DRPTestCase):
+    """Check that jobs are claimed in order, within the concurrency limit, and can be cancelled."""
+
+    def setUp(self):
+        """Queue builds of two containers."""
+        self.containers = [ModelContainer.objects.create(modelVisitorLibrary='weka', modelVisitorTool='SVM_PUK')
+                           for i in range(2)]
+        self.jobs = [ModelBuildJob.objects.enqueue(container) for container in self.containers]
+
+    def tearDown(self):
+        """Remove the jobs and containers."""
+        ModelBuildJob.objects.all().delete()
+        for container in self.containers:
+            container.delete()
+
+    def test_claim(self):
+        """Jobs are claimed oldest first, and no more than the concurrency limit run at once."""
+        self.assertEqual(ModelBuildJob.objects.claim(1), self.jobs[0])
+        self.assertIsNone(ModelBuildJob.objects.claim(1))
+        self.assertEqual(ModelBuildJob.objects.claim(2), self.jobs[1])
+        self.assertIsNone(ModelBuildJob.objects.claim(3))
+
+    def test_cancel(self):
+        """Queued jobs are cancelled at once, and running ones at their next progress report."""
+        self.jobs[1].cancel()
+        self.assertEqual(ModelBuildJob.objects.get(pk=self.jobs[1].pk).status, ModelBuildJob.CANCELLED)
+        job = ModelBuildJob.objects.claim(2)
+        self.assertEqual(job, self.jobs[0])
+        job.recordProgress(1, 4, timezone.now())
+        ModelBuildJob.objects.get(pk=job.pk).cancel()
+        with self.assertRaises(BuildCancelled):
+            job.recordProgress(2, 4, timezone.now())
+        self.assertEqual(ModelBuildJob.objects.get(pk=job.pk).progress()['modelsBuilt'], 2)
+
+    def test_expiredLease(self):
+        """A running job whose lease has expired is queued again, and its old worker can no longer report progress."""
+        job = ModelBuildJob.objects.claim(1)
+        self.assertIsNone(ModelBuildJob.objects.claim(1))
+        ModelBuildJob.objects.filter(pk=job.pk).update(
+            heartbeat=timezone.now() - 2 * leaseDuration())
+        reclaimed = ModelBuildJob.objects.claim(1)
+        self.assertEqual(reclaimed, job)
+        self.assertNotEqual(reclaimed.lease, job.lease)
+        with self.assertRaises(LeaseLost):
+            job.recordProgress(1, 4, timezone.now())
+        reclaimed.recordProgress(1, 4, timezone.now())
+
+    def test_hiddenError(self):
+        """The traceback of a failed build can be left out of its progress."""
+        ModelBuildJob.objects.filter(pk=self.jobs[0].pk).update(status=ModelBuildJob.FAILED, error='Traceback')
+        job = ModelBuildJob.objects.get(pk=self.jobs[0].pk)
+        self.assertEqual(job.progress()['error'], 'Traceback')
+        self.assertEqual(job.progress(showError=False)['error'], '')
+
+
+suite = unittest.TestSuite([
+    loadTests(Jobs)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -6,6 +6,7 @@ from DRP.models import PerformedReaction, ModelContainer, Descriptor
 from .decorators import createsPerformedReactionSetOrd, createsPerformedReactionSetBool
 from .drpTestCase import DRPTestCase, runTests
 from django.conf import settings
+from django.test.utils import override_settings
 loadTests = unittest.TestLoader().loadTestsFromTestCase
 
 
@@ -14,6 +15,8 @@ class ModelTest(DRPTestCase):
 
     splitterOptions = None
     visitorOptions = None
+    workers = None
+    settingsOverrides = {}
 
     def runTest(self):
         """The actual test."""
@@ -23,7 +26,8 @@ class ModelTest(DRPTestCase):
         container = ModelContainer.create(self.modelLibrary, self.modelTool, predictors, responses, splitter=self.splitter,
                                           reactions=reactions, splitterOptions=self.splitterOptions, visitorOptions=self.visitorOptions)
 
-        container.build()
+        with override_settings(**self.settingsOverrides):
+            container.build(workers=self.workers)
         container.save()
         container.full_clean()
 
@@ -49,6 +53,16 @@ class WekaSVMExpTest(ModelTest):
     splitter = "ExploratorySplitter"
 
 
+@createsPerformedReactionSetOrd
+class WekaSVMKFServerTest(ModelTest):
+    """Tests Weka SVM run on the weka server."""
+
+    modelLibrary = "weka"
+    modelTool = "SVM_PUK"
+    splitter = "KFoldSplitter"
+    settingsOverrides = {'WEKA_SERVER': True}
+
+
 @createsPerformedReactionSetOrd
 class WekaJ48KFTest(ModelTest):
     """Tests Weka j48."""
@@ -79,6 +93,7 @@ class WekaNBKFTest(ModelTest):
 suite = unittest.TestSuite([
     loadTests(WekaSVMKFTest),
     loadTests(WekaSVMExpTest),
+    loadTests(WekaSVMKFServerTest),
     loadTests(WekaJ48KFTest),
     loadTests(WekaKNNKFTest),
     loadTests(WekaNBKFTest),
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Tests for the reaction nearest-neighbour index."""
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from .drpTestCase import DRPTestCase, runTests
+from DRP.recommendation.reactionMetric import ReactionMetric
+from DRP.recommendation.neighbourIndex import ReactionNeighbourIndex
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class Queries(DRPTestCase):
+    """Check that queries find the same neighbours as a brute force search."""
+
+    def setUp(self):
+        """Make an index of some random points, with more added afterwards."""
+        rng = np.random.RandomState(0)
+        self.matrix = rng.normal(size=(120, 4))
+        self.matrix[rng.uniform(size=self.matrix.shape) < 0.05] = np.nan
+        self.pks = np.arange(1000, 1120)
+        self.metric = ReactionMetric.fit(self.matrix, ['a', 'b', 'c', 'd'])
+        self.points = self.metric.embed(self.matrix)
+        self.index = ReactionNeighbourIndex(self.metric, self.pks[:100], self.points[:100], rebuildFraction=0.5)
+        self.index.addPoints(self.pks[100:], self.points[100:])
+        self.queries = rng.normal(size=(15, 4))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the saved index."""
+        shutil.rmtree(self.directory)
+
+    def bruteForce(self, queries, k, exclude=None):
+        """Return the pks of the k nearest points to each query, in order."""
+        distances = self.metric.pairwise(queries, self.points)
+        if exclude is not None:
+            distances[self.pks[np.newaxis, :] == np.asarray(exclude)[:, np.newaxis]] = np.inf
+        return self.pks[np.argsort(distances, axis=1, kind='mergesort')[:, :k]]
+
+    def test_pending(self):
+        """Points added since the tree was built are searched too."""
+        self.assertEqual(self.index.treeSize, 100)
+        self.assertEqual(len(self.index), 120)
+        distances, pks = self.index.query(self.queries, k=5)
+        self.assertEqual(pks.tolist(), self.bruteForce(self.queries, 5).tolist())
+        np.testing.assert_allclose(distances, np.sort(self.metric.pairwise(self.queries, self.points), axis=1)[:, :5])
+
+    def test_rebuild(self):
+        """The tree is built again once enough points are added, and replaced points are moved."""
+        moved = self.points[:50] + 0.01
+        self.index.addPoints(self.pks[:50] + 500, moved)
+        self.assertEqual(self.index.treeSize, 170)
+        self.index.addPoints(self.pks[:1], self.points[1:2] * 0.5)
+        self.points[0] = self.points[1] * 0.5
+        self.pks = np.concatenate((self.pks, self.pks[:50] + 500))
+        self.points = np.vstack((self.points, moved))
+        self.assertEqual(self.index.query(self.queries, k=3)[1].tolist(), self.bruteForce(self.queries, 3).tolist())
+
+    def test_exclude(self):
+        """A point's own reaction can be left out of its neighbours."""
+        distances, pks = self.index.queryPoints(self.points[95:105], k=4, exclude=self.pks[95:105])
+        self.assertEqual(pks.tolist(), self.bruteForce(self.matrix[95:105], 4, exclude=self.pks[95:105]).tolist())
+
+    def test_headers(self):
+        """Columns given by header are aligned with the metric's, and missing ones are missing values."""
+        reordered = self.queries[:, [2, 0, 1]]
+        aligned = self.queries.copy()
+        aligned[:, 3] = np.nan
+        self.assertEqual(self.index.query(reordered, k=2, headers=['c', 'a', 'b'])[1].tolist(),
+                         self.bruteForce(aligned, 2).tolist())
+
+    def test_save(self):
+        """A saved index gives the same answers when loaded."""
+        path = os.path.join(self.directory, 'index.npz')
+        self.index.save(path)
+        loaded = ReactionNeighbourIndex.load(path)
+        self.assertEqual(loaded.metric.headers, self.metric.headers)
+        self.assertEqual(loaded.query(self.queries, k=5)[1].tolist(), self.index.query(self.queries, k=5)[1].tolist())
+
+    def test_empty(self):
+        """Adding no reactions leaves the index as it was."""
+        self.index.addPoints([], [])
+        self.assertEqual(len(self.index), 120)
+        empty = ReactionNeighbourIndex(self.metric)
+        empty.addPoints([], [])
+        self.assertEqual(empty.query(self.queries, k=2)[1].shape, (15, 0))
+
+
+suite = unittest.TestSuite([
+    loadTests(Queries),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -1,7 +1,11 @@
 """The rdkit suite of tests for DRP."""
 from . import drp_rdkit
+from . import drp_rxndescriptors
+from . import chemaxon
 import unittest
 
 suite = unittest.TestSuite([
-    drp_rdkit.suite
+    drp_rdkit.suite,
+    drp_rxndescriptors.suite,
+    chemaxon.suite
 ])
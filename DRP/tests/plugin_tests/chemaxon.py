@@ -0,0 +1,123 @@
+"""Tests for the batched cxcalc calculation of the chemaxon plugin, with cxcalc itself mocked out."""
+
+import unittest
+import tempfile
+import shutil
+from unittest import mock
+from django.test.utils import override_settings
+from ..drpTestCase import DRPTestCase, runTests
+from DRP.plugins.moldescriptors import chemaxon
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class FakeCompound(object):
+    """Just enough of a compound for the batched calculation."""
+
+    def __init__(self, pk, smiles='C'):
+        """Make a compound with the given primary key and SMILES."""
+        self.pk = pk
+        self.smiles = smiles
+
+    def __repr__(self):
+        """Name the compound by its primary key."""
+        return 'FakeCompound({})'.format(self.pk)
+
+
+class FakeCxcalc(object):
+    """
+    Stand in for _runCxcalc.
+
+    leconformer gives an sdf record titled with the name of each SMILES line, in reverse order and
+    leaving out those in missing. The calculation gives a row of (title, title + 0.5) for each record,
+    unless fail is True.
+    """
+
+    def __init__(self, missing=(), fail=False):
+        """Leave the given names out of the conformers, and fail the calculation if fail is True."""
+        self.missing = set(str(name) for name in missing)
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, args):
+        """Return a tuple of (return code, stdout, stderr) for the arguments."""
+        self.calls.append(args)
+        if args[-1] == 'leconformer':
+            with open(args[0]) as f:
+                names = [line.split()[1] for line in f if line.strip()]
+            records = ['{}\n  fake\n\n  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n$$$$\n'.format(name)
+                       for name in reversed(names) if name not in self.missing]
+            return 0, ''.join(records), ''
+        if self.fail:
+            return 1, '', 'license expired'
+        with open(args[2]) as f:
+            titles = [record.split('\n', 1)[0] for record in f.read().split('$$$$\n') if record.strip()]
+        return 0, ''.join('{0}\t{0}.5\n'.format(title) for title in titles), ''
+
+
+class CalculateChunk(DRPTestCase):
+    """Check that chunks of compounds are matched with their cxcalc results."""
+
+    def setUp(self):
+        """Use a scratch directory for the cxcalc files."""
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(TMP_DIR=self.directory)
+        self.override.enable()
+        self.compounds = [FakeCompound(pk) for pk in (11, 7, 23)]
+        self.commands = {'a': 'a', 'b': 'b'}
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        self.override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_matching(self):
+        """Results are matched to compounds by the titles of their conformers, not by their order."""
+        with mock.patch.object(chemaxon, '_runCxcalc', FakeCxcalc()):
+            results, failed = chemaxon._calculateChunk(self.compounds, self.commands)
+        self.assertEqual(failed, [])
+        self.assertEqual([(compound.pk, resList) for compound, resList in results],
+                         [(compound.pk, [str(compound.pk), '{}.5'.format(compound.pk)]) for compound in self.compounds])
+
+    def test_missing(self):
+        """Compounds without a conformer are left to be calculated individually."""
+        with mock.patch.object(chemaxon, '_runCxcalc', FakeCxcalc(missing=[7])):
+            results, failed = chemaxon._calculateChunk(self.compounds, self.commands)
+        self.assertEqual(failed, [self.compounds[1]])
+        self.assertEqual([(compound.pk, resList[0]) for compound, resList in results], [(11, '11'), (23, '23')])
+
+    def test_failure(self):
+        """If the calculation fails, every compound in the chunk is left to be calculated individually."""
+        with mock.patch.object(chemaxon, '_runCxcalc', FakeCxcalc(fail=True)):
+            results, failed = chemaxon._calculateChunk(self.compounds, self.commands)
+        self.assertEqual(results, [])
+        self.assertEqual(failed, self.compounds)
+
+
+class CalculateMany(DRPTestCase):
+    """Check that calculate_many falls back to calculating compounds one at a time."""
+
+    def test_fallback(self):
+        """Compounds of a failed chunk, and those without SMILES, are calculated individually."""
+        compounds = [FakeCompound(pk) for pk in (1, 2, 3)] + [FakeCompound(4, smiles='')]
+        calculated = []
+
+        def calculate(compound, descriptorDict, cxcalcCommands, verbose=False, num_to_create=[], ord_to_create=[]):
+            calculated.append(compound)
+            return num_to_create, ord_to_create
+
+        with mock.patch.object(chemaxon, 'setup_pHdependentDescriptors', return_value={}), \
+                mock.patch.object(chemaxon, 'delete_descriptors'), \
+                mock.patch.object(chemaxon, '_calculateChunk', side_effect=lambda chunk, commands: ([], chunk)), \
+                mock.patch.object(chemaxon, '_calculate', side_effect=calculate), \
+                mock.patch.object(chemaxon, 'chunk_size', 2):
+            chemaxon.calculate_many(compounds)
+        self.assertEqual(sorted(compound.pk for compound in calculated), [1, 2, 3, 4])
+
+
+suite = unittest.TestSuite([
+    loadTests(CalculateChunk),
+    loadTests(CalculateMany),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
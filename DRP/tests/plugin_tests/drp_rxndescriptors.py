@@ -0,0 +1,93 @@
+"""A test suite for the drp plugin for calculating reaction descriptors."""
+
+import unittest
+from collections import Counter
+from itertools import chain
+from ..drpTestCase import DRPTestCase, runTests
+from DRP.tests.decorators import createsUser, joinsLabGroup, createsChemicalClass
+from DRP.tests.decorators import createsCompound, createsCompoundRole, createsPerformedReaction, createsCompoundQuantity
+from DRP.plugins.moldescriptors import drp_rdkit
+from DRP.plugins.rxndescriptors import drp
+from DRP.models import Compound, PerformedReaction, NumRxnDescriptorValue, BoolRxnDescriptorValue
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsChemicalClass('org', 'Organic')
+@createsChemicalClass('inorg', 'inorganic')
+@createsCompound('VOx', 14130, 'inorg', 'Narnia')
+@createsCompound('EtOH', 682, 'org', 'Narnia')
+@createsCompound('dmed', 67600, 'org', 'Narnia')
+@createsCompound('Water', 937, 'inorg', 'Narnia')
+@createsCompoundRole('Org', 'Organic')
+@createsCompoundRole('Inorg', 'Inorganic')
+@createsCompoundRole('Water', 'Water')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsPerformedReaction('Narnia', 'Aslan', 'R03')
+@createsPerformedReaction('Narnia', 'Aslan', 'R04')
+@createsPerformedReaction('Narnia', 'Aslan', 'R05')
+@createsCompoundQuantity('R01', 'VOx', 'Inorg', '0.13')
+@createsCompoundQuantity('R01', 'EtOH', 'Org', '0.71')
+@createsCompoundQuantity('R01', 'Water', 'Water', '0.5')
+@createsCompoundQuantity('R02', 'EtOH', 'Org', '0.31')
+@createsCompoundQuantity('R02', 'dmed', 'Org', '0.3')
+@createsCompoundQuantity('R02', 'VOx', 'Inorg', '0.2')
+@createsCompoundQuantity('R03', 'EtOH', 'Org', '0.1')
+@createsCompoundQuantity('R03', 'EtOH', 'Org', '0.2')
+@createsCompoundQuantity('R04', 'dmed', 'Org', None)
+@createsCompoundQuantity('R04', 'Water', 'Water', '0.34')
+class BulkCalculation(DRPTestCase):
+    """Check that the bulk calculation gives the same values as calculating one reaction at a time."""
+
+    deleteDescriptors = False
+
+    def setUp(self):
+        """Calculate the molecular descriptors which are aggregated over."""
+        drp_rdkit.calculate_many(Compound.objects.all())
+        drp_rdkit.descriptorDict.initialised = False
+
+    def values(self, reactions):
+        """Return a Counter of (reaction, heading, value) for the reaction descriptor values of the reactions."""
+        return Counter(chain(
+            NumRxnDescriptorValue.objects.filter(reaction__in=reactions).values_list(
+                'reaction_id', 'descriptor__heading', 'value'),
+            BoolRxnDescriptorValue.objects.filter(reaction__in=reactions).values_list(
+                'reaction_id', 'descriptor__heading', 'value')))
+
+    def assertMatchesPerReaction(self, whitelist=None):
+        """Calculate descriptors both ways and compare the values."""
+        reactions = PerformedReaction.objects.all()
+        drp._calculateManyPerReaction(reactions, whitelist=whitelist)
+        expected = self.values(reactions)
+        self.assertTrue(len(expected) > 0)
+        drp.calculate_many(reactions, whitelist=whitelist)
+        self.assertEqual(self.values(reactions), expected)
+
+    def test_all(self):
+        """Test that all descriptors are identical."""
+        self.assertMatchesPerReaction()
+
+    def test_whitelist(self):
+        """Test that a whitelist of descriptors is identical."""
+        self.assertMatchesPerReaction(whitelist=[
+            'boolean_crystallisation_outcome', 'C_mols', 'V_mols',
+            'Org_amount_count', 'Org_amount_molarity', 'Water_amount_molarity'])
+
+    def test_chunked(self):
+        """Test that splitting the reactions into chunks does not change the values."""
+        chunk_size = drp.calculate_chunk_size
+        drp.calculate_chunk_size = 2
+        try:
+            self.assertMatchesPerReaction()
+        finally:
+            drp.calculate_chunk_size = chunk_size
+
+
+suite = unittest.TestSuite([
+    loadTests(BulkCalculation)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Tests for the hierarchical clustering of reactions."""
+
+import unittest
+import tempfile
+import shutil
+import os
+import json
+import numpy as np
+from .drpTestCase import DRPTestCase, runTests
+from DRP.recommendation.reactionMetric import ReactionMetric
+from DRP.recommendation.neighbourIndex import ReactionNeighbourIndex
+from DRP.vis.hierarchy import ReactionHierarchy, linkage, METHODS
+from scipy.cluster import hierarchy
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+def averageLinkage(points):
+    """Return the heights of the merges of average linkage, merging the closest pair of clusters in turn."""
+    clusters = [[i] for i in range(len(points))]
+    distances = np.sqrt(((points[:, np.newaxis] - points[np.newaxis, :]) ** 2).sum(axis=2))
+    heights = []
+    while len(clusters) > 1:
+        best = None
+        for a in range(len(clusters)):
+            for b in range(a + 1, len(clusters)):
+                distance = distances[np.ix_(clusters[a], clusters[b])].mean()
+                if best is None or distance < best[0]:
+                    best = (distance, a, b)
+        distance, a, b = best
+        heights.append(distance)
+        clusters[a] = clusters[a] + clusters.pop(b)
+    return heights
+
+
+def walk(node):
+    """Return every node of a tree of dictionaries."""
+    nodes = [node]
+    for child in node['children']:
+        nodes.extend(walk(child))
+    return nodes
+
+
+class Hierarchy(DRPTestCase):
+    """Check the clustering, the tree it gives and reactions inserted afterwards."""
+
+    def setUp(self):
+        """Cluster some random points."""
+        rng = np.random.RandomState(0)
+        self.points = rng.normal(size=(40, 3))
+        self.pks = np.arange(500, 540)
+        self.hierarchy = ReactionHierarchy(self.pks[:30], self.points[:30], rebuildFraction=0.2)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the saved hierarchy."""
+        shutil.rmtree(self.directory)
+
+    def assertWellFormed(self, tree, pks):
+        """Assert that a tree holds each pk once, that clusters split into their children, and that merges rise towards the root."""
+        self.assertEqual(sorted(tree['idsInCluster']), sorted(pks))
+        for node in walk(tree):
+            self.assertIn(node['id'], node['idsInCluster'])
+            if node['children']:
+                left, right = node['children']
+                self.assertEqual(node['idsInCluster'], left['idsInCluster'] + right['idsInCluster'])
+            else:
+                self.assertEqual(node['idsInCluster'], [node['id']])
+        internal = np.flatnonzero(self.hierarchy.left >= 0)
+        for node in internal:
+            for child in (self.hierarchy.left[node], self.hierarchy.right[node]):
+                self.assertLessEqual(self.hierarchy.heights[child], self.hierarchy.heights[node])
+
+    def test_cluster(self):
+        """The merges are those of average linkage done a pair at a time."""
+        heights = np.sort(self.hierarchy.heights[self.hierarchy.left >= 0])
+        np.testing.assert_allclose(heights, averageLinkage(self.points[:30]))
+        self.assertWellFormed(self.hierarchy.tree(), self.pks[:30].tolist())
+
+    def test_linkage(self):
+        """Each method gives the same merges as scipy's linkage."""
+        for method in METHODS:
+            merges = linkage(self.points, method)
+            expected = hierarchy.linkage(self.points, method=method)
+            np.testing.assert_allclose(merges[:, 2:], expected[:, 2:])
+            np.testing.assert_allclose(hierarchy.cophenet(merges), hierarchy.cophenet(expected))
+
+    def test_depth(self):
+        """Clusters below the depth given have no children."""
+        tree = self.hierarchy.tree(maxDepth=2)
+        for child in tree['children']:
+            for grandchild in child['children']:
+                self.assertEqual(grandchild['children'], [])
+        self.assertEqual(sorted(tree['idsInCluster']), self.pks[:30].tolist())
+
+    def test_insert(self):
+        """Inserted reactions join their nearest reaction's cluster, and enough of them cause clustering afresh."""
+        near = self.points[3] + 1e-3
+        self.hierarchy.addPoints(self.pks[30:35], np.vstack((self.points[30:34], near)))
+        self.assertEqual(self.hierarchy.builtSize, 30)
+        self.assertWellFormed(self.hierarchy.tree(), self.pks[:35].tolist())
+        parent = self.hierarchy.parent[self.hierarchy.leafNodes[34]]
+        self.assertEqual(self.hierarchy.left[parent], self.hierarchy.leafNodes[3])
+        self.hierarchy.addPoints(self.pks[30:], self.points[30:])
+        self.assertEqual(self.hierarchy.builtSize, 40)
+        self.assertWellFormed(self.hierarchy.tree(), self.pks.tolist())
+
+    def test_update(self):
+        """A hierarchy is brought up to date with a neighbour index, and clustered afresh if its points have changed."""
+        metric = ReactionMetric.fit(self.points, ['x', 'y', 'z'], standardise=False)
+        index = ReactionNeighbourIndex(metric, self.pks[:34], self.points[:34])
+        self.hierarchy.update(index)
+        self.assertEqual(len(self.hierarchy), 34)
+        self.assertEqual(self.hierarchy.builtSize, 30)
+        index.addPoints(self.pks[:1], self.points[:1] + 1)
+        self.hierarchy.update(index)
+        self.assertEqual(self.hierarchy.builtSize, 34)
+        self.assertWellFormed(self.hierarchy.tree(), self.pks[:34].tolist())
+
+    def test_save(self):
+        """A saved hierarchy gives the same tree when loaded, and its json is that tree."""
+        self.hierarchy.addPoints(self.pks[30:32], self.points[30:32])
+        path = os.path.join(self.directory, 'hierarchy.npz')
+        self.hierarchy.save(path)
+        loaded = ReactionHierarchy.load(path)
+        self.assertEqual(loaded.builtSize, 30)
+        self.assertEqual(loaded.tree(), self.hierarchy.tree())
+        jsonPath = os.path.join(self.directory, 'hierarchy.json')
+        loaded.writeJson(jsonPath)
+        with open(jsonPath) as f:
+            self.assertEqual(json.load(f), self.hierarchy.tree())
+
+    def test_empty(self):
+        """A hierarchy of no reactions has no tree, and is clustered once reactions arrive."""
+        metric = ReactionMetric.fit(self.points, ['x', 'y', 'z'], standardise=False)
+        empty = ReactionHierarchy.fromIndex(ReactionNeighbourIndex(metric))
+        self.assertEqual(len(empty), 0)
+        self.assertIsNone(empty.tree())
+        empty.addPoints([], [])
+        path = os.path.join(self.directory, 'empty.npz')
+        empty.save(path)
+        self.hierarchy = ReactionHierarchy.load(path)
+        self.hierarchy.update(ReactionNeighbourIndex(metric, self.pks[:5], self.points[:5]))
+        self.assertWellFormed(self.hierarchy.tree(), self.pks[:5].tolist())
+
+
+suite = unittest.TestSuite([
+    loadTests(Hierarchy),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
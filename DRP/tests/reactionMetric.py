@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Tests for the array-based reaction distance metric."""
+
+import unittest
+import math
+import numpy as np
+from .drpTestCase import DRPTestCase, runTests
+from DRP.recommendation.reactionMetric import ReactionMetric
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class Distances(DRPTestCase):
+    """Check distances against a row at a time calculation."""
+
+    def setUp(self):
+        """Fit a metric to a matrix with numeric, boolean and categorical columns."""
+        self.matrix = np.array([
+            [1.0, 10.0, 1, 0],
+            [2.0, np.nan, 0, 2],
+            [4.0, 30.0, 1, 1],
+            [5.0, 20.0, 0, 1],
+        ])
+        self.headers = ['n1', 'n2', 'b', 'c']
+        self.metric = ReactionMetric.fit(self.matrix, self.headers, kinds={'b': 'bool', 'c': 'cat', 'n1': 'num'})
+
+    def rowDistance(self, x, y):
+        """Return the distance of two rows as metrics.Euclidean would, with missing values at the mean."""
+        total = 0.0
+        for j, header in enumerate(self.headers[:2]):
+            column = self.matrix[:, j][~np.isnan(self.matrix[:, j])]
+            mean, std = column.mean(), column.std()
+            xj = mean if np.isnan(x[j]) else x[j]
+            yj = mean if np.isnan(y[j]) else y[j]
+            total += ((xj - yj) / std) ** 2
+        total += (x[2] != y[2]) + (x[3] != y[3])
+        return math.sqrt(total)
+
+    def test_pairwise(self):
+        """Pairwise distances match those of each pair of rows."""
+        distances = self.metric.pairwise(self.matrix)
+        for i, x in enumerate(self.matrix):
+            for j, y in enumerate(self.matrix):
+                self.assertAlmostEqual(distances[i, j], self.rowDistance(x, y))
+
+    def test_query(self):
+        """Query distances match the pairwise distances."""
+        np.testing.assert_allclose(self.metric.distances(self.matrix[1], self.matrix),
+                                   self.metric.pairwise(self.matrix)[1], atol=1e-7)
+
+    def test_transform(self):
+        """A transform is applied to the embedded rows."""
+        embedded = self.metric.embed(self.matrix)
+        scaled = ReactionMetric.fit(self.matrix, self.headers, kinds={'b': 'bool', 'c': 'cat'},
+                                    transform=2 * np.eye(embedded.shape[1]))
+        np.testing.assert_allclose(scaled.pairwise(self.matrix), 2 * self.metric.pairwise(self.matrix), atol=1e-7)
+
+
+class Diversify(DRPTestCase):
+    """Check the diversity ordering against the old reweighting."""
+
+    def test_diversify(self):
+        """Rows are chosen as by repeatedly reweighting a list."""
+        rng = np.random.RandomState(0)
+        matrix = rng.normal(size=(40, 3))
+        scores = rng.uniform(size=40)
+        metric = ReactionMetric.fit(matrix, ['x', 'y', 'z'])
+        points = metric.embed(matrix)
+
+        remaining = [(score, i) for i, score in enumerate(scores)]
+        expected = []
+        while remaining:
+            remaining.sort(key=lambda rec: -rec[0])
+            score, i = remaining.pop(0)
+            expected.append(i)
+            remaining = [(s * (1.0 / (1.0 + math.exp(-np.sqrt(((points[i] - points[j]) ** 2).sum())))), j)
+                         for s, j in remaining]
+
+        chosen, chosenScores = metric.diversify(scores, matrix)
+        self.assertEqual(chosen.tolist(), expected)
+        self.assertEqual(chosen[0], np.argmax(scores))
+        self.assertEqual(metric.diversify(scores, matrix, count=5)[0].tolist(), expected[:5])
+
+
+suite = unittest.TestSuite([
+    loadTests(Distances),
+    loadTests(Diversify),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Tests for the scikit-learn model visitors, which need no JVM and so are run with the rest of the suite."""
+
+import unittest
+import numpy as np
+from .decorators import createsPerformedReactionSetOrd, createsPerformedReactionSetBool
+from .drpTestCase import DRPTestCase, runTests
+from .modelBuildingTests import ModelTest
+from DRP.ml_models.model_visitors.sklearn.visitors import NaiveBayes
+from sklearn.naive_bayes import GaussianNB
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsPerformedReactionSetOrd
+class SklearnSVMKFTest(ModelTest):
+    """Tests scikit-learn SVM."""
+
+    modelLibrary = "sklearn"
+    modelTool = "SVM_PUK"
+    splitter = "KFoldSplitter"
+
+
+@createsPerformedReactionSetOrd
+class SklearnJ48KFTest(ModelTest):
+    """Tests scikit-learn decision tree."""
+
+    modelLibrary = "sklearn"
+    modelTool = "J48"
+    splitter = "KFoldSplitter"
+
+
+@createsPerformedReactionSetBool
+class SklearnKNNKFTest(ModelTest):
+    """Tests scikit-learn KNN."""
+
+    modelLibrary = "sklearn"
+    modelTool = "KNN"
+    splitter = "KFoldSplitter"
+
+
+@createsPerformedReactionSetOrd
+class SklearnNBKFTest(ModelTest):
+    """Tests scikit-learn naive Bayes."""
+
+    modelLibrary = "sklearn"
+    modelTool = "NaiveBayes"
+    splitter = "KFoldSplitter"
+
+
+@createsPerformedReactionSetOrd
+class SklearnSVMKFParallelTest(ModelTest):
+    """Tests scikit-learn SVM, training the folds in parallel."""
+
+    modelLibrary = "sklearn"
+    modelTool = "SVM_PUK"
+    splitter = "KFoldSplitter"
+    workers = 2
+
+
+@createsPerformedReactionSetOrd
+class SklearnNBBCRKFTest(ModelTest):
+    """Tests scikit-learn naive Bayes optimising on BCR."""
+
+    modelLibrary = "sklearn"
+    modelTool = "NaiveBayes"
+    splitter = "KFoldSplitter"
+    visitorOptions = {'BCR': True}
+
+
+@createsPerformedReactionSetBool
+class SklearnRFKFTest(ModelTest):
+    """Tests scikit-learn random forest."""
+
+    modelLibrary = "sklearn"
+    modelTool = "RandomForest"
+    splitter = "KFoldSplitter"
+
+
+@createsPerformedReactionSetBool
+class SklearnRFBCRKFTest(ModelTest):
+    """Tests scikit-learn random forest optimising on BCR."""
+
+    modelLibrary = "sklearn"
+    modelTool = "RandomForest"
+    splitter = "KFoldSplitter"
+    visitorOptions = {'BCR': True}
+
+
+class NaiveBayesBCR(DRPTestCase):
+    """Check that naive Bayes optimising on BCR is fitted as with inverse class frequency weights."""
+
+    def runTest(self):
+        """Fitting with equal class priors gives the means and variances of a plain fit."""
+        rng = np.random.RandomState(0)
+        data = rng.normal(size=(30, 2))
+        labels = np.array([0] * 24 + [1] * 6, dtype=np.float64)
+        visitor = NaiveBayes(statsModel=None, BCR=True)
+        estimator = visitor.estimator()
+        visitor._fit(estimator, data, labels)
+        plain = GaussianNB().fit(data, labels)
+        np.testing.assert_allclose(estimator.class_prior_, [0.5, 0.5])
+        np.testing.assert_allclose(estimator.theta_, plain.theta_)
+        np.testing.assert_allclose(estimator.sigma_ if hasattr(estimator, 'sigma_') else estimator.var_,
+                                   plain.sigma_ if hasattr(plain, 'sigma_') else plain.var_)
+
+
+suite = unittest.TestSuite([
+    loadTests(SklearnSVMKFTest),
+    loadTests(SklearnJ48KFTest),
+    loadTests(SklearnKNNKFTest),
+    loadTests(SklearnNBKFTest),
+    loadTests(SklearnNBBCRKFTest),
+    loadTests(SklearnSVMKFParallelTest),
+    loadTests(SklearnRFKFTest),
+    loadTests(SklearnRFBCRKFTest),
+    loadTests(NaiveBayesBCR),
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Tests for the seeded, stratified k-fold splitter."""
+
+import unittest
+import numpy as np
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction, deletesDataSets
+from .decorators import createsOrdRxnDescriptor, createsOrdRxnDescriptorValue
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, FoldIndex, OrdRxnDescriptorValue
+from DRP.ml_models.splitters.stratifiedKFoldSplitter import Splitter, assignFolds
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+class AssignFolds(unittest.TestCase):
+    """Check the assignment of items to folds."""
+
+    def test_stratified(self):
+        """Each fold gets the same number of items of each stratum."""
+        strata = np.repeat([0, 1, 2], [6, 9, 3])
+        folds = assignFolds(strata, 3, 42)
+        for stratum in range(3):
+            counts = np.bincount(folds[strata == stratum], minlength=3)
+            self.assertEqual(counts.max() - counts.min(), 0)
+
+    def test_seeded(self):
+        """The same seed gives the same folds, and another seed different ones."""
+        strata = np.zeros(100, dtype=int)
+        np.testing.assert_array_equal(assignFolds(strata, 4, 1), assignFolds(strata, 4, 1))
+        self.assertFalse(np.array_equal(assignFolds(strata, 4, 1), assignFolds(strata, 4, 2)))
+
+
+@deletesDataSets
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsPerformedReaction('Narnia', 'Aslan', 'R03')
+@createsPerformedReaction('Narnia', 'Aslan', 'R04')
+@createsOrdRxnDescriptor('outcome', 1, 4)
+@createsOrdRxnDescriptorValue('Narnia', 'r01', 'outcome', 1)
+@createsOrdRxnDescriptorValue('Narnia', 'r02', 'outcome', 1)
+@createsOrdRxnDescriptorValue('Narnia', 'r03', 'outcome', 4)
+@createsOrdRxnDescriptorValue('Narnia', 'r04', 'outcome', 4)
+class Split(DRPTestCase):
+    """Check that splits are stratified and reused."""
+
+    def tearDown(self):
+        """Remove the fold indices."""
+        FoldIndex.objects.all().delete()
+
+    def test_split(self):
+        """Each test set has one reaction of each outcome, and a second split reuses the first's datasets."""
+        reactions = PerformedReaction.objects.all()
+        splits = Splitter('first', num_folds=2, seed=3, response='outcome').split(reactions)
+        for train, test in splits:
+            outcomes = sorted(test.reactions.values_list('ordrxndescriptorvalue__value', flat=True))
+            self.assertEqual(outcomes, [1, 4])
+        self.assertEqual(Splitter('second', num_folds=2, seed=3, response='outcome').split(reactions), splits)
+        self.assertEqual(FoldIndex.objects.count(), 1)
+
+    def test_changedResponse(self):
+        """Changing the values of the response makes a new split."""
+        reactions = PerformedReaction.objects.all()
+        Splitter('first', num_folds=2, seed=3, response='outcome').split(reactions)
+        OrdRxnDescriptorValue.objects.filter(reaction__performedreaction__reference='r02').update(value=4)
+        Splitter('second', num_folds=2, seed=3, response='outcome').split(reactions)
+        self.assertEqual(FoldIndex.objects.count(), 2)
+
+    def test_deletedDataSet(self):
+        """A split whose datasets were deleted is made again."""
+        reactions = PerformedReaction.objects.all()
+        splits = Splitter('first', num_folds=2, seed=3, response='outcome').split(reactions)
+        splits[0][1].delete()
+        newSplits = Splitter('second', num_folds=2, seed=3, response='outcome').split(reactions)
+        self.assertNotEqual(newSplits, splits)
+        self.assertEqual(FoldIndex.objects.count(), 1)
+
+
+suite = unittest.TestSuite([
+    loadTests(AssignFolds),
+    loadTests(Split)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Tests for the content-addressed cache of training datasets."""
+
+import unittest
+import tempfile
+import shutil
+import os
+from .decorators import createsUser, joinsLabGroup, createsPerformedReaction
+from .decorators import createsOrdRxnDescriptor, createsOrdRxnDescriptorValue
+from .drpTestCase import DRPTestCase, runTests
+from DRP.models import PerformedReaction, OrdRxnDescriptorValue
+from DRP.models.trainingDatasetCache import TrainingDatasetCache
+from DRP.models.descriptorValueVersions import versions
+
+loadTests = unittest.TestLoader().loadTestsFromTestCase
+
+
+@createsUser('Aslan', 'old_magic')
+@joinsLabGroup('Aslan', 'Narnia')
+@createsPerformedReaction('Narnia', 'Aslan', 'R01')
+@createsPerformedReaction('Narnia', 'Aslan', 'R02')
+@createsOrdRxnDescriptor('outcome', 1, 4)
+@createsOrdRxnDescriptorValue('Narnia', 'r01', 'outcome', 3)
+class Cache(DRPTestCase):
+    """Check that datasets are shared while their inputs are unchanged."""
+
+    def setUp(self):
+        """Use a cache in a fresh directory."""
+        self.directory = tempfile.mkdtemp()
+        self.cache = TrainingDatasetCache(self.directory)
+
+    def tearDown(self):
+        """Remove the cache directory."""
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        """The same reactions and descriptors give the same file, whatever the header order."""
+        reactions = PerformedReaction.objects.all()
+        dataset, path = self.cache.get(reactions, ['outcome'])
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(self.cache.get(reactions.order_by('-pk'), ['outcome', 'outcome'])[1], path)
+        self.assertNotEqual(self.cache.get(reactions.filter(reference='r01'), ['outcome'])[1], path)
+
+    def test_changedValue(self):
+        """Changing a value gives a new dataset holding the new value."""
+        reactions = PerformedReaction.objects.all()
+        path = self.cache.get(reactions, ['outcome'])[1]
+        value = OrdRxnDescriptorValue.objects.get(reaction__performedreaction__reference='r01')
+        value.value = 2
+        value.save()
+        dataset, newPath = self.cache.get(reactions, ['outcome'])
+        self.assertNotEqual(newPath, path)
+        self.assertIn(2, dataset.columns['outcome'].values.tolist())
+
+    def test_superseded(self):
+        """A dataset superseded after a value changes is deleted, and those of other reactions are left alone."""
+        reactions = PerformedReaction.objects.all()
+        path = self.cache.get(reactions, ['outcome'])[1]
+        otherPath = self.cache.get(reactions.filter(reference='r01'), ['outcome'])[1]
+        value = OrdRxnDescriptorValue.objects.get(reaction__performedreaction__reference='r01')
+        value.value = 2
+        value.save()
+        newPath = self.cache.get(reactions, ['outcome'])[1]
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(newPath))
+        self.assertTrue(os.path.exists(otherPath))
+
+    def test_versionStored(self):
+        """The version of a descriptor's values is kept in the database until a value is written."""
+        value = OrdRxnDescriptorValue.objects.get(reaction__performedreaction__reference='r01')
+        version = versions([value.descriptor_id])[value.descriptor_id]
+        self.assertEqual(versions([value.descriptor_id])[value.descriptor_id], version)
+        self.assertEqual(value.descriptor.valueVersion.version, version)
+        OrdRxnDescriptorValue.objects.filter(pk=value.pk).update(value=2)
+        self.assertNotEqual(versions([value.descriptor_id])[value.descriptor_id], version)
+
+
+suite = unittest.TestSuite([
+    loadTests(Cache)
+])
+
+if __name__ == '__main__':
+    runTests(suite)
@@ -59,5 +59,8 @@ urls = [
     url('^/compoundguide/delete$',
         DRP.views.compound.deleteCompound, name='deleteCompound'),
     url('^/compoundguide/edit_(?P<pk>\d+).html',
-        DRP.views.compound.EditCompound.as_view(), name='editCompound')
+        DRP.views.compound.EditCompound.as_view(), name='editCompound'),
+    url('^/model_jobs.json$', DRP.views.modelBuildJobs.jobList, name='modelBuildJobs'),
+    url('^/model_jobs/(?P<job_id>\d+).json$',
+        DRP.views.modelBuildJobs.jobProgress, name='modelBuildJobProgress')
 ]
@@ -1,5 +1,26 @@
 """Miscellaneous utility functions for use in DRP."""
+from contextlib import contextmanager
 from math import sqrt
+import uuid
+import os
+
+
+@contextmanager
+def atomicWrite(path, mode='wb'):
+    """
+    Open a file to be written in place of path, yielding the file object.
+
+    The file is written under a temporary name and replaces path only once it is complete,
+    so no reader ever sees a partial file. If writing fails, path is left as it was.
+    """
+    tmpPath = '{}.{}.tmp'.format(path, uuid.uuid4())
+    try:
+        with open(tmpPath, mode) as f:
+            yield f
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
 
 
 def average_normalized_conf(confs):
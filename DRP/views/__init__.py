@@ -10,3 +10,4 @@ from . import decorators
 from .import reaction
 from .leaveGroupView import leaveGroup
 from .api import api1
+from . import modelBuildJobs
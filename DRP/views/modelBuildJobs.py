@@ -0,0 +1,26 @@
+"""
+Views reporting the progress of model build jobs.
+
+The tracebacks of failed builds are only shown to staff.
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, Http404
+from DRP.models import ModelBuildJob
+
+
+@login_required
+def jobList(request):
+    """Return the progress of the unfinished build jobs (or those with the statuses in the GET parameter status) as json."""
+    statuses = request.GET.getlist('status') or [ModelBuildJob.QUEUED, ModelBuildJob.RUNNING]
+    jobs = ModelBuildJob.objects.filter(status__in=statuses).order_by('pk')
+    return JsonResponse({'jobs': [job.progress(showError=request.user.is_staff) for job in jobs]})
+
+
+@login_required
+def jobProgress(request, job_id):
+    """Return the progress of a build job as json."""
+    try:
+        job = ModelBuildJob.objects.get(pk=job_id)
+    except ModelBuildJob.DoesNotExist:
+        raise Http404("This build job cannot be found")
+    return JsonResponse(job.progress(showError=request.user.is_staff))
@@ -14,7 +14,9 @@ from DRP.forms import compoundQuantityFormFactory
 from django.forms.formsets import TOTAL_FORM_COUNT
 from django.shortcuts import render
 from .helpers import redirect
-from django.http import HttpResponse, Http404, HttpResponseForbidden
+from django.http import HttpResponse, StreamingHttpResponse, Http404, HttpResponseForbidden
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from django.views.decorators.http import require_POST
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
@@ -62,23 +64,26 @@ class ListPerformedReactions(ListView):
                 self.template_name = 'reactions_divs.html'
             response = super(ListPerformedReactions, self).dispatch(
                 request, *args, **kwargs)
-        elif filetype == '.csv':
+        elif filetype in ('.csv', '.arff'):
             self.paginate_by = None
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename="reactions.csv"'
-            if 'expanded' in request.GET and request.user.is_authenticated() and request.user.is_staff:
-                self.queryset.toCsv(response, True)
+            expanded = 'expanded' in request.GET and request.user.is_authenticated() and request.user.is_staff
+            # Stream the export in chunks of rows rather than building the whole
+            # file in memory before the first byte is sent.
+            if filetype == '.csv':
+                content = self.queryset.iterCsv(expanded)
+                contentType = 'text/csv'
             else:
-                self.queryset.toCsv(response)
-        elif filetype == '.arff':
-            self.paginate_by = None
-            response = HttpResponse(content_type='text/vnd.weka.arff')
-            response[
-                'Content-Disposition'] = 'attachment; filename="reactions.arff"'
-            if 'expanded' in request.GET and request.user.is_authenticated() and request.user.is_staff:
-                self.queryset.toArff(response, True)
-            else:
-                self.queryset.toArff(response)
+                content = self.queryset.iterArff(expanded)
+                contentType = 'text/vnd.weka.arff'
+            gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+            if gzipped:
+                content = compress_sequence(
+                    chunk.encode() if isinstance(chunk, str) else chunk for chunk in content)
+            response = StreamingHttpResponse(content, content_type=contentType)
+            response['Content-Disposition'] = 'attachment; filename="reactions{}"'.format(filetype)
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+            patch_vary_headers(response, ('Accept-Encoding',))
         return response
 
     def get_context_data(self, **kwargs):
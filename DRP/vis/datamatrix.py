@@ -33,6 +33,16 @@ class dataMatrix:
         self.num_cols = len(self.dataset[0])
         self.convertYesNotoOneZero()
 
+    # Build a data-matrix straight from a reaction queryset's descriptor values, without
+    # creating model instances. As with the explore view, the reaction id is the last column,
+    # and missing values are 0 (what convertYesNotoOneZero makes of "?").
+    @classmethod
+    def fromReactions(cls, reactions, headers):
+        matrix, headers, pks = reactions.toDescriptorMatrix(
+            whitelistHeaders=headers, missing=0)
+        rows = np.column_stack((matrix, pks)).tolist()
+        return cls([list(headers) + ["id"]] + rows)
+
     # Remove non-numeric columns
     def removeStringCols(self):
         counter = 0
@@ -0,0 +1,365 @@
+"""
+Agglomerative clustering of reactions for the explore visualisation.
+
+vis.clustering.createHierCluster and createHierClusterBetter merged clusters by building a
+kd-tree of the representatives of every remaining cluster for each merge, then scanning lists
+for the nodes found. That takes at least cubic time in the number of reactions. Here the
+reactions' points are embedded by a ReactionMetric, usually the same points as a
+ReactionNeighbourIndex, and clustered by linkage() here. scipy's own linkage (as of 0.13)
+searches the whole distance matrix for every merge, which takes cubic time. linkage() instead
+merges along a nearest-neighbour chain, which is valid for every method allowed except single
+linkage, and takes quadratic time and memory. Single linkage is read off a minimum spanning tree
+built by Prim's algorithm, which takes quadratic time and linear memory.
+
+Newly performed reactions are inserted into the tree without clustering again. Each one is
+joined to the largest cluster that contains its nearest reaction and was merged at no more than
+their distance apart. Reactions already in the tree are not moved, so the tree drifts from the
+one a fresh clustering would give. It is clustered afresh once more than rebuildFraction of the
+reactions have been inserted since the last clustering.
+
+tree() returns the nested dictionaries that vis.clustering.writeHClusterJson wrote for a
+clusterNode. Each node has the id of its representative reaction, the ids of the reactions in
+it, and its children.
+"""
+from django.conf import settings
+from DRP.utils import atomicWrite
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+import numpy as np
+import json
+import os
+
+METHODS = ('single', 'complete', 'average', 'weighted', 'ward')
+
+
+def defaultPath():
+    """Return the path of the shared hierarchy file."""
+    return getattr(settings, 'REACTION_HIERARCHY_FILE', os.path.join(settings.MODEL_DIR, 'reaction_hierarchy.npz'))
+
+
+def _pointRows(points, count):
+    """Return points as a float matrix with count rows, which has no columns if there are no points."""
+    points = np.asarray(points, dtype=np.float64)
+    if not count:
+        return points.reshape(0, points.shape[-1] if points.ndim > 1 else 0)
+    return points.reshape(count, -1)
+
+
+def _label(merges, n):
+    """
+    Turn merges of rows into a linkage matrix in the format of scipy's linkage.
+
+    merges is a list of (row, row, distance) tuples, each naming any reaction in either
+    cluster. Merges are sorted by distance, and merge r of the result makes cluster n + r.
+    """
+    order = sorted(range(len(merges)), key=lambda r: merges[r][2])
+    # a union-find forest over the rows, whose roots know the cluster they belong to.
+    parents = np.arange(n)
+    clusters = np.arange(n)
+    sizes = np.ones(2 * n - 1, dtype=np.intp)
+    result = np.zeros((len(merges), 4))
+
+    def find(row):
+        while parents[row] != row:
+            parents[row] = parents[parents[row]]
+            row = parents[row]
+        return row
+
+    for r, i in enumerate(order):
+        a, b, distance = merges[i]
+        a, b = find(a), find(b)
+        first, second = sorted((clusters[a], clusters[b]))
+        sizes[n + r] = sizes[first] + sizes[second]
+        result[r] = (first, second, distance, sizes[n + r])
+        parents[a] = b
+        clusters[b] = n + r
+    return result
+
+
+def _spanningTreeLinkage(points):
+    """Return the single linkage of the rows of points, from a minimum spanning tree."""
+    n = len(points)
+    inTree = np.zeros(n, dtype=bool)
+    best = np.full(n, np.inf)
+    nearest = np.zeros(n, dtype=np.intp)
+    merges = []
+    row = 0
+    for step in range(n - 1):
+        inTree[row] = True
+        distances = np.sqrt(((points - points[row]) ** 2).sum(axis=1))
+        closer = distances < best
+        best[closer] = distances[closer]
+        nearest[closer] = row
+        best[inTree] = np.inf
+        row = np.argmin(best)
+        merges.append((nearest[row], row, best[row]))
+    return _label(merges, n)
+
+
+def _chainLinkage(points, method):
+    """Return the linkage of the rows of points for a reducible method, merging along a nearest-neighbour chain."""
+    n = len(points)
+    distances = cdist(points, points)
+    np.fill_diagonal(distances, np.inf)
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    merges = []
+    chain = []
+    for step in range(n - 1):
+        if not chain:
+            chain.append(np.argmax(active))
+        while True:
+            x = chain[-1]
+            y = np.argmin(distances[x])
+            # prefer the previous cluster on a tie, or the chain could cycle.
+            if len(chain) > 1 and distances[x, chain[-2]] <= distances[x, y]:
+                y = chain[-2]
+                break
+            chain.append(y)
+        chain.pop()
+        chain.pop()
+        distance = distances[x, y]
+        merges.append((x, y, distance))
+        # the merged cluster takes y's place, and x's is removed.
+        nx, ny = sizes[x], sizes[y]
+        if method == 'average':
+            merged = (nx * distances[x] + ny * distances[y]) / (nx + ny)
+        elif method == 'weighted':
+            merged = (distances[x] + distances[y]) / 2
+        elif method == 'complete':
+            merged = np.maximum(distances[x], distances[y])
+        else:
+            merged = np.sqrt(((sizes + nx) * distances[x] ** 2 + (sizes + ny) * distances[y] ** 2 -
+                              sizes * distance ** 2) / (sizes + nx + ny))
+        active[x] = False
+        merged[~active] = np.inf
+        merged[y] = np.inf
+        distances[y] = distances[:, y] = merged
+        distances[x] = distances[:, x] = np.inf
+        sizes[y] = nx + ny
+    return _label(merges, n)
+
+
+def linkage(points, method='average'):
+    """
+    Return the hierarchical clustering of the rows of points, as a linkage matrix in scipy's format.
+
+    Distances between points are euclidean, and method is one of METHODS, with the meaning it
+    has in scipy.cluster.hierarchy.linkage.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if method == 'single':
+        return _spanningTreeLinkage(points)
+    return _chainLinkage(points, method)
+
+
+class ReactionHierarchy(object):
+    """A binary tree of clusters of reactions, merged in order of their distance apart."""
+
+    def __init__(self, pks, points, method='average', rebuildFraction=0.1, nodes=None, builtSize=None):
+        """
+        Cluster the embedded points of the reactions with the given pks.
+
+        method is the linkage method and must be one of METHODS. nodes restores a saved tree
+        instead of clustering the points. It holds the arrays (left, right, heights, leaves).
+        builtSize is the number of reactions that were clustered before any were inserted.
+        """
+        if method not in METHODS:
+            raise ValueError('Unknown linkage method {}; use one of {}.'.format(method, ', '.join(METHODS)))
+        self.pks = np.asarray(pks, dtype=np.int64)
+        self.points = _pointRows(points, len(self.pks))
+        self.method = method
+        self.rebuildFraction = rebuildFraction
+        if nodes is None:
+            self.cluster()
+        else:
+            self.left, self.right, self.heights, self.leaves = (np.asarray(array) for array in nodes)
+            self.builtSize = len(self.pks) if builtSize is None else builtSize
+            self._link()
+
+    @classmethod
+    def fromIndex(cls, index, **kwargs):
+        """Return the hierarchy of the reactions in a ReactionNeighbourIndex."""
+        return cls(index.pks.copy(), index.points.copy(), **kwargs)
+
+    def cluster(self):
+        """Cluster every reaction afresh."""
+        n = len(self.pks)
+        size = max(2 * n - 1, 0)
+        self.left = np.full(size, -1, dtype=np.intp)
+        self.right = np.full(size, -1, dtype=np.intp)
+        self.heights = np.zeros(size)
+        self.leaves = np.full(size, -1, dtype=np.intp)
+        self.leaves[:n] = np.arange(n)
+        if n > 1:
+            # merge r of scipy's linkage makes node n + r from the two nodes it gives.
+            merges = linkage(self.points, method=self.method)
+            self.left[n:] = merges[:, 0]
+            self.right[n:] = merges[:, 1]
+            self.heights[n:] = merges[:, 2]
+        self.builtSize = n
+        self._link()
+
+    def _link(self):
+        """Find the parent of each node, the root, and the node of each reaction."""
+        self.parent = np.full(len(self.left), -1, dtype=np.intp)
+        internal = np.flatnonzero(self.left >= 0)
+        self.parent[self.left[internal]] = internal
+        self.parent[self.right[internal]] = internal
+        roots = np.flatnonzero(self.parent < 0)
+        self.root = roots[0] if len(roots) else -1
+        leafNodes = np.flatnonzero(self.leaves >= 0)
+        self.leafNodes = np.empty(len(self.pks), dtype=np.intp)
+        self.leafNodes[self.leaves[leafNodes]] = leafNodes
+
+    def __len__(self):
+        """Return the number of reactions in the hierarchy."""
+        return len(self.pks)
+
+    def _grow(self, count):
+        """Make room for count more nodes, returning the first of them."""
+        first = len(self.left)
+        self.left = np.concatenate((self.left, np.full(count, -1, dtype=np.intp)))
+        self.right = np.concatenate((self.right, np.full(count, -1, dtype=np.intp)))
+        self.heights = np.concatenate((self.heights, np.zeros(count)))
+        self.leaves = np.concatenate((self.leaves, np.full(count, -1, dtype=np.intp)))
+        self.parent = np.concatenate((self.parent, np.full(count, -1, dtype=np.intp)))
+        return first
+
+    def _insert(self, row, nearRow, distance, leaf, joined):
+        """Put the reaction in a row into the tree as a new leaf, joined at distance to its nearest reaction's cluster."""
+        self.leaves[leaf] = row
+        self.leafNodes[row] = leaf
+        node = self.leafNodes[nearRow]
+        while self.parent[node] >= 0 and self.heights[self.parent[node]] <= distance:
+            node = self.parent[node]
+        above = self.parent[node]
+        self.left[joined], self.right[joined] = node, leaf
+        self.heights[joined] = distance
+        self.parent[joined] = above
+        self.parent[node] = self.parent[leaf] = joined
+        if above < 0:
+            self.root = joined
+        elif self.left[above] == node:
+            self.left[above] = joined
+        else:
+            self.right[above] = joined
+
+    def addPoints(self, pks, points):
+        """
+        Add the embedded points of the reactions with pks to the hierarchy.
+
+        Reactions already in the hierarchy are left where they are.
+        """
+        pks = np.asarray(pks, dtype=np.int64)
+        if not len(pks):
+            return
+        points = _pointRows(points, len(pks))
+        known = set(self.pks.tolist())
+        new = np.array([pk not in known for pk in pks.tolist()], dtype=bool)
+        pks, points = pks[new], points[new]
+        if not len(pks):
+            return
+        start = len(self.pks)
+        self.pks = np.concatenate((self.pks, pks))
+        self.points = np.vstack((self.points, points)) if start else points
+        if len(self.pks) - self.builtSize > self.rebuildFraction * self.builtSize:
+            self.cluster()
+            return
+
+        # each reaction joins its nearest reaction in the tree, including those just inserted.
+        distances, nearest = cKDTree(self.points[:start]).query(points)
+        squared = (points ** 2).sum(axis=1)
+        among = np.sqrt(np.clip(squared[:, np.newaxis] + squared[np.newaxis, :] - 2 * points.dot(points.T), 0, None))
+        first = self._grow(2 * len(pks))
+        self.leafNodes = np.concatenate((self.leafNodes, np.full(len(pks), -1, dtype=np.intp)))
+        for i in range(len(pks)):
+            distance, nearRow = distances[i], nearest[i]
+            if i:
+                closest = np.argmin(among[i, :i])
+                if among[i, closest] < distance:
+                    distance, nearRow = among[i, closest], start + closest
+            self._insert(start + i, nearRow, distance, first + 2 * i, first + 2 * i + 1)
+
+    def update(self, index):
+        """
+        Bring the hierarchy up to date with a ReactionNeighbourIndex.
+
+        Reactions new to the index are inserted. If any reaction has left the index, or the
+        points of those already here have changed, everything is clustered afresh.
+        """
+        positions = index.positions()
+        rows = [positions.get(pk) for pk in self.pks.tolist()]
+        if (any(row is None for row in rows) or index.points.shape[1] != self.points.shape[1] or
+                not np.allclose(index.points[np.array(rows, dtype=np.intp)], self.points)):
+            self.pks, self.points = index.pks.copy(), index.points.copy()
+            self.cluster()
+        else:
+            self.addPoints(index.pks, index.points)
+
+    def _order(self):
+        """Return the nodes of the tree with each node before its children."""
+        order = []
+        stack = [self.root] if self.root >= 0 else []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if self.left[node] >= 0:
+                stack.extend((self.left[node], self.right[node]))
+        return order
+
+    def tree(self, maxDepth=None):
+        """
+        Return the tree as nested dictionaries in the shape of vis.clustering.clusterNode (None if empty).
+
+        Each node has the 'id' of its representative reaction, the ids of every reaction in it in
+        'idsInCluster', and its 'children'. A leaf represents its own reaction. A merged cluster
+        is represented by the representative of its larger child. Below maxDepth, if given,
+        clusters are left without children.
+        """
+        if self.root < 0:
+            return None
+        order = self._order()
+        depths = np.zeros(len(self.left), dtype=np.intp)
+        for node in order:
+            if self.left[node] >= 0:
+                depths[self.left[node]] = depths[self.right[node]] = depths[node] + 1
+        pks = self.pks.tolist()
+        nodes = {}
+        for node in reversed(order):
+            if self.left[node] < 0:
+                pk = pks[self.leaves[node]]
+                nodes[node] = {'id': pk, 'idsInCluster': [pk], 'children': []}
+            else:
+                left, right = nodes[self.left[node]], nodes[self.right[node]]
+                larger = left if len(left['idsInCluster']) >= len(right['idsInCluster']) else right
+                nodes[node] = {
+                    'id': larger['id'],
+                    'idsInCluster': left['idsInCluster'] + right['idsInCluster'],
+                    'children': [] if maxDepth is not None and depths[node] >= maxDepth else [left, right],
+                }
+        return nodes[self.root]
+
+    def writeJson(self, path, maxDepth=None):
+        """Write the tree to a json file for the visualisation."""
+        with atomicWrite(path, 'w') as f:
+            json.dump(self.tree(maxDepth=maxDepth), f, indent=2)
+
+    def save(self, path=None):
+        """Save the hierarchy to a file (by default, the shared one)."""
+        path = defaultPath() if path is None else path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with atomicWrite(path) as f:
+            np.savez(f, pks=self.pks, points=self.points, left=self.left, right=self.right, heights=self.heights,
+                     leaves=self.leaves, method=np.array(self.method), builtSize=np.array(self.builtSize))
+
+    @classmethod
+    def load(cls, path=None, **kwargs):
+        """Return the hierarchy saved in a file (by default, the shared one)."""
+        path = defaultPath() if path is None else path
+        with np.load(path) as saved:
+            nodes = (saved['left'], saved['right'], saved['heights'], saved['leaves'])
+            return cls(saved['pks'], saved['points'], method=str(saved['method']), nodes=nodes,
+                       builtSize=int(saved['builtSize']), **kwargs)